@@ -0,0 +1,438 @@
+import os
+import re
+import sys
+import json
+import gzip
+import time
+import shutil
+import hashlib
+import secrets
+import argparse
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+
+BACKUP_ROOT = os.path.join("macros", ".backups")
+LEGACY_BACKUP_DIR = os.path.join("macros", "backups")
+MANIFEST_VERSION = 1
+
+# The manifest's lock file is held for a read-modify-write only and records "<pid> <token>".
+# A lock whose process has exited is broken at once; one that cannot be read is broken once it is
+# older than LOCK_STALE seconds; a lock whose process is alive is never broken, and waiting longer
+# than LOCK_TIMEOUT for it is an error
+LOCK_TIMEOUT = 30.0
+LOCK_STALE = 60.0
+
+_CHUNK_SIZE = 1024 * 1024
+_LEGACY_NAME = re.compile(r'^(?P<name>.+)_backup_(?P<stamp>\d{8}_\d{6})(?P<ext>\.[^.]+)$')
+
+
+def _pid_alive(pid):
+    """Whether a process with this id is running; errs towards alive when it cannot tell"""
+    if pid == os.getpid():
+        return True
+    if os.name == 'nt':
+        # os.kill(pid, 0) would terminate the process on Windows; ask for its exit code instead
+        import ctypes
+        kernel32 = ctypes.WinDLL("kernel32", use_last_error=True)
+        handle = kernel32.OpenProcess(0x1000, False, pid)  # PROCESS_QUERY_LIMITED_INFORMATION
+        if not handle:
+            return ctypes.get_last_error() == 5  # ERROR_ACCESS_DENIED: it exists
+        try:
+            exit_code = ctypes.c_ulong()
+            if not kernel32.GetExitCodeProcess(handle, ctypes.byref(exit_code)):
+                return True
+            return exit_code.value == 259  # STILL_ACTIVE
+        finally:
+            kernel32.CloseHandle(handle)
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class BackupStore:
+    """Content-addressed macro backups: each distinct file content is stored once, gzip-compressed.
+
+    Layout under the store root:
+
+        objects/<first 2 hex digits>/<sha256>.gz    compressed file contents, named by the
+                                                    SHA-256 of the uncompressed bytes
+        manifest.json                               versions per macro file name, oldest first:
+                                                    {"hash", "size", "time", "created"}
+        manifest.json.lock                          held while a process updates the manifest
+
+    Backing up an unchanged file adds no object and no version. Any number of threads and
+    processes can share one store: manifest updates are serialized through the lock file.
+    """
+
+    def __init__(self, root=BACKUP_ROOT, compresslevel=6):
+        self.root = root
+        self.objects_dir = os.path.join(root, "objects")
+        self.manifest_path = os.path.join(root, "manifest.json")
+        self.lock_path = self.manifest_path + ".lock"
+        self.compresslevel = compresslevel
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        # Stores travel to validator worker processes; each process gets its own thread lock
+        state = dict(self.__dict__)
+        del state['_lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def _read_lock(self):
+        """Contents of the lock file, or None when there is none"""
+        try:
+            with open(self.lock_path, 'r', encoding='ascii', errors='replace') as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def _lock_is_stale(self, content):
+        """Whether the lock holding `content` was left behind by a process that is gone"""
+        try:
+            pid = int(content.split()[0])
+        except (IndexError, ValueError):
+            # Empty or garbled, e.g. its owner died between creating and writing it
+            try:
+                return time.time() - os.path.getmtime(self.lock_path) > LOCK_STALE
+            except OSError:
+                return False
+        return not _pid_alive(pid)
+
+    def _remove_lock_if(self, content):
+        """Remove the lock file if it still holds `content`; another process may have replaced it"""
+        if self._read_lock() == content:
+            try:
+                os.remove(self.lock_path)
+            except FileNotFoundError:
+                pass
+            return True
+        return False
+
+    @contextmanager
+    def _manifest_lock(self):
+        """Hold the manifest against other threads (thread lock) and processes (O_EXCL lock file)"""
+        with self._lock:
+            os.makedirs(self.root, exist_ok=True)
+            owner = f"{os.getpid()} {secrets.token_hex(8)}"
+            deadline = time.monotonic() + LOCK_TIMEOUT
+            while True:
+                try:
+                    fd = os.open(self.lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+                    break
+                except FileExistsError:
+                    content = self._read_lock()
+                    if content is None:
+                        continue
+                    if self._lock_is_stale(content) and self._remove_lock_if(content):
+                        continue
+                    if time.monotonic() > deadline:
+                        holder = content.split()[0] if content.strip() else "unknown"
+                        raise Exception(f"Backup store is locked by process {holder}: {self.lock_path}")
+                    time.sleep(0.01)
+            try:
+                os.write(fd, owner.encode('ascii'))
+                os.close(fd)
+                yield
+            finally:
+                # Only ever remove our own lock, never one another process took over
+                self._remove_lock_if(owner)
+
+    def _object_path(self, digest):
+        return os.path.join(self.objects_dir, digest[:2], digest + ".gz")
+
+    def _load_manifest(self):
+        try:
+            with open(self.manifest_path, 'r', encoding='utf-8') as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            return {'version': MANIFEST_VERSION, 'macros': {}}
+        manifest.setdefault('macros', {})
+        return manifest
+
+    def _save_manifest(self, manifest):
+        os.makedirs(self.root, exist_ok=True)
+        tmp_path = f"{self.manifest_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(manifest, f, indent=2)
+            os.replace(tmp_path, self.manifest_path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    @staticmethod
+    def file_digest(filepath):
+        """SHA-256 and size of a file, read in chunks"""
+        digest = hashlib.sha256()
+        size = 0
+        with open(filepath, 'rb') as f:
+            for chunk in iter(lambda: f.read(_CHUNK_SIZE), b""):
+                digest.update(chunk)
+                size += len(chunk)
+        return digest.hexdigest(), size
+
+    def _store_object(self, filepath, digest):
+        """Compress a file into the object store unless its content is already there"""
+        object_path = self._object_path(digest)
+        if os.path.exists(object_path):
+            return False
+        os.makedirs(os.path.dirname(object_path), exist_ok=True)
+        tmp_path = f"{object_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(filepath, 'rb') as source, gzip.open(tmp_path, 'wb', compresslevel=self.compresslevel) as target:
+                shutil.copyfileobj(source, target, _CHUNK_SIZE)
+            os.replace(tmp_path, object_path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        return True
+
+    def backup(self, macro_path, timestamp=None):
+        """Record the current content of a macro; returns (version entry, whether it is a new version)"""
+        digest, size = self.file_digest(macro_path)
+        name = os.path.basename(macro_path)
+        timestamp = time.time() if timestamp is None else timestamp
+        # Compressing is the slow part and objects are content-addressed and written atomically,
+        # so it happens before the lock, which then covers the manifest update alone
+        self._store_object(macro_path, digest)
+
+        with self._manifest_lock():
+            manifest = self._load_manifest()
+            versions = manifest['macros'].setdefault(name, [])
+            if versions and versions[-1]['hash'] == digest:
+                return versions[-1], False
+
+            # A prune in between may have collected the object as unreferenced
+            self._store_object(macro_path, digest)
+            entry = {
+                'hash': digest,
+                'size': size,
+                'time': timestamp,
+                'created': datetime.fromtimestamp(timestamp).isoformat(timespec='seconds')
+            }
+            versions.append(entry)
+            self._save_manifest(manifest)
+        return entry, True
+
+    def macros(self):
+        """Names of all macros with backups"""
+        return sorted(self._load_manifest()['macros'])
+
+    def versions(self, name):
+        """Versions of one macro, oldest first"""
+        return list(self._load_manifest()['macros'].get(os.path.basename(name), []))
+
+    def find_version(self, name, version=None):
+        """A version by hash prefix or index; the newest by default.
+
+        Indexes are ints, or strings marked with '@' ('@-1' is the newest), since an all-digit
+        string is just as likely a hash prefix. Negative numbers, which no hash starts with,
+        are taken as indexes unmarked.
+        """
+        versions = self.versions(name)
+        if not versions:
+            raise ValueError(f"No backups of {name}")
+        if version is None:
+            return versions[-1]
+        index = None
+        if isinstance(version, int):
+            index = version
+        elif version.startswith('@') or (version.startswith('-') and version[1:].isdigit()):
+            try:
+                index = int(version.lstrip('@'))
+            except ValueError:
+                raise ValueError(f"Invalid version index: {version}")
+        if index is not None:
+            try:
+                return versions[index]
+            except IndexError:
+                raise ValueError(f"{name} has {len(versions)} backups, no version {version}")
+        matches = [entry for entry in versions if entry['hash'].startswith(version.lower())]
+        if not matches:
+            raise ValueError(f"No backup of {name} with hash {version}")
+        return matches[-1]
+
+    def restore(self, name, target_path, version=None):
+        """Write a backed-up version to target_path atomically, verifying its hash; returns the entry"""
+        entry = self.find_version(name, version)
+        directory = os.path.dirname(target_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        tmp_path = target_path + ".restore.tmp"
+        digest = hashlib.sha256()
+        try:
+            with gzip.open(self._object_path(entry['hash']), 'rb') as source, open(tmp_path, 'wb') as target:
+                for chunk in iter(lambda: source.read(_CHUNK_SIZE), b""):
+                    digest.update(chunk)
+                    target.write(chunk)
+            if digest.hexdigest() != entry['hash']:
+                raise Exception(f"Backup object {entry['hash'][:12]} is corrupted")
+            os.replace(tmp_path, target_path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        return entry
+
+    def prune(self, keep_last=10, max_age_days=None, now=None):
+        """Apply the retention policy, then delete objects no version refers to.
+
+        Per macro, the newest keep_last versions are always kept; older ones are kept only while
+        younger than max_age_days (never, when it is None). Returns (versions removed, objects removed).
+        """
+        now = time.time() if now is None else now
+        removed_versions = 0
+        with self._manifest_lock():
+            manifest = self._load_manifest()
+            for name, versions in list(manifest['macros'].items()):
+                cutoff = len(versions) - keep_last
+                kept = [
+                    entry for index, entry in enumerate(versions)
+                    if index >= cutoff or (max_age_days is not None and now - entry['time'] < max_age_days * 86400)
+                ]
+                removed_versions += len(versions) - len(kept)
+                if kept:
+                    manifest['macros'][name] = kept
+                else:
+                    del manifest['macros'][name]
+            self._save_manifest(manifest)
+            removed_objects = self._collect_garbage(manifest)
+        return removed_versions, removed_objects
+
+    def _collect_garbage(self, manifest):
+        referenced = {entry['hash'] for versions in manifest['macros'].values() for entry in versions}
+        removed = 0
+        if not os.path.isdir(self.objects_dir):
+            return removed
+        for prefix in os.listdir(self.objects_dir):
+            prefix_dir = os.path.join(self.objects_dir, prefix)
+            for filename in os.listdir(prefix_dir):
+                if filename.endswith(".gz") and filename[:-3] not in referenced:
+                    os.remove(os.path.join(prefix_dir, filename))
+                    removed += 1
+            if not os.listdir(prefix_dir):
+                os.rmdir(prefix_dir)
+        return removed
+
+    def stats(self):
+        """Version and object counts, with the original and stored sizes in bytes"""
+        manifest = self._load_manifest()
+        versions = [entry for entries in manifest['macros'].values() for entry in entries]
+        stored = 0
+        objects = 0
+        if os.path.isdir(self.objects_dir):
+            for prefix in os.listdir(self.objects_dir):
+                for filename in os.listdir(os.path.join(self.objects_dir, prefix)):
+                    objects += 1
+                    stored += os.path.getsize(os.path.join(self.objects_dir, prefix, filename))
+        return {
+            'macros': len(manifest['macros']),
+            'versions': len(versions),
+            'objects': objects,
+            'original_bytes': sum(entry['size'] for entry in versions),
+            'stored_bytes': stored
+        }
+
+    def import_legacy(self, backup_dir=LEGACY_BACKUP_DIR, remove=False):
+        """Move timestamped copies made by the old backup_macro into the store, oldest first"""
+        if not os.path.isdir(backup_dir):
+            return 0
+        legacy = []
+        for filename in os.listdir(backup_dir):
+            match = _LEGACY_NAME.match(filename)
+            if match:
+                stamp = datetime.strptime(match.group('stamp'), "%Y%m%d_%H%M%S").timestamp()
+                legacy.append((stamp, match.group('name') + match.group('ext'), os.path.join(backup_dir, filename)))
+
+        imported = 0
+        for stamp, name, path in sorted(legacy):
+            digest, size = self.file_digest(path)
+            self._store_object(path, digest)
+            with self._manifest_lock():
+                manifest = self._load_manifest()
+                versions = manifest['macros'].setdefault(name, [])
+                if not any(entry['hash'] == digest for entry in versions):
+                    self._store_object(path, digest)
+                    versions.append({
+                        'hash': digest,
+                        'size': size,
+                        'time': stamp,
+                        'created': datetime.fromtimestamp(stamp).isoformat(timespec='seconds')
+                    })
+                    versions.sort(key=lambda entry: entry['time'])
+                    self._save_manifest(manifest)
+                    imported += 1
+            if remove:
+                os.remove(path)
+        return imported
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Manage the deduplicated macro backup store")
+    parser.add_argument("--root", default=BACKUP_ROOT, help=f"store directory (default: {BACKUP_ROOT})")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    backup_parser = subparsers.add_parser("backup", help="back up macro files")
+    backup_parser.add_argument("files", nargs="+")
+
+    list_parser = subparsers.add_parser("list", help="list backed-up macros, or the versions of one")
+    list_parser.add_argument("macro", nargs="?")
+
+    restore_parser = subparsers.add_parser("restore", help="restore a version (the newest by default)")
+    restore_parser.add_argument("macro", help="macro file name, e.g. farm.json")
+    restore_parser.add_argument("--version", help="hash prefix, or version index as @N (@-1 = newest)")
+    restore_parser.add_argument("--to", help="target path (default: macros/<name>)")
+
+    prune_parser = subparsers.add_parser("prune", help="apply the retention policy and drop unused objects")
+    prune_parser.add_argument("--keep-last", type=int, default=10)
+    prune_parser.add_argument("--max-age-days", type=float, default=None)
+
+    subparsers.add_parser("stats", help="show storage usage")
+
+    import_parser = subparsers.add_parser("import-legacy", help="import macros/backups copies into the store")
+    import_parser.add_argument("--dir", default=LEGACY_BACKUP_DIR)
+    import_parser.add_argument("--remove", action="store_true", help="delete the copies once imported")
+
+    args = parser.parse_args(argv)
+    store = BackupStore(args.root)
+
+    try:
+        if args.command == "backup":
+            for path in args.files:
+                entry, created = store.backup(path)
+                print(f"{path}: {entry['hash'][:12]} ({'new version' if created else 'unchanged'})")
+        elif args.command == "list":
+            if args.macro:
+                for index, entry in enumerate(store.versions(args.macro)):
+                    print(f"{'@' + str(index):>5}  {entry['created']}  {entry['hash'][:12]}  {entry['size']:>12} bytes")
+            else:
+                for name in store.macros():
+                    print(f"{name}: {len(store.versions(name))} versions")
+        elif args.command == "restore":
+            target = args.to or os.path.join("macros", os.path.basename(args.macro))
+            entry = store.restore(args.macro, target, args.version)
+            print(f"Restored {args.macro} {entry['created']} ({entry['hash'][:12]}) to {target}")
+        elif args.command == "prune":
+            versions, objects = store.prune(args.keep_last, args.max_age_days)
+            print(f"Removed {versions} versions and {objects} objects")
+        elif args.command == "stats":
+            print(json.dumps(store.stats(), indent=2))
+        elif args.command == "import-legacy":
+            print(f"Imported {store.import_legacy(args.dir, args.remove)} backups")
+    except Exception as e:
+        print(f"Error: {e}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
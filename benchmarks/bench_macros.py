@@ -0,0 +1,308 @@
+"""Macro I/O, validation, display and playback scheduling benchmarks.
+
+Generates synthetic macros of each size in both file formats inside a scratch directory and
+measures, per format and size:
+
+    save_s            RecordingJournal.write_macro (the maker's save path)
+    load_s            MacroUtils.load_macro_data
+    play_load_s       MacroUtils.load_macro_data(lazy=True) plus PlaybackEngine.schedule (the runner
+                      worker's load path)
+    index_s           MacroIndex.refresh on a cold index (the runner's load_macros)
+    validate_s        MacroUtils.validate_macro_file
+    load_peak_mb      peak Python heap while loading, from tracemalloc
+    display_us        per-action cost of MacroMaker.flush_display_queue fed in tick-sized batches
+    schedule_s        PlaybackEngine.schedule
+    compile_s         MacroPlan.compile_actions
+    lateness_*_ms     scheduler accuracy playing the first --playback-actions actions 1 ms
+                      apart against the recording stub backend
+
+Everything runs headless; the display benchmark uses a real Tk text widget only when a
+display is available. Results are printed (or written with --output) as JSON. With
+--baseline, metrics more than --threshold slower than the stored run are reported and the
+exit status is 1.
+
+    python benchmarks/bench_macros.py --sizes 1000 10000 --output bench.json
+    python benchmarks/bench_macros.py --baseline bench.json
+"""
+import os
+import sys
+import gc
+import json
+import time
+import random
+import shutil
+import argparse
+import platform
+import tempfile
+import tracemalloc
+from types import SimpleNamespace
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+from utils import MacroUtils, MacroIndex
+from macro_format import BINARY_EXTENSION
+from macro_plan import MacroPlan
+from playback import PlaybackEngine, RecordingBackend
+from recording import RecordingJournal
+from run_report import RunReport
+
+DEFAULT_SIZES = (1000, 10000, 100000, 1000000)
+FORMATS = ('json', 'binary')
+# Actions per display flush: about one 50 ms tick of fast recording
+DISPLAY_BATCH = 100
+# Metrics below this many seconds (or ms/us/MB, per unit) are too noisy to flag as regressions
+NOISE_FLOOR = {'_s': 0.002, '_ms': 1.0, '_us': 0.5, '_mb': 0.5}
+# Reported but never compared: sizes, and single worst-case samples that depend on the OS scheduler
+INFORMATIONAL = ('file_mb', 'lateness_max_ms')
+
+
+def generate_actions(count, seed=0):
+    """A recording-like mix of moves, clicks, drags, key presses and occasional waits"""
+    rng = random.Random(seed)
+    actions = []
+    timestamp = 0.0
+    keys = "abcdefghijklmnopqrstuvwxyz0123456789"
+    specials = ('space', 'enter', 'shift', 'esc', 'tab')
+    while len(actions) < count:
+        timestamp += rng.uniform(0.005, 0.05)
+        x, y = rng.randint(0, 1919), rng.randint(0, 1079)
+        roll = rng.random()
+        if roll < 0.55:
+            actions.append({'type': 'move', 'x': x, 'y': y, 'timestamp': round(timestamp, 3)})
+        elif roll < 0.75:
+            actions.append({'type': 'click', 'x': x, 'y': y, 'button': 'left', 'timestamp': round(timestamp, 3)})
+        elif roll < 0.85:
+            for state in ('down', 'move', 'up'):
+                actions.append({'type': 'drag', 'x': x, 'y': y, 'button': 'left', 'state': state,
+                                'timestamp': round(timestamp, 3)})
+                timestamp += 0.01
+        elif roll < 0.98:
+            key = rng.choice(keys) if rng.random() < 0.8 else rng.choice(specials)
+            actions.append({'type': 'key_press', 'key': key, 'timestamp': round(timestamp, 3)})
+        else:
+            actions.append({'type': 'wait', 'duration': round(rng.uniform(0.1, 1.0), 2),
+                            'timestamp': round(timestamp, 3)})
+    return actions[:count]
+
+
+def best_of(repeat, func):
+    """Fastest of several runs, in seconds, and the last result"""
+    best = None
+    result = None
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def peak_memory_mb(func):
+    """Peak traced Python heap while func runs"""
+    gc.collect()
+    tracemalloc.start()
+    try:
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak / (1024 * 1024)
+
+
+class _TextSink:
+    """Headless stand-in for the actions display's Text widget"""
+
+    def __init__(self):
+        self.length = 0
+
+    def config(self, **options):
+        pass
+
+    def insert(self, index, text):
+        self.length += len(text)
+
+    def delete(self, start, end=None):
+        pass
+
+    def see(self, index):
+        pass
+
+
+def bench_display(actions):
+    """Per-action cost of the maker's display flush, fed DISPLAY_BATCH actions per tick"""
+    import queue
+    import macro_maker
+
+    root = None
+    widget = _TextSink()
+    try:
+        import tkinter as tk
+        root = tk.Tk()
+        root.withdraw()
+        widget = tk.Text(root)
+    except Exception:
+        pass
+
+    display = SimpleNamespace(
+        display_queue=queue.SimpleQueue(),
+        displayed_count=0,
+        display_lines=0,
+        actions_display=widget
+    )
+    display.format_action = lambda number, action: macro_maker.MacroMaker.format_action(display, number, action)
+
+    start = time.perf_counter()
+    for offset in range(0, len(actions), DISPLAY_BATCH):
+        for action in actions[offset:offset + DISPLAY_BATCH]:
+            display.display_queue.put(action)
+        macro_maker.MacroMaker.flush_display_queue(display)
+    elapsed = time.perf_counter() - start
+
+    if root is not None:
+        root.destroy()
+    return elapsed * 1e6 / max(len(actions), 1), root is not None
+
+
+def bench_playback(actions, count):
+    """Play the first count actions 1 ms apart on the recording backend; lateness percentiles in ms"""
+    sample = [dict(action, timestamp=index * 0.001) for index, action in enumerate(actions[:count])
+              if action['type'] != 'wait']
+    report = RunReport(engine="python")
+    PlaybackEngine(RecordingBackend()).play(sample, report=report)
+    lateness = report.summary()['lateness']
+    return {f"lateness_{key}_ms": lateness[key] for key in ('p50', 'p99', 'max')}
+
+
+def write_journal(path, actions):
+    journal = RecordingJournal(path)
+    journal.open()
+    for action in actions:
+        journal.append(action)
+    journal.close()
+    return journal
+
+
+def bench_size(workdir, size, repeat, playback_actions, skip_display):
+    """All metrics for one macro size, keyed by "<format>-<size>" """
+    actions = generate_actions(size)
+    repeat = repeat if size <= 100000 else 1
+    results = {}
+
+    journal_path = os.path.join(workdir, f"journal-{size}.jsonl")
+    journal = write_journal(journal_path, actions)
+
+    for fmt in FORMATS:
+        macros_dir = os.path.join(workdir, f"{fmt}-{size}")
+        os.makedirs(macros_dir)
+        filepath = os.path.join(macros_dir, "bench" + (BINARY_EXTENSION if fmt == 'binary' else ".json"))
+        metrics = {}
+
+        metrics['save_s'], _ = best_of(repeat, lambda: journal.write_macro(
+            filepath, "bench", "2000-01-01T00:00:00", binary=(fmt == 'binary')
+        ))
+        metrics['file_mb'] = round(os.path.getsize(filepath) / (1024 * 1024), 3)
+        metrics['load_s'], _ = best_of(repeat, lambda: MacroUtils.load_macro_data(filepath))
+        metrics['play_load_s'], _ = best_of(repeat, lambda: PlaybackEngine.schedule(
+            MacroUtils.load_macro_data(filepath, lazy=True)['actions']
+        ))
+
+        def cold_index():
+            index_file = os.path.join(macros_dir, ".macro_index.json")
+            if os.path.exists(index_file):
+                os.remove(index_file)
+            MacroIndex(macros_dir).refresh()
+
+        metrics['index_s'], _ = best_of(repeat, cold_index)
+        metrics['validate_s'], (valid, message) = best_of(repeat, lambda: MacroUtils.validate_macro_file(filepath))
+        if not valid:
+            raise Exception(f"Generated macro failed validation: {message}")
+        metrics['load_peak_mb'] = round(peak_memory_mb(lambda: MacroUtils.load_macro_data(filepath)), 3)
+        results[f"{fmt}-{size}"] = metrics
+
+    shared = {}
+    shared['schedule_s'], _ = best_of(repeat, lambda: PlaybackEngine.schedule(actions))
+    shared['compile_s'], _ = best_of(repeat, lambda: MacroPlan.compile_actions(actions))
+    if not skip_display:
+        shared['display_us'], _ = bench_display(actions)
+    shared.update(bench_playback(actions, playback_actions))
+    results[f"engine-{size}"] = shared
+    return results
+
+
+def _noise_floor(metric):
+    for suffix, floor in NOISE_FLOOR.items():
+        if metric.endswith(suffix):
+            return floor
+    return 0.0
+
+
+def compare(baseline, current, threshold):
+    """Metrics slower than the baseline by more than threshold (and the noise floor)"""
+    regressions = []
+    for key, metrics in current['results'].items():
+        old_metrics = baseline.get('results', {}).get(key, {})
+        for metric, value in metrics.items():
+            old = old_metrics.get(metric)
+            if old is None or metric in INFORMATIONAL:
+                continue
+            if value > old * (1 + threshold) and value - old > _noise_floor(metric):
+                regressions.append({'case': key, 'metric': metric, 'baseline': old, 'current': value,
+                                    'change': round(value / old - 1, 3) if old else None})
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark macro I/O, validation, display and scheduling")
+    parser.add_argument("--sizes", type=int, nargs="+", default=list(DEFAULT_SIZES), help="actions per macro")
+    parser.add_argument("--repeat", type=int, default=3, help="best-of runs for sizes up to 100k actions")
+    parser.add_argument("--playback-actions", type=int, default=2000, help="actions played for scheduler accuracy")
+    parser.add_argument("--no-display", action="store_true", help="skip the display benchmark")
+    parser.add_argument("--output", help="write the results JSON here instead of printing it")
+    parser.add_argument("--baseline", help="results JSON from an earlier run to compare against")
+    parser.add_argument("--threshold", type=float, default=0.2, help="allowed slowdown vs the baseline (0.2 = 20%%)")
+    args = parser.parse_args(argv)
+
+    workdir = tempfile.mkdtemp(prefix="astdx-bench-")
+    results = {}
+    try:
+        for size in args.sizes:
+            print(f"benchmarking {size} actions...", file=sys.stderr, flush=True)
+            results.update(bench_size(workdir, size, args.repeat, args.playback_actions, args.no_display))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    current = {
+        'meta': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'host': platform.node(),
+            'cpus': os.cpu_count(),
+            'date': time.strftime("%Y-%m-%dT%H:%M:%S"),
+            'sizes': args.sizes
+        },
+        'results': {key: {metric: round(value, 6) for metric, value in metrics.items()}
+                    for key, metrics in results.items()}
+    }
+
+    status = 0
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        current['regressions'] = compare(baseline, current, args.threshold)
+        for regression in current['regressions']:
+            print(f"REGRESSION {regression['case']} {regression['metric']}: "
+                  f"{regression['baseline']} -> {regression['current']}", file=sys.stderr)
+        status = 1 if current['regressions'] else 0
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(current, f, indent=2)
+    else:
+        print(json.dumps(current, indent=2))
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
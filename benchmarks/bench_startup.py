@@ -0,0 +1,141 @@
+"""Cold-start benchmark for the runner and maker GUIs.
+
+Each sample launches the GUI in a fresh interpreter inside a scratch working directory and
+reports, in seconds since the process was launched:
+
+    import_s       the GUI module finished importing
+    first_paint_s  the main window was mapped and drawn
+    list_ready_s   (runner only) the macro list was populated by the background refresh
+
+The first runner sample starts with no macro index (cold); later ones reuse it (warm).
+Results are printed as JSON. Painting needs a display; --imports-only measures just the
+import step and works headless.
+
+    python benchmarks/bench_startup.py --runs 5 --macros 200
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import statistics
+import subprocess
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Runs inside the child interpreter: argv[1] is the launch time, argv[2] the GUI module
+CHILD_SCRIPT = r'''
+import sys, time, json
+launched = float(sys.argv[1])
+module_name = sys.argv[2]
+imports_only = sys.argv[3] == "1"
+module = __import__(module_name)
+result = {"import_s": time.time() - launched}
+if imports_only:
+    print(json.dumps(result))
+    sys.exit(0)
+
+app = module.MacroRunner() if module_name == "main" else module.MacroMaker()
+root = app.root
+
+def on_map(event):
+    if event.widget is root and "first_paint_s" not in result:
+        root.update_idletasks()
+        result["first_paint_s"] = time.time() - launched
+
+def poll():
+    painted = "first_paint_s" in result
+    if module_name == "main":
+        if painted and app.macro_browser.results:
+            result["list_ready_s"] = time.time() - launched
+            return finish()
+    elif painted:
+        return finish()
+    if time.time() - launched > 30:
+        result["timeout"] = True
+        return finish()
+    root.after(2, poll)
+
+def finish():
+    print(json.dumps(result))
+    sys.stdout.flush()
+    root.destroy()
+
+root.bind("<Map>", on_map)
+root.after(0, poll)
+root.mainloop()
+'''
+
+
+def make_macros(macros_dir, count, actions_per_macro=50):
+    """Fill a scratch macros directory with small synthetic macros"""
+    os.makedirs(macros_dir, exist_ok=True)
+    for index in range(count):
+        actions = [
+            {"type": "click", "x": i % 800, "y": i % 600, "button": "left", "timestamp": i * 0.1}
+            for i in range(actions_per_macro)
+        ]
+        data = {
+            "name": f"bench_{index:05d}",
+            "created": "2024-01-01T00:00:00",
+            "actions": actions,
+            "total_duration": actions[-1]["timestamp"] if actions else 0
+        }
+        with open(os.path.join(macros_dir, f"bench_{index:05d}.json"), 'w') as f:
+            json.dump(data, f)
+
+
+def sample(module_name, workdir, imports_only):
+    """Launch one GUI process and return its timing dict"""
+    env = dict(os.environ)
+    env["PYTHONPATH"] = REPO_DIR + os.pathsep + env.get("PYTHONPATH", "")
+    launched = time.time()
+    output = subprocess.run(
+        [sys.executable, "-c", CHILD_SCRIPT, repr(launched), module_name, "1" if imports_only else "0"],
+        cwd=workdir, env=env, capture_output=True, text=True, timeout=60
+    )
+    if output.returncode != 0:
+        raise RuntimeError(output.stderr.strip().splitlines()[-1] if output.stderr.strip() else "child failed")
+    return json.loads(output.stdout.strip().splitlines()[-1])
+
+
+def summarize(samples):
+    keys = sorted({key for item in samples for key in item if key.endswith("_s")})
+    return {
+        key: {
+            "median": statistics.median(item[key] for item in samples if key in item),
+            "min": min(item[key] for item in samples if key in item),
+            "max": max(item[key] for item in samples if key in item)
+        }
+        for key in keys
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure GUI time-to-first-paint")
+    parser.add_argument("--runs", type=int, default=5, help="samples per GUI")
+    parser.add_argument("--macros", type=int, default=100, help="synthetic macros for the runner to list")
+    parser.add_argument("--gui", choices=("main", "macro_maker", "both"), default="both")
+    parser.add_argument("--imports-only", action="store_true", help="only time module imports (no display needed)")
+    args = parser.parse_args(argv)
+
+    modules = ["main", "macro_maker"] if args.gui == "both" else [args.gui]
+    report = {"python": sys.version.split()[0], "runs": args.runs, "macros": args.macros, "results": {}}
+
+    for module_name in modules:
+        workdir = tempfile.mkdtemp(prefix="astdx_bench_")
+        try:
+            make_macros(os.path.join(workdir, "macros"), args.macros if module_name == "main" else 0)
+            samples = [sample(module_name, workdir, args.imports_only) for _ in range(args.runs)]
+            report["results"][module_name] = {"samples": samples, "summary": summarize(samples)}
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    print(json.dumps(report, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
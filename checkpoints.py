@@ -0,0 +1,113 @@
+import os
+import sys
+import json
+import time
+import argparse
+from datetime import datetime
+
+from playback import PlaybackSpeed
+
+# Checkpoints live beside the macros, like compiled plans: <macro dir>/.checkpoints/<file>.json
+CHECKPOINT_DIRECTORY = ".checkpoints"
+
+
+class CheckpointStore:
+    """Last playback position of each macro, so a stopped or timed-out run can resume.
+
+    A checkpoint records the engine, compile mode and speed it was taken with, how many actions
+    had fired ('fired', also the index of the next action), the scheduled time of the last one
+    ('offset', seconds at that speed) and the macro file's mtime and size. It is discarded once
+    the macro file changes, since positions in the old actions mean nothing in the new ones.
+    """
+
+    def __init__(self, directory=None):
+        # None keeps each macro's checkpoints in a .checkpoints directory next to it
+        self.directory = directory
+
+    def path_for(self, macro_path):
+        macro_path = os.path.abspath(macro_path)
+        directory = self.directory or os.path.join(os.path.dirname(macro_path), CHECKPOINT_DIRECTORY)
+        return os.path.join(directory, os.path.basename(macro_path) + ".json")
+
+    def save(self, macro_path, engine, optimize, fired, total, offset, duration=None, speed=None):
+        """Record a position atomically; returns the checkpoint"""
+        stat = os.stat(macro_path)
+        speed = speed or PlaybackSpeed()
+        checkpoint = {
+            'macro': os.path.basename(macro_path),
+            'mtime_ns': stat.st_mtime_ns,
+            'size': stat.st_size,
+            'engine': engine,
+            'optimize': bool(optimize),
+            'speed': speed.params(),
+            'fired': int(fired),
+            'total': int(total),
+            'offset': float(offset),
+            'duration': duration,
+            'time': time.time(),
+            'saved': datetime.now().isoformat(timespec='seconds')
+        }
+        path = self.path_for(macro_path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(checkpoint, f)
+        os.replace(tmp_path, path)
+        return checkpoint
+
+    def load(self, macro_path, optimize=None):
+        """The macro's checkpoint, or None if there is none, it is for another compile mode or the macro changed"""
+        try:
+            with open(self.path_for(macro_path), 'r', encoding='utf-8') as f:
+                checkpoint = json.load(f)
+            stat = os.stat(macro_path)
+        except (OSError, ValueError):
+            return None
+        if (checkpoint.get('mtime_ns'), checkpoint.get('size')) != (stat.st_mtime_ns, stat.st_size):
+            return None
+        if optimize is not None and checkpoint.get('optimize') != bool(optimize):
+            return None
+        return checkpoint
+
+    def clear(self, macro_path):
+        try:
+            os.remove(self.path_for(macro_path))
+        except OSError:
+            pass
+
+    @staticmethod
+    def speed_of(checkpoint):
+        """PlaybackSpeed the checkpoint was taken at; checkpoints from before speeds were recorded count as 1x"""
+        return PlaybackSpeed.from_params(checkpoint.get('speed') or {})
+
+    @staticmethod
+    def describe(checkpoint):
+        """Short human-readable position, e.g. 'action 1200/5000 (12:34 in)' or '... (6:17 in at 2x)'"""
+        minutes, seconds = divmod(int(checkpoint['offset']), 60)
+        speed = CheckpointStore.speed_of(checkpoint)
+        at = "" if speed.is_normal else f" at {speed}"
+        return f"action {checkpoint['fired']}/{checkpoint['total']} ({minutes}:{seconds:02d} in{at})"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Show or clear saved playback positions")
+    parser.add_argument("macros", nargs="+", help="macro files")
+    parser.add_argument("--clear", action="store_true", help="delete the checkpoints instead")
+    args = parser.parse_args(argv)
+
+    store = CheckpointStore()
+    for path in args.macros:
+        if args.clear:
+            store.clear(path)
+            print(f"{path}: cleared")
+            continue
+        checkpoint = store.load(path)
+        if checkpoint is None:
+            print(f"{path}: no checkpoint")
+        else:
+            print(f"{path}: {store.describe(checkpoint)}, {checkpoint['engine']} engine, saved {checkpoint['saved']}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,287 @@
+"""Headless entry point: list, validate, compile and run macros without the Tk GUIs.
+
+    python cli.py list
+    python cli.py validate macros --fix
+    python cli.py compile farm --optimize
+    python cli.py run farm sell --gap 2 --retries 1 --loop --max-time 3600
+    python cli.py run --job-file session.json --engine python
+    python cli.py run farm --engine python --backend stub --repeat 10   (no real input, for testing)
+    python cli.py run farm --report-dir reports   (per-action timing; see run_report.py show/diff)
+    python cli.py run farm --resume   (continue where a stopped or timed-out run left off)
+    python cli.py run farm --start-time 600   (skip the first ten minutes)
+    python cli.py run farm --speed 2 --turbo 40   (replay gaps twice as fast, none over 40 ms)
+    python cli.py run farm --iterations 0 --iteration-gap 1   (loop in one engine process until stopped)
+
+Macros are given by file path or by name as listed in the macros directory. Ctrl+C (or the
+usual Ctrl+Alt+Q) stops the queue; the throughput summary is printed either way.
+"""
+import os
+import sys
+import json
+import argparse
+import threading
+
+from utils import MacroIndex
+from macro_plan import MacroPlan
+from macro_validator import MacroValidator
+from macro_executor import MacroExecutor, ENGINES
+from runner_daemon import RunnerClient
+from job_queue import JobQueue
+from checkpoints import CheckpointStore
+from run_report import RunReport
+from playback import PlaybackSpeed
+
+RUNNER_DAEMON = os.path.join(os.path.dirname(os.path.abspath(__file__)), "runner_daemon.py")
+
+
+def resolve_macro(reference, macros_dir="macros", index=None):
+    """Map a macro file path or macro name to its file path (a passed-in index must already be refreshed)"""
+    if os.path.isfile(reference):
+        return reference
+    if index is None:
+        index = MacroIndex(macros_dir)
+        index.refresh()
+    for filename, entry in index.entries.items():
+        if entry.get('name') == reference or os.path.splitext(filename)[0] == reference:
+            return os.path.join(macros_dir, filename)
+    raise ValueError(f"Macro not found: {reference}")
+
+
+def command_list(args):
+    index = MacroIndex(args.dir)
+    index.refresh()
+    rows = []
+    for filename, entry in sorted(index.entries.items()):
+        rows.append({
+            'file': os.path.join(args.dir, filename),
+            'name': entry.get('name'),
+            'actions': entry.get('actions_count'),
+            'duration': entry.get('total_duration'),
+            'error': entry.get('error')
+        })
+    if args.json:
+        print(json.dumps(rows, indent=2))
+        return 0
+    for row in rows:
+        if row['error']:
+            print(f"{row['file']}: error: {row['error']}")
+        else:
+            print(f"{row['name']:<30} {row['actions']:>8} actions {row['duration'] or 0:>10.2f}s  {row['file']}")
+    print(f"{len(rows)} macros")
+    return 0
+
+
+def command_validate(args):
+    validator = MacroValidator(fix=args.fix)
+    summary = validator.validate_many(MacroValidator.collect_files(args.paths or [args.dir]), jobs=args.jobs)
+    if args.json:
+        print(json.dumps(summary, indent=2))
+    else:
+        print(MacroValidator.format_summary(summary))
+    return 0 if summary['invalid'] == 0 else 1
+
+
+def command_compile(args):
+    status = 0
+    speed = PlaybackSpeed.from_args(args)
+    for reference in args.macros:
+        try:
+            print(MacroPlan.compile_file(resolve_macro(reference, args.dir), optimize=args.optimize, speed=speed))
+        except Exception as e:
+            print(f"Failed to compile {reference}: {e}")
+            status = 1
+    return status
+
+
+def print_event(kind, info):
+    """Progress lines for the job queue"""
+    name = os.path.basename(info['macro'])
+    if kind == 'start':
+        print(f"[run] {name} ({info['repeat']}/{info['of']})", flush=True)
+    elif kind == 'finish':
+        result = info['result']
+        took = f"{result['elapsed']:.2f}s (predicted {result.get('predicted', 0.0):.2f}s at {result.get('speed', '1x')})"
+        iterations = result.get('iterations')
+        if iterations:
+            took = (f"{result['elapsed']:.2f}s: {RunReport.format_iterations(iterations)} "
+                    f"(predicted {result.get('predicted', 0.0):.2f}s each at {result.get('speed', '1x')})")
+        timing = result.get('timing')
+        if timing:
+            print(f"[ok] {name} in {took}, lateness p99 {timing['lateness']['p99']:.2f} ms, "
+                  f"final drift {timing['final_drift']:.2f} ms, report {result['report']}", flush=True)
+        else:
+            print(f"[ok] {name} in {took}", flush=True)
+    elif kind == 'retry':
+        print(f"[retry] {name} attempt {info['attempt']}", flush=True)
+    elif kind == 'error':
+        print(f"[error] {name}: {info['error']}", flush=True)
+    elif kind == 'failed':
+        print(f"[failed] {name} after {info['attempts']} attempts", flush=True)
+    elif kind == 'interrupted':
+        iterations = info['result'].get('iterations')
+        if iterations:
+            print(f"[loop] {name} {RunReport.format_iterations(iterations)}", flush=True)
+        checkpoint = info['result'].get('checkpoint')
+        if checkpoint:
+            print(f"[stopped] {name} at {CheckpointStore.describe(checkpoint)}, continue with --resume", flush=True)
+        else:
+            print(f"[stopped] {name}", flush=True)
+
+
+def build_queue(args):
+    """Create the executor and job queue from the run arguments and optional job file"""
+    spec = JobQueue.load_job_file(args.job_file) if args.job_file else {}
+    options = {
+        'gap': spec.get('gap', 0.0), 'retries': spec.get('retries', 0), 'loop': spec.get('loop', False),
+        'max_runs': spec.get('max_runs'), 'max_time': spec.get('max_time'),
+        'stop_on_failure': spec.get('stop_on_failure', False)
+    }
+    # Command line flags override the job file
+    for key in options:
+        value = getattr(args, key)
+        if value is not None:
+            options[key] = value
+
+    jobs = [JobQueue.normalize_job(job) for job in spec.get('jobs', [])]
+    loop = {'iterations': args.iterations, 'iterate_for': args.iterate_for, 'iteration_gap': args.iteration_gap}
+    loop = {key: value for key, value in loop.items() if value is not None}
+    jobs += [
+        JobQueue.normalize_job(dict(loop, macro=reference, repeat=args.repeat if args.repeat is not None else 1))
+        for reference in args.macros
+    ]
+    if not jobs:
+        raise ValueError("No macros to run")
+
+    index = MacroIndex(args.dir)
+    index.refresh()
+    for job in jobs:
+        job['macro'] = resolve_macro(job['macro'], args.dir, index)
+
+    runner_client = RunnerClient(command=[sys.executable, RUNNER_DAEMON, "--backend", args.backend])
+    executor = MacroExecutor(engine=args.engine, optimize=args.optimize, runner_client=runner_client,
+                             unattended=True, report_dir=args.report_dir, speed=PlaybackSpeed.from_args(args))
+    start = {'start_action': args.start_action, 'start_time': args.start_time, 'resume': args.resume}
+    return JobQueue(executor, jobs, on_event=None if args.json else print_event,
+                    start={key: value for key, value in start.items() if value is not None}, **options)
+
+
+def command_run(args):
+    try:
+        job_queue = build_queue(args)
+    except Exception as e:
+        print(f"Error: {e}")
+        return 2
+
+    # Same stop hotkey as the GUI when real input is being sent
+    hotkeys = None
+    if args.engine == "python" and args.backend == "pynput":
+        try:
+            from pynput import keyboard
+            hotkeys = keyboard.GlobalHotKeys({'<ctrl>+<alt>+q': job_queue.stop})
+            hotkeys.start()
+        except ImportError:
+            pass
+
+    # The queue runs on a worker thread so Ctrl+C is handled promptly on every platform
+    result = {}
+    errors = []
+
+    def run_queue():
+        try:
+            result.update(job_queue.run())
+        except Exception as e:
+            errors.append(e)
+
+    worker = threading.Thread(target=run_queue, daemon=True)
+    worker.start()
+    try:
+        while worker.is_alive():
+            worker.join(0.2)
+    except KeyboardInterrupt:
+        print("Stopping...", flush=True)
+        job_queue.stop()
+        worker.join()
+    finally:
+        if hotkeys:
+            hotkeys.stop()
+        job_queue.executor.close()
+
+    if errors:
+        print(f"Error: {errors[0]}")
+        return 2
+    if args.json:
+        print(json.dumps(result, indent=2))
+    else:
+        print(
+            f"{result['runs']} runs: {result['succeeded']} succeeded, {result['failed']} failed, "
+            f"{result['retries']} retries in {result['elapsed']:.1f}s "
+            f"({result['runs_per_hour']:.1f} runs/hour, stopped: {result['stop_reason']})"
+        )
+    return 0 if result['failed'] == 0 else 1
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run and manage ASTDX macros without the GUI")
+    parser.add_argument("--dir", default="macros", help="macros directory (default: macros)")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    list_parser = subparsers.add_parser("list", help="list macros with their action counts and durations")
+    list_parser.add_argument("--json", action="store_true")
+    list_parser.set_defaults(handler=command_list)
+
+    validate_parser = subparsers.add_parser("validate", help="validate macro files in bulk")
+    validate_parser.add_argument("paths", nargs="*", help="files or directories (default: the macros directory)")
+    validate_parser.add_argument("--jobs", type=int, default=None)
+    validate_parser.add_argument("--fix", action="store_true")
+    validate_parser.add_argument("--json", action="store_true")
+    validate_parser.set_defaults(handler=command_validate)
+
+    compile_parser = subparsers.add_parser("compile", help="compile macros into cached AHK runner plans")
+    compile_parser.add_argument("macros", nargs="+")
+    compile_parser.add_argument("--optimize", action="store_true")
+    PlaybackSpeed.add_arguments(compile_parser)
+    compile_parser.set_defaults(handler=command_compile)
+
+    run_parser = subparsers.add_parser("run", help="run macros back to back through the job queue")
+    run_parser.add_argument("macros", nargs="*", help="macro names or files, run in order")
+    run_parser.add_argument("--job-file", help="JSON job file with jobs and queue options")
+    run_parser.add_argument("--engine", choices=ENGINES, default="ahk")
+    run_parser.add_argument("--backend", choices=("pynput", "stub"), default="pynput",
+                            help="Python engine output; stub records instead of sending input")
+    run_parser.add_argument("--optimize", action="store_true")
+    PlaybackSpeed.add_arguments(run_parser)
+    run_parser.add_argument("--repeat", type=int, default=None, help="runs of each macro per pass")
+    run_parser.add_argument("--gap", type=float, default=None, help="seconds between runs")
+    run_parser.add_argument("--iterations", type=int, default=None,
+                            help="loop each run this many times in one engine process (0 = until stopped)")
+    run_parser.add_argument("--iterate-for", type=float, default=None, metavar="SECONDS",
+                            help="loop each run, starting no iteration after this many seconds")
+    run_parser.add_argument("--iteration-gap", type=float, default=None, metavar="SECONDS",
+                            help="seconds between iterations of a looped run")
+    run_parser.add_argument("--retries", type=int, default=None, help="retries after a failed run")
+    # Flags a job file can also set default to None, so that only flags actually given override it
+    run_parser.add_argument("--loop", action="store_const", const=True, default=None,
+                            help="repeat the whole sequence until a stop condition")
+    run_parser.add_argument("--max-runs", type=int, default=None)
+    run_parser.add_argument("--max-time", type=float, default=None, help="stop starting runs after this many seconds")
+    run_parser.add_argument("--stop-on-failure", action="store_const", const=True, default=None)
+    run_parser.add_argument("--report-dir", default=None,
+                            help="write a per-action timing report (JSONL) for every run into this directory")
+    position_group = run_parser.add_mutually_exclusive_group()
+    position_group.add_argument("--resume", action="store_const", const=True, default=None,
+                                help="start each macro from its checkpoint, taken at the same --speed and --turbo; "
+                                     "failed runs are retried from theirs")
+    position_group.add_argument("--start-action", type=int, default=None, help="start each macro at this action index")
+    position_group.add_argument("--start-time", type=float, default=None,
+                                help="start each macro at the first action due this many seconds in")
+    run_parser.add_argument("--json", action="store_true")
+    run_parser.set_defaults(handler=command_run)
+
+    args = parser.parse_args(argv)
+    if args.command == "run" and args.repeat is not None and args.repeat < 1:
+        run_parser.error(f"--repeat must be at least 1, not {args.repeat}")
+    return args.handler(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,181 @@
+import json
+import time
+import threading
+
+
+class JobQueue:
+    """Runs a sequence of macros back to back with gaps, retries and stop conditions.
+
+    Each job is a dict: {"macro": path, "repeat": 1, "gap": None}. A job's gap overrides the
+    queue-wide gap between its runs and the next one. Runs go through MacroExecutor, the
+    same path the runner GUI uses. A job can also loop the macro within each run, without
+    restarting the engine: "iterations" (0 = until stopped), "iterate_for" (seconds) and
+    "iteration_gap" (seconds), passed on as MacroExecutor.run's repeat, repeat_for and gap.
+    """
+
+    def __init__(self, executor, jobs, gap=0.0, retries=0, loop=False, max_runs=None,
+                 max_time=None, stop_on_failure=False, on_event=None, clock=time.monotonic, start=None):
+        # max_runs counts finished runs (succeeded or failed after retries); max_time is in
+        # seconds of wall time and is checked before each run starts. start holds MacroExecutor.run
+        # arguments (start_action, start_time, resume) for the first run of each job; with
+        # resume set, retries also continue from the failed attempt's checkpoint
+        self.executor = executor
+        self.jobs = [self.normalize_job(job) for job in jobs]
+        self.gap = gap
+        self.retries = retries
+        self.loop = loop
+        self.max_runs = max_runs
+        self.max_time = max_time
+        self.stop_on_failure = stop_on_failure
+        self.on_event = on_event or (lambda kind, info: None)
+        self.clock = clock
+        self.start = start or {}
+        self._stop_event = threading.Event()
+
+    @staticmethod
+    def normalize_job(job):
+        """Fill in the defaults of a job given as a dict or a bare macro path"""
+        if isinstance(job, str):
+            job = {'macro': job}
+        iterate_for = job.get('iterate_for')
+        return {
+            'macro': job['macro'],
+            'repeat': int(job.get('repeat', 1)),
+            'gap': job.get('gap'),
+            # A time limit alone loops until it runs out
+            'iterations': int(job.get('iterations', 1 if iterate_for is None else 0)),
+            'iterate_for': iterate_for,
+            'iteration_gap': float(job.get('iteration_gap', 0.0))
+        }
+
+    @staticmethod
+    def load_job_file(path):
+        """Read a job file: {"jobs": [...], plus any of gap, retries, loop, max_runs, max_time, stop_on_failure}"""
+        with open(path, 'r', encoding='utf-8') as f:
+            spec = json.load(f)
+        if isinstance(spec, list):
+            spec = {'jobs': spec}
+        if not spec.get('jobs'):
+            raise ValueError(f"Job file has no jobs: {path}")
+        return spec
+
+    def stop(self):
+        """Stop after the current run, interrupting it and any gap in progress"""
+        self._stop_event.set()
+        self.executor.stop()
+
+    @property
+    def stopped(self):
+        return self._stop_event.is_set()
+
+    def _runs(self):
+        """Yield (job, repeat index) in queue order, cycling when looping"""
+        while True:
+            for job in self.jobs:
+                for index in range(job['repeat']):
+                    yield job, index
+            if not self.loop:
+                return
+
+    def _stop_reason(self, start, finished):
+        if self._stop_event.is_set():
+            return 'stopped'
+        if self.max_runs is not None and finished >= self.max_runs:
+            return 'max_runs'
+        if self.max_time is not None and self.clock() - start >= self.max_time:
+            return 'max_time'
+        return None
+
+    def run(self):
+        """Work through the queue and return a throughput summary"""
+        self._stop_event.clear()
+        start = self.clock()
+        per_macro = {}
+        summary = {
+            'runs': 0,
+            'succeeded': 0,
+            'failed': 0,
+            'interrupted': 0,
+            'retries': 0,
+            'run_time': 0.0,
+            'stop_reason': 'finished'
+        }
+
+        first = True
+        begun = set()
+        for job, index in self._runs():
+            reason = self._stop_reason(start, summary['runs'])
+            if reason:
+                summary['stop_reason'] = reason
+                break
+
+            if not first:
+                gap = self.gap if job['gap'] is None else job['gap']
+                if gap > 0 and self._stop_event.wait(gap):
+                    summary['stop_reason'] = 'stopped'
+                    break
+            first = False
+
+            stats = per_macro.setdefault(job['macro'], {'runs': 0, 'succeeded': 0, 'failed': 0, 'run_time': 0.0})
+            start_options = self.start if id(job) not in begun else {}
+            begun.add(id(job))
+            outcome = self._run_with_retries(job, index, summary, start_options)
+            if outcome is None:
+                summary['stop_reason'] = 'stopped'
+                break
+
+            succeeded, elapsed = outcome
+            summary['runs'] += 1
+            summary['run_time'] += elapsed
+            stats['runs'] += 1
+            stats['run_time'] += elapsed
+            if succeeded:
+                summary['succeeded'] += 1
+                stats['succeeded'] += 1
+            else:
+                summary['failed'] += 1
+                stats['failed'] += 1
+                if self.stop_on_failure:
+                    summary['stop_reason'] = 'failure'
+                    break
+
+        elapsed = self.clock() - start
+        summary['elapsed'] = elapsed
+        summary['runs_per_hour'] = summary['succeeded'] * 3600.0 / elapsed if elapsed > 0 else 0.0
+        summary['per_macro'] = per_macro
+        return summary
+
+    def _run_with_retries(self, job, index, summary, start_options=None):
+        """Run one queue entry, retrying failures; returns (succeeded, elapsed) or None when stopped"""
+        elapsed = 0.0
+        options = start_options or {}
+        for attempt in range(self.retries + 1):
+            if attempt:
+                options = {'resume': True} if self.start.get('resume') else {}
+                summary['retries'] += 1
+                self.on_event('retry', {'macro': job['macro'], 'attempt': attempt + 1})
+            self.on_event('start', {'macro': job['macro'], 'repeat': index + 1, 'of': job['repeat']})
+
+            started = self.clock()
+            try:
+                result = self.executor.run(
+                    job['macro'], repeat=job['iterations'], repeat_for=job['iterate_for'], gap=job['iteration_gap'],
+                    **options
+                )
+            except Exception as e:
+                elapsed += self.clock() - started
+                self.on_event('error', {'macro': job['macro'], 'error': str(e)})
+                if self._stop_event.is_set():
+                    return None
+                continue
+            elapsed += self.clock() - started
+
+            if not result.get('completed'):
+                summary['interrupted'] += 1
+                self.on_event('interrupted', {'macro': job['macro'], 'result': result})
+                return None
+            self.on_event('finish', {'macro': job['macro'], 'result': result})
+            return True, elapsed
+
+        self.on_event('failed', {'macro': job['macro'], 'attempts': self.retries + 1})
+        return False, elapsed
@@ -0,0 +1,275 @@
+import tkinter as tk
+from tkinter import ttk
+from datetime import datetime
+
+# Sortable columns: (heading, width in pixels, anchor)
+COLUMNS = {
+    'name': ("Name", 200, tk.W),
+    'created': ("Created", 120, tk.W),
+    'duration': ("Duration", 70, tk.E),
+    'actions': ("Actions", 70, tk.E)
+}
+
+
+class MacroSearchIndex:
+    """In-memory search over macro names with sortable columns, independent of any widget.
+
+    search() matches the query as a substring of the lower-cased name; names starting with
+    the query come first, and each group keeps the current sort order. A query that extends
+    the previous one only filters the previous matches, so typing stays incremental.
+    """
+
+    # Row fields; names are stored lower-cased behind a NUL so a prefix test is a plain 'in'
+    _FIELDS = {'name': 0, 'created': 2, 'duration': 3, 'actions': 4}
+
+    def __init__(self):
+        self.rows = {}
+        self.sort_column = 'name'
+        self.descending = False
+        self._order = None
+        self._last = None
+
+    @staticmethod
+    def make_row(entry):
+        """(NUL + lower-cased name, name, created, duration, actions) of a macro index entry"""
+        name = entry.get('name') or ""
+        return (
+            "\0" + name.lower(),
+            name,
+            entry.get('created') or "",
+            float(entry.get('total_duration') or 0),
+            int(entry.get('actions_count') or 0)
+        )
+
+    def _invalidate(self):
+        self._order = None
+        self._last = None
+
+    def set_entries(self, entries):
+        """Replace the contents with {key: index entry}"""
+        self.rows = {key: self.make_row(entry) for key, entry in entries.items()}
+        self._invalidate()
+
+    def upsert(self, key, entry):
+        self.rows[key] = self.make_row(entry)
+        self._invalidate()
+
+    def remove(self, key):
+        if self.rows.pop(key, None) is not None:
+            self._invalidate()
+
+    def __len__(self):
+        return len(self.rows)
+
+    def sort_by(self, column, descending=None):
+        """Sort by a column; without descending, sorting by the current column flips the direction"""
+        if column not in self._FIELDS:
+            raise ValueError(f"Unknown column: {column}")
+        if descending is None:
+            descending = not self.descending if column == self.sort_column else False
+        self.sort_column = column
+        self.descending = descending
+        self._invalidate()
+
+    def _sorted(self):
+        """(NUL + lower-cased name, key) for every row in the current sort order"""
+        if self._order is None:
+            field = self._FIELDS[self.sort_column]
+            items = [(row[field], row[0], key) for key, row in self.rows.items()]
+            items.sort(reverse=self.descending)
+            # Copy the names and keys into fresh strings allocated in sort order: scanning
+            # strings scattered across the heap is several times slower at 50k rows
+            names = "\n".join(name for _, name, _ in items).split("\n")
+            keys = "\n".join(key for _, _, key in items).split("\n")
+            if len(names) == len(keys) == len(items):
+                self._order = list(zip(names, keys))
+            else:
+                self._order = [(name, key) for _, name, key in items]
+        return self._order
+
+    def search(self, query=""):
+        """Keys matching the query, prefix matches first"""
+        query = query.strip().lower()
+        if not query:
+            self._last = None
+            return [key for _, key in self._sorted()]
+
+        last = self._last
+        candidates = last[1] if last is not None and query.startswith(last[0]) else self._sorted()
+        hits = [item for item in candidates if query in item[0]]
+        self._last = (query, hits)
+
+        prefix = "\0" + query
+        return [key for name, key in hits if prefix in name] + [key for name, key in hits if prefix not in name]
+
+
+class MacroBrowser(tk.Frame):
+    """Searchable, sortable macro table that only creates tree items for the visible rows"""
+
+    def __init__(self, master, index, visible_rows=8, on_select=None, on_activate=None, **kwargs):
+        # on_select(key) runs when the selection changes, on_activate(key) on double-click or Enter
+        super().__init__(master, **kwargs)
+        self.index = index
+        self.visible_rows = visible_rows
+        self.on_select = on_select or (lambda key: None)
+        self.on_activate = on_activate or (lambda key: None)
+        self.results = []
+        self.first = 0
+        self.selected_key = None
+        self._pending_search = None
+        self._rendering = False
+
+        search_frame = tk.Frame(self)
+        search_frame.pack(fill=tk.X, pady=(0, 5))
+        tk.Label(search_frame, text="Search:", font=("Arial", 9)).pack(side=tk.LEFT)
+        self.search_var = tk.StringVar()
+        self.search_var.trace_add('write', lambda *args: self._schedule_search())
+        self.search_entry = tk.Entry(search_frame, textvariable=self.search_var)
+        self.search_entry.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=(5, 0))
+        self.count_label = tk.Label(search_frame, text="", font=("Arial", 8))
+        self.count_label.pack(side=tk.RIGHT, padx=(5, 0))
+
+        table_frame = tk.Frame(self)
+        table_frame.pack(fill=tk.BOTH, expand=True)
+
+        self.scrollbar = tk.Scrollbar(table_frame, command=self.yview)
+        self.scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+
+        self.tree = ttk.Treeview(
+            table_frame, columns=tuple(COLUMNS), show='headings', height=visible_rows, selectmode='browse'
+        )
+        for column, (heading, width, anchor) in COLUMNS.items():
+            self.tree.heading(column, text=heading, command=lambda column=column: self.sort_by(column))
+            self.tree.column(column, width=width, anchor=anchor, stretch=(column == 'name'))
+        self.tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+
+        self.tree.bind('<<TreeviewSelect>>', self._on_tree_select)
+        self.tree.bind('<Double-1>', lambda event: self._activate())
+        self.tree.bind('<Return>', lambda event: self._activate())
+        self.tree.bind('<MouseWheel>', lambda event: self.scroll(-1 if event.delta > 0 else 1))
+        self.tree.bind('<Button-4>', lambda event: self.scroll(-1))
+        self.tree.bind('<Button-5>', lambda event: self.scroll(1))
+        self.tree.bind('<Up>', lambda event: self.move_selection(-1))
+        self.tree.bind('<Down>', lambda event: self.move_selection(1))
+        self.tree.bind('<Prior>', lambda event: self.move_selection(-self.visible_rows))
+        self.tree.bind('<Next>', lambda event: self.move_selection(self.visible_rows))
+        self.search_entry.bind('<Down>', lambda event: self._focus_results())
+        self.search_entry.bind('<Return>', lambda event: self._activate())
+
+    @staticmethod
+    def format_row(row):
+        _, name, created, duration, actions = row
+        if created:
+            try:
+                created = datetime.fromisoformat(created).strftime('%Y-%m-%d %H:%M')
+            except ValueError:
+                pass
+        return (name, created, f"{duration:.1f}s", actions)
+
+    def _schedule_search(self):
+        # Coalesce keystrokes that arrive faster than the Tk loop runs into one search
+        if self._pending_search is None:
+            self._pending_search = self.after_idle(self.refresh, True)
+
+    def refresh(self, to_top=False):
+        """Re-run the search, e.g. after the index changed; keeps the selection when it still exists"""
+        self._pending_search = None
+        self.results = self.index.search(self.search_var.get())
+        if to_top:
+            self.first = 0
+        if self.selected_key is not None and self.selected_key not in self.index.rows:
+            self.selected_key = None
+        self.first = max(0, min(self.first, len(self.results) - self.visible_rows))
+        self.count_label.config(text=f"{len(self.results)} of {len(self.index)}")
+        self.render()
+
+    def sort_by(self, column):
+        self.index.sort_by(column)
+        for name, (heading, _, _) in COLUMNS.items():
+            marker = (" ▼" if self.index.descending else " ▲") if name == column else ""
+            self.tree.heading(name, text=heading + marker)
+        self.refresh()
+
+    def render(self):
+        """Show results[first:first + visible_rows] and sync the scrollbar"""
+        self._rendering = True
+        try:
+            self.tree.delete(*self.tree.get_children())
+            rows = self.index.rows
+            for key in self.results[self.first:self.first + self.visible_rows]:
+                self.tree.insert('', tk.END, iid=key, values=self.format_row(rows[key]))
+            if self.selected_key is not None and self.tree.exists(self.selected_key):
+                self.tree.selection_set(self.selected_key)
+        finally:
+            self._rendering = False
+
+        total = len(self.results)
+        if total <= self.visible_rows:
+            self.scrollbar.set(0.0, 1.0)
+        else:
+            self.scrollbar.set(self.first / total, (self.first + self.visible_rows) / total)
+
+    def yview(self, *args):
+        """Scrollbar command: 'moveto fraction' or 'scroll n units|pages'"""
+        if args[0] == 'moveto':
+            first = int(float(args[1]) * len(self.results))
+        elif args[0] == 'scroll':
+            step = self.visible_rows if args[2] == 'pages' else 1
+            first = self.first + int(args[1]) * step
+        else:
+            return
+        self._scroll_to(first)
+
+    def scroll(self, units):
+        self._scroll_to(self.first + units)
+        return "break"
+
+    def _scroll_to(self, first):
+        first = max(0, min(first, len(self.results) - self.visible_rows))
+        if first != self.first:
+            self.first = first
+            self.render()
+
+    def move_selection(self, offset):
+        """Keyboard navigation over all results, scrolling as needed"""
+        if not self.results:
+            return "break"
+        try:
+            position = self.results.index(self.selected_key) + offset
+        except ValueError:
+            position = self.first
+        position = max(0, min(position, len(self.results) - 1))
+        if position < self.first:
+            self.first = position
+        elif position >= self.first + self.visible_rows:
+            self.first = position - self.visible_rows + 1
+        self.select(self.results[position])
+        return "break"
+
+    def select(self, key):
+        self.selected_key = key
+        self.render()
+        self.on_select(key)
+
+    def selected(self):
+        """Key of the selected macro, or None"""
+        return self.selected_key
+
+    def _focus_results(self):
+        self.tree.focus_set()
+        if self.selected_key is None and self.results:
+            self.select(self.results[self.first])
+        return "break"
+
+    def _on_tree_select(self, event):
+        if self._rendering:
+            return
+        selection = self.tree.selection()
+        if selection and selection[0] != self.selected_key:
+            self.selected_key = selection[0]
+            self.on_select(self.selected_key)
+
+    def _activate(self):
+        if self.selected_key is not None:
+            self.on_activate(self.selected_key)
+        return "break"
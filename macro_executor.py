@@ -0,0 +1,420 @@
+import os
+import time
+import threading
+import subprocess
+
+from utils import MacroUtils
+from macro_plan import MacroPlan, PLAN_OP_TYPES
+from runner_daemon import RunnerClient
+from script_updater import ScriptUpdater
+from run_report import RunReport
+from checkpoints import CheckpointStore
+from playback import PlaybackSpeed
+
+AHK_SCRIPT_URL = "https://raw.githubusercontent.com/Quincyzx/Astdx/main/astdx_macro_runner.ahk"
+AHK_SCRIPT_PATH = "astdx_macro_runner.ahk"
+AHK_PATH_CACHE = ".ahk_path.json"
+
+# AutoHotkey executable paths (common locations)
+AHK_PATHS = [
+    r"C:\Program Files\AutoHotkey\AutoHotkey.exe",
+    r"C:\Program Files (x86)\AutoHotkey\AutoHotkey.exe",
+    r"C:\AutoHotkey\AutoHotkey.exe",
+    "autohotkey.exe",  # If in PATH
+    "ahk.exe"  # Alternative name
+]
+
+ENGINES = ("ahk", "python")
+
+# Exit code of the AHK runner when a run is stopped with Ctrl+Alt+Q, attended or not
+AHK_EXIT_STOPPED = 2
+
+# Prefix of the progress lines the AHK runner writes to stdout while it plays a plan:
+# progress<TAB>fired<TAB>total<TAB>offset ms<TAB>duration ms<TAB>iteration
+AHK_PROGRESS_PREFIX = "progress\t"
+
+# Prefix of the line the AHK runner writes after each iteration of a looped plan:
+# iteration<TAB>number<TAB>elapsed us
+AHK_ITERATION_PREFIX = "iteration\t"
+
+# Prefix of the per-step lines the AHK runner writes when started with --timing:
+# timing<TAB>step index<TAB>op<TAB>scheduled ms<TAB>fired us<TAB>sent us
+AHK_TIMING_PREFIX = "timing\t"
+
+# Seconds between checkpoint writes while a macro plays; one is also written when it stops
+CHECKPOINT_INTERVAL = 5.0
+
+
+class MacroExecutor:
+    """Validates, prepares and runs macros on either playback engine; shared by the runner GUI and the CLI"""
+
+    def __init__(self, engine="ahk", optimize=False, runner_client=None, script_updater=None,
+                 ahk_paths=None, ahk_timeout=300, unattended=False, report_dir=None, checkpoints=None,
+                 speed=None):
+        # unattended skips the AHK runner's confirmation and message boxes, for queued runs;
+        # with report_dir set, every run writes a timing report there unless given its own path
+        if engine not in ENGINES:
+            raise ValueError(f"Unknown engine: {engine}")
+        self.engine = engine
+        self.optimize = optimize
+        self.speed = speed or PlaybackSpeed()
+        self.runner_client = runner_client or RunnerClient()
+        self.script_updater = script_updater or ScriptUpdater(AHK_SCRIPT_URL, AHK_SCRIPT_PATH)
+        self.ahk_paths = ahk_paths or AHK_PATHS
+        self.ahk_timeout = ahk_timeout
+        self.unattended = unattended
+        self.report_dir = report_dir
+        self.checkpoints = checkpoints or CheckpointStore()
+        self.ahk_exe = None
+        self._validated = {}
+        self._process = None
+        self._stopped = False
+
+    def find_autohotkey_executable(self):
+        """Find AutoHotkey executable on the system, probing only when the cached path is gone"""
+        if self.ahk_exe and os.path.isfile(self.ahk_exe):
+            return self.ahk_exe
+        self.ahk_exe = MacroUtils.find_autohotkey_executable(self.ahk_paths, cache_file=AHK_PATH_CACHE)
+        return self.ahk_exe
+
+    def validate(self, macro_path):
+        """Validate a macro, skipping files already validated unchanged; raises on invalid macros"""
+        stat = os.stat(macro_path)
+        key = (stat.st_mtime_ns, stat.st_size)
+        if self._validated.get(macro_path) == key:
+            return
+        valid, message = MacroUtils.validate_macro_file(macro_path)
+        if not valid:
+            raise Exception(f"Invalid macro file: {message}")
+        self._validated[macro_path] = key
+
+    def prepare(self, macro_path, engine=None, optimize=None, on_status=None, speed=None):
+        """Get a macro ready to start: a compiled plan for AHK, a preloaded schedule for Python.
+
+        Returns what the engine will run; raises Exception when the macro cannot run.
+        """
+        engine = engine or self.engine
+        optimize = self.optimize if optimize is None else optimize
+        speed = speed or self.speed
+        status = on_status or (lambda text: None)
+        macro_path = os.path.abspath(macro_path)
+
+        if engine == "python":
+            self.validate(macro_path)
+            # Parse in the worker ahead of the run; runs of a cached macro start immediately
+            response = self.runner_client.load(macro_path, optimize=optimize, speed=speed)
+            if not response['ok']:
+                raise Exception(response['error'])
+            return macro_path
+
+        # Use the cached AHK script, downloading it only if it is missing or corrupted
+        status("Checking AHK script...")
+        success, message = self.script_updater.ensure()
+        if not success:
+            raise Exception(f"Failed to download AHK script: {message}")
+
+        if not self.find_autohotkey_executable():
+            raise Exception("AutoHotkey executable not found. Please install AutoHotkey.")
+
+        self.validate(macro_path)
+
+        # Hand the runner a pre-sorted, pre-parsed plan; it is cached by content hash,
+        # so only the first run of an edited macro pays for compiling
+        status("Compiling macro...")
+        return MacroPlan.compile_file(macro_path, optimize=optimize, speed=speed)
+
+    def run(self, macro_path, engine=None, optimize=None, on_status=None, on_progress=None, report=None,
+            start_action=None, start_time=None, resume=False, speed=None, repeat=1, repeat_for=None, gap=0.0):
+        """Prepare and run one macro to completion, returning a result dict.
+
+        The result always has 'completed' (False when stopped), 'engine', 'elapsed',
+        'start_index' and 'predicted' (the scheduled seconds of the part to play, to set
+        against 'elapsed'); Python-engine runs add the playback timing statistics. Failures raise
+        Exception, and an AHK run over ahk_timeout raises subprocess.TimeoutExpired.
+
+        on_progress, if given, is called from a background thread with dicts holding 'fired',
+        'total', 'offset' and 'duration' (scheduled seconds) and 'iteration' as the run advances.
+
+        report, if given, is the path of a per-action timing report (see run_report); the
+        result then has its percentile summary under 'timing' and the path under 'report'.
+
+        start_action (an action index) or start_time (seconds into the schedule) start part
+        way through; resume starts from the macro's checkpoint instead, or from the beginning
+        when it has none. The position is checkpointed while the run plays and whenever it
+        stops, times out or fails; a completed run clears the checkpoint, a stopped one has
+        it under 'checkpoint'.
+
+        speed, a PlaybackSpeed, retimes the recorded gaps; the executor's speed by default.
+
+        repeat (iterations, 0 = until stopped), repeat_for (seconds after which no iteration
+        starts) and gap (seconds between iterations) loop the macro inside one engine process,
+        with no respawn, reparse or message boxes between iterations. Only the first iteration
+        starts part way through. A looped result has 'iterations' (see
+        RunReport.iteration_summary) and 'iteration_times'; 'completed' is False when it was
+        stopped, and ahk_timeout then limits each iteration rather than the whole run.
+        """
+        engine = engine or self.engine
+        optimize = self.optimize if optimize is None else optimize
+        speed = speed or self.speed
+        status = on_status or (lambda text: None)
+        if report is None and self.report_dir:
+            report = RunReport.default_path(macro_path, self.report_dir)
+        looping = repeat != 1 or repeat_for is not None
+        self._stopped = False
+
+        if resume:
+            checkpoint = self.checkpoints.load(macro_path, optimize)
+            if checkpoint is not None:
+                # Offsets are in retimed seconds and retiming drops non-actions, so neither the
+                # time nor the index of a position carries over to another speed
+                saved_speed = CheckpointStore.speed_of(checkpoint)
+                if saved_speed.key != speed.key:
+                    raise Exception(
+                        f"Checkpoint was taken at {saved_speed}, not {speed}; "
+                        f"resume at {saved_speed} or start from the beginning"
+                    )
+                if checkpoint['engine'] == engine:
+                    start_action, start_time = checkpoint['fired'], None
+                else:
+                    # Action indexes differ between engines, so go by time, just past the last fired action
+                    start_action, start_time = None, checkpoint['offset'] + 0.001
+                status(f"Resuming at {CheckpointStore.describe(checkpoint)}")
+
+        target = self.prepare(macro_path, engine, optimize, on_status, speed)
+        # A stop during the load cancels the run before any input is sent
+        if self._stopped:
+            return {'completed': False, 'engine': engine, 'elapsed': 0.0, 'start_index': 0, 'predicted': 0.0}
+
+        position = {}
+        last_saved = [time.monotonic()]
+
+        def track(event):
+            position.update(event)
+            now = time.monotonic()
+            if now - last_saved[0] >= CHECKPOINT_INTERVAL:
+                last_saved[0] = now
+                self._save_checkpoint(macro_path, engine, optimize, speed, position)
+            if on_progress:
+                on_progress(event)
+
+        status("Executing macro...")
+        try:
+            if engine == "python":
+                result = self._play_python(
+                    target, optimize, speed, track, report, start_action, start_time, repeat, repeat_for, gap
+                )
+                position.update(
+                    fired=result['start_index'] + result['actions_fired'],
+                    total=result['actions_total'],
+                    offset=result['offset']
+                )
+            else:
+                result = self._play_ahk(
+                    macro_path, target, track, report, start_action, start_time, repeat, repeat_for, gap
+                )
+                # The runner reports its exact position when stopped, so the last progress line
+                # tells whether every step ran, also when a stop came after the final step
+                if position and not looping:
+                    result['completed'] = position['fired'] >= position['total']
+        except Exception:
+            self._save_checkpoint(macro_path, engine, optimize, speed, position)
+            raise
+
+        result['speed'] = str(speed)
+        if looping:
+            result['iterations'] = RunReport.iteration_summary(result['iteration_times'], result['elapsed'])
+        # A loop stopped between iterations has no partial iteration to come back to
+        if result['completed'] or (looping and position and position['fired'] in (0, position['total'])):
+            self.checkpoints.clear(macro_path)
+        else:
+            result['checkpoint'] = self._save_checkpoint(macro_path, engine, optimize, speed, position)
+        return result
+
+    def _save_checkpoint(self, macro_path, engine, optimize, speed, position):
+        """Checkpoint the last reported position, if the run got anywhere; returns the checkpoint or None"""
+        if not position.get('fired'):
+            return None
+        try:
+            return self.checkpoints.save(
+                macro_path, engine, optimize,
+                position['fired'], position['total'], position['offset'], position.get('duration'), speed
+            )
+        except OSError as e:
+            print(f"Failed to save checkpoint: {e}")
+            return None
+
+    def _play_python(self, target, optimize, speed, on_progress, report, start_action, start_time,
+                     repeat=1, repeat_for=None, gap=0.0):
+        start = time.perf_counter()
+        stop_forwarded = []
+
+        def forward(event):
+            # A stop that reached the worker before it accepted the run was cleared with the
+            # run's acceptance, so pass it on again (off the reader thread that delivers events)
+            if self._stopped and not stop_forwarded:
+                stop_forwarded.append(True)
+                threading.Thread(target=self.runner_client.stop, daemon=True).start()
+            # Iteration notifications are summed up from the result instead
+            if event.get('event') == 'progress':
+                on_progress({key: event[key] for key in ('fired', 'total', 'offset', 'duration', 'iteration')})
+
+        response = self.runner_client.run(
+            target, optimize=optimize, on_progress=forward, report=report, start=start_action, start_time=start_time,
+            speed=speed, repeat=repeat, repeat_for=repeat_for, gap=gap
+        )
+        if not response['ok']:
+            raise Exception(response['error'])
+        result = dict(response['result'])
+        result['engine'] = "python"
+        result['elapsed'] = time.perf_counter() - start
+        return result
+
+    def _play_ahk(self, macro_path, target, on_progress, report, start_action, start_time,
+                  repeat=1, repeat_for=None, gap=0.0):
+        start = time.perf_counter()
+        cmd = [self.ahk_exe, self.script_updater.local_path, target]
+        if self.unattended:
+            cmd.append("--unattended")
+        iteration_times = None
+        if repeat != 1 or repeat_for is not None:
+            # The runner loops over the plan it already read, so one process serves every iteration
+            iteration_times = []
+            cmd += ["--repeat", str(repeat), "--gap", str(int(round(gap * 1000)))]
+            if repeat_for is not None:
+                cmd += ["--for", str(int(round(repeat_for * 1000)))]
+
+        # The compiled plan is already retimed, so its header holds the predicted runtime
+        predicted = float(MacroPlan.read_header(target).get('duration', 0))
+        start_index = 0
+        if start_action is not None or start_time is not None:
+            # The plan's seek index gives the byte offset to jump to, so the runner skips nothing
+            if start_action is not None:
+                located = MacroPlan.seek(target, step=start_action)
+            else:
+                located = MacroPlan.seek(target, time_ms=int(round(start_time * 1000)))
+            if located is None and iteration_times is None:
+                total = int(MacroPlan.read_header(target).get('actions', 0))
+                return {'completed': True, 'engine': "ahk", 'elapsed': 0.0, 'start_index': total, 'predicted': 0.0}
+            # A loop resumed past the end simply starts its next iteration from the top
+            start_index, byte_offset, scheduled_ms = located or (0, 0, 0)
+            predicted = max(predicted - scheduled_ms / 1000.0, 0.0)
+            if start_index > 0:
+                cmd += ["--start", str(start_index), str(byte_offset), str(scheduled_ms)]
+
+        timing = None
+        if report:
+            cmd.append("--timing")
+            timing = RunReport(macro=os.path.abspath(macro_path), engine="ahk")
+
+        returncode, output = self._run_ahk(cmd, on_progress, timing, iteration_times, gap)
+        stopped = self._stopped or returncode == AHK_EXIT_STOPPED
+        if returncode != 0 and not stopped:
+            error_msg = output or "Unknown error"
+            raise Exception(f"AHK execution failed: {error_msg}")
+        result = {
+            'completed': not stopped,
+            'engine': "ahk",
+            'elapsed': time.perf_counter() - start,
+            'start_index': start_index,
+            'predicted': predicted
+        }
+        if timing is not None:
+            result['timing'] = timing.write(report)
+            result['report'] = report
+        if iteration_times is not None:
+            result['iteration_times'] = iteration_times
+        return result
+
+    @staticmethod
+    def _record_timing(report, line):
+        """Add one of the AHK runner's timing lines to a RunReport"""
+        try:
+            _, index, op, scheduled_ms, fired_us, sent_us = line.rstrip("\n").split("\t")
+            report.record(
+                int(index), PLAN_OP_TYPES.get(op, op),
+                int(scheduled_ms) / 1000.0, int(fired_us) / 1000000.0, int(sent_us) / 1000000.0
+            )
+        except ValueError:
+            pass
+
+    def _run_ahk(self, cmd, on_progress, timing=None, iteration_times=None, gap=0.0):
+        """Run the AHK runner, streaming its progress, timing and iteration lines; returns (returncode, other output).
+
+        Iteration lengths are appended to iteration_times, and each finished iteration restarts
+        the timeout, so that a loop is only cut short when one iteration hangs.
+        """
+        self._process = process = subprocess.Popen(
+            cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, bufsize=1
+        )
+        timed_out = threading.Event()
+        timer = [None]
+
+        def on_timeout():
+            timed_out.set()
+            process.kill()
+
+        def arm(seconds):
+            if timer[0] is not None:
+                timer[0].cancel()
+            timer[0] = threading.Timer(seconds, on_timeout)
+            timer[0].daemon = True
+            timer[0].start()
+
+        arm(self.ahk_timeout)
+
+        output = []
+        try:
+            for line in process.stdout:
+                if line.startswith(AHK_TIMING_PREFIX):
+                    if timing is not None:
+                        self._record_timing(timing, line)
+                    continue
+                if line.startswith(AHK_ITERATION_PREFIX):
+                    try:
+                        elapsed_us = int(line.split("\t")[2])
+                    except (IndexError, ValueError):
+                        continue
+                    if iteration_times is not None:
+                        iteration_times.append(elapsed_us / 1000000.0)
+                    arm(self.ahk_timeout + gap)
+                    continue
+                if not line.startswith(AHK_PROGRESS_PREFIX):
+                    output.append(line)
+                    continue
+                if on_progress is None:
+                    continue
+                fields = line.rstrip("\n").split("\t")
+                try:
+                    fired, total, offset_ms, duration_ms = (int(field) for field in fields[1:5])
+                    # Runners from before looping leave the iteration out
+                    iteration = int(fields[5]) if len(fields) > 5 else 1
+                except ValueError:
+                    continue
+                on_progress({
+                    'fired': fired,
+                    'total': total,
+                    'offset': offset_ms / 1000.0,
+                    'duration': duration_ms / 1000.0,
+                    'iteration': iteration
+                })
+            process.wait()
+        finally:
+            timer[0].cancel()
+            self._process = None
+
+        if timed_out.is_set():
+            raise subprocess.TimeoutExpired(cmd, self.ahk_timeout)
+        return process.returncode, "".join(output).strip()
+
+    def stop(self):
+        """Stop the run in progress, on whichever engine it is running"""
+        self._stopped = True
+        process = self._process
+        if process is not None and process.poll() is None:
+            process.terminate()
+        if self.runner_client.alive:
+            self.runner_client.stop()
+
+    def close(self):
+        """Shut down the runner worker"""
+        self.runner_client.close()
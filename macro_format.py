@@ -0,0 +1,362 @@
+import os
+import sys
+import json
+import zlib
+import struct
+from array import array
+from itertools import accumulate
+from collections.abc import Sequence
+
+# File layout: MAGIC, header (version, header length), JSON header, zlib-compressed column body
+MAGIC = b"ASTM"
+FORMAT_VERSION = 1
+BINARY_EXTENSION = ".astm"
+JSON_EXTENSION = ".json"
+
+_PREAMBLE = struct.Struct("<4sHI")
+_LENGTH = struct.Struct("<I")
+_UINT64_MASK = (1 << 64) - 1
+
+# Action fields stored as typed columns, in the order they are written back out.
+# 'str' values go through the string table, 'ts' values are delta-encoded float64 bit patterns.
+COLUMNS = [
+    ('type', 'str'),
+    ('x', 'i32'),
+    ('y', 'i32'),
+    ('button', 'str'),
+    ('key', 'str'),
+    ('state', 'str'),
+    ('duration', 'f64'),
+    ('timestamp', 'ts'),
+]
+
+_TYPECODES = {'str': 'I', 'i32': 'i', 'f64': 'd', 'ts': 'Q'}
+
+# Presence mask bit marking an action that did not fit the columns and is kept verbatim
+_EXTRA_BIT = 1 << 31
+
+
+class ColumnarActions(Sequence):
+    """Read-only actions of a binary macro kept as decoded columns; each dict is built on access"""
+
+    def __init__(self, spec, masks, values, extras):
+        self._spec = spec
+        self._masks = masks
+        self._values = values
+        self._extras = extras
+        self._layouts = {}
+
+    def __len__(self):
+        return len(self._masks)
+
+    def _fields(self, mask):
+        fields = self._layouts.get(mask)
+        if fields is None:
+            fields = self._layouts[mask] = [
+                (field, self._values[position]) for position, (field, _) in enumerate(self._spec)
+                if mask & (1 << position)
+            ]
+        return fields
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        mask = self._masks[index]
+        if mask & _EXTRA_BIT:
+            return self._extras[str(index)]
+        return {key: column[index] for key, column in self._fields(mask)}
+
+    def __iter__(self):
+        extras = self._extras
+        fields = self._fields
+        for index, mask in enumerate(self._masks):
+            if mask & _EXTRA_BIT:
+                yield extras[str(index)]
+                continue
+            yield {key: column[index] for key, column in fields(mask)}
+
+    def column(self, field, default=None):
+        """Every action's value of one field as a list, default where the action has none"""
+        positions = [position for position, (name, _) in enumerate(self._spec) if name == field]
+        if positions:
+            bit = 1 << positions[0]
+            values = self._values[positions[0]]
+            if all(mask & bit for mask in set(self._masks)):
+                values = list(values)
+            else:
+                values = [value if mask & bit else default for value, mask in zip(values, self._masks)]
+        else:
+            values = [default] * len(self)
+        for index, action in self._extras.items():
+            values[int(index)] = action.get(field, default) if isinstance(action, dict) else default
+        return values
+
+    def indexes_of(self, field, value):
+        """Indexes of the actions whose field holds value"""
+        return [index for index, item in enumerate(self.column(field)) if item == value]
+
+    @property
+    def non_dict_indexes(self):
+        """Indexes of actions that are not dicts at all, which players skip"""
+        return {int(index) for index, action in self._extras.items() if not isinstance(action, dict)}
+
+
+class BinaryMacroFormat:
+    """Compact columnar binary macro format, lossless against the JSON format"""
+
+    @staticmethod
+    def is_binary_macro(filepath):
+        """Check whether a file is a binary macro by its magic bytes"""
+        try:
+            with open(filepath, 'rb') as f:
+                return f.read(len(MAGIC)) == MAGIC
+        except OSError:
+            return False
+
+    @staticmethod
+    def _layout_for(keys):
+        """Column layout for an action key order, or None if the keys are not canonical columns"""
+        layout = []
+        mask = 0
+        position = 0
+        for key in keys:
+            while position < len(COLUMNS) and COLUMNS[position][0] != key:
+                position += 1
+            if position == len(COLUMNS):
+                return None
+            layout.append((position, key, COLUMNS[position][1]))
+            mask |= 1 << position
+            position += 1
+        return mask, layout
+
+    @staticmethod
+    def _encode_actions(actions, count):
+        """Split actions into presence masks, typed columns, a string table and verbatim extras"""
+        columns = [array(_TYPECODES[kind], bytes(array(_TYPECODES[kind]).itemsize * count)) for _, kind in COLUMNS]
+        timestamp_column = [index for index, (_, kind) in enumerate(COLUMNS) if kind == 'ts'][0]
+        timestamps = array('d', bytes(8 * count))
+        masks = array('I', bytes(4 * count))
+        strings = []
+        string_ids = {}
+        extras = {}
+        layouts = {}
+        last_timestamp = 0.0
+        index = -1
+
+        for index, action in enumerate(actions):
+            layout = None
+            if type(action) is dict:
+                keys = tuple(action)
+                if keys not in layouts:
+                    layouts[keys] = BinaryMacroFormat._layout_for(keys)
+                layout = layouts[keys]
+
+            if layout is not None:
+                mask, fields = layout
+                values = []
+                for position, field, kind in fields:
+                    value = action[field]
+                    value_type = type(value)
+                    if kind == 'str':
+                        if value_type is not str:
+                            break
+                        sid = string_ids.get(value)
+                        if sid is None:
+                            sid = string_ids[value] = len(strings)
+                            strings.append(value)
+                        value = sid
+                    elif kind == 'i32':
+                        if value_type is not int or not -2147483648 <= value <= 2147483647:
+                            break
+                    elif value_type is not float:
+                        # f64 and ts columns only take real floats so ints keep their type
+                        break
+                    values.append((position, value))
+                else:
+                    masks[index] = mask
+                    for position, value in values:
+                        if position == timestamp_column:
+                            last_timestamp = value
+                        else:
+                            columns[position][index] = value
+                    timestamps[index] = last_timestamp
+                    continue
+
+            extras[str(index)] = action
+            masks[index] = _EXTRA_BIT
+            timestamps[index] = last_timestamp
+
+        if index != count - 1:
+            raise ValueError(f"Expected {count} actions, got {index + 1}")
+
+        # Delta-encode the raw float64 bit patterns, which keeps timestamps bit-exact
+        bits = array('Q', timestamps.tobytes()).tolist()
+        previous = [0]
+        previous.extend(bits[:-1])
+        columns[timestamp_column] = array('Q', [(b - a) & _UINT64_MASK for a, b in zip(previous, bits)])
+
+        return masks, columns, strings, extras
+
+    @staticmethod
+    def _decode_columns(spec, columns, strings):
+        """Turn the stored columns into indexable value columns, one per field of spec"""
+        values = []
+        for (field, kind), column in zip(spec, columns):
+            if kind == 'ts':
+                # Sum the deltas with wraparound as one masked pass over the running sums
+                bits = array('Q', map(_UINT64_MASK.__and__, accumulate(column)))
+                values.append(array('d', bits.tobytes()))
+            elif kind == 'str' and strings:
+                values.append(list(map(strings.__getitem__, column)))
+            else:
+                # Numeric columns stay typed arrays; indexing them gives plain ints and floats
+                values.append(column)
+        return values
+
+    @staticmethod
+    def dumps(data, actions=None, actions_count=None):
+        """Serialize a macro dict to binary format bytes.
+
+        Actions can be passed separately as an iterable with a known count, in which
+        case data['actions'] only marks their position and they are encoded as they stream by.
+        """
+        if actions is None:
+            actions = data.get('actions', [])
+            actions_count = len(actions)
+        meta = {key: value for key, value in data.items() if key != 'actions'}
+        keys = list(data)
+
+        masks, columns, strings, extras = BinaryMacroFormat._encode_actions(actions, actions_count)
+
+        body_parts = [masks.tobytes()]
+        body_parts.extend(column.tobytes() for column in columns)
+        tables = json.dumps({'strings': strings, 'extras': extras}, separators=(',', ':')).encode('utf-8')
+        body_parts.append(_LENGTH.pack(len(tables)))
+        body_parts.append(tables)
+        body = zlib.compress(b"".join(body_parts), 1)
+
+        header = json.dumps({
+            'meta': meta,
+            'actions_index': keys.index('actions') if 'actions' in data else None,
+            'actions_count': actions_count,
+            'columns': COLUMNS,
+            'byteorder': sys.byteorder
+        }, separators=(',', ':')).encode('utf-8')
+
+        return _PREAMBLE.pack(MAGIC, FORMAT_VERSION, len(header)) + header + body
+
+    @staticmethod
+    def _read_header(f):
+        """Read and check the preamble and JSON header of an open binary macro file"""
+        preamble = f.read(_PREAMBLE.size)
+        if len(preamble) != _PREAMBLE.size:
+            raise ValueError("Truncated binary macro file")
+        magic, version, header_length = _PREAMBLE.unpack(preamble)
+        if magic != MAGIC:
+            raise ValueError("Not a binary macro file")
+        if version != FORMAT_VERSION:
+            raise ValueError(f"Unsupported binary macro version {version}")
+        return json.loads(f.read(header_length).decode('utf-8'))
+
+    @staticmethod
+    def read_header(filepath):
+        """Read only the metadata of a binary macro file"""
+        with open(filepath, 'rb') as f:
+            header = BinaryMacroFormat._read_header(f)
+        return header['meta'], header['actions_count']
+
+    @staticmethod
+    def load(filepath, lazy=False):
+        """Load a binary macro file into the same dict shape as the JSON format.
+
+        With lazy, 'actions' is a ColumnarActions sequence over the decoded columns instead of
+        a list, so no action dict is built until something reads that action.
+        """
+        with open(filepath, 'rb') as f:
+            header = BinaryMacroFormat._read_header(f)
+            body = zlib.decompress(f.read())
+
+        count = header['actions_count']
+        # Decode with the layout the file was written with, so older column sets still load
+        spec = [tuple(column) for column in header['columns']]
+        if any(kind not in _TYPECODES for _, kind in spec):
+            raise ValueError("Binary macro uses an unknown column type")
+
+        offset = 0
+
+        def take(typecode):
+            nonlocal offset
+            column = array(typecode)
+            size = column.itemsize * count
+            column.frombytes(body[offset:offset + size])
+            if header.get('byteorder', sys.byteorder) != sys.byteorder:
+                column.byteswap()
+            offset += size
+            return column
+
+        masks = take('I')
+        columns = [take(_TYPECODES[kind]) for _, kind in spec]
+        tables_length = _LENGTH.unpack_from(body, offset)[0]
+        offset += _LENGTH.size
+        tables = json.loads(body[offset:offset + tables_length].decode('utf-8'))
+
+        values = BinaryMacroFormat._decode_columns(spec, columns, tables['strings'])
+        actions = ColumnarActions(spec, masks, values, tables['extras'])
+        if not lazy:
+            actions = list(actions)
+
+        # Put 'actions' back at its original position among the top-level keys
+        items = list(header['meta'].items())
+        if header['actions_index'] is not None:
+            items.insert(header['actions_index'], ('actions', actions))
+        return dict(items)
+
+    @staticmethod
+    def save(filepath, data, actions=None, actions_count=None):
+        """Write a macro dict to a binary macro file"""
+        with open(filepath, 'wb') as f:
+            f.write(BinaryMacroFormat.dumps(data, actions, actions_count))
+
+    @staticmethod
+    def json_to_binary(source_path, target_path=None):
+        """Convert a JSON macro file to the binary format"""
+        if target_path is None:
+            target_path = os.path.splitext(source_path)[0] + BINARY_EXTENSION
+        with open(source_path, 'r') as f:
+            data = json.load(f)
+        BinaryMacroFormat.save(target_path, data)
+        return target_path
+
+    @staticmethod
+    def binary_to_json(source_path, target_path=None):
+        """Convert a binary macro file back to the JSON format"""
+        if target_path is None:
+            target_path = os.path.splitext(source_path)[0] + JSON_EXTENSION
+        data = BinaryMacroFormat.load(source_path)
+        with open(target_path, 'w') as f:
+            json.dump(data, f, indent=2)
+        return target_path
+
+
+def main(argv=None):
+    """Convert macro files between the JSON and binary formats"""
+    argv = sys.argv[1:] if argv is None else argv
+    if len(argv) < 2 or argv[0] not in ('to-binary', 'to-json'):
+        print("Usage: python macro_format.py to-binary|to-json <macro file> [...]")
+        return 2
+
+    convert = BinaryMacroFormat.json_to_binary if argv[0] == 'to-binary' else BinaryMacroFormat.binary_to_json
+    status = 0
+    for path in argv[1:]:
+        try:
+            print(f"{path} -> {convert(path)}")
+        except Exception as e:
+            print(f"Failed to convert {path}: {e}")
+            status = 1
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,31 +1,79 @@
 import tkinter as tk
 from tkinter import messagebox, scrolledtext, filedialog
-import json
 import os
 import time
-import threading
-from pynput import mouse, keyboard
+import queue
 from datetime import datetime
+from macro_format import BINARY_EXTENSION
+from recording import RecordingJournal, CapturePipeline, PathSimplifier
+from macro_optimizer import MacroOptimizer
+
+# Write-ahead journal the current recording is streamed to
+JOURNAL_PATH = os.path.join("macros", ".recording.jsonl")
+
+# The actions display is refreshed in batches on a fixed tick and keeps a bounded number of lines
+DISPLAY_TICK_MS = 50
+DISPLAY_MAX_LINES = 500
+
+# Mouse movement sampling: never faster than MOVE_MIN_INTERVAL_NS, and slow drifts only once they
+# have covered MOVE_MIN_DISTANCE pixels or MOVE_MAX_INTERVAL_NS has passed
+MOVE_MIN_INTERVAL_NS = 8_000_000
+MOVE_MAX_INTERVAL_NS = 100_000_000
+MOVE_MIN_DISTANCE = 3
+
+# Movement pauses longer than this end a path; paths are simplified to within PATH_TOLERANCE pixels
+MOVE_STROKE_GAP = 0.25
+PATH_TOLERANCE = 2.0
 
 class MacroMaker:
     def __init__(self):
         self.root = tk.Tk()
         self.root.title("Macro Maker - ASTDX")
-        self.root.geometry("600x500")
+        self.root.geometry("600x580")
         self.root.resizable(False, False)
         
         # Initialize variables
-        self.actions = []
+        self.journal = None
         self.recording = False
-        self.start_time = None
+        self.start_ns = None
+        self.capture = None
+        self.movement_enabled = False
         self.mouse_listener = None
         self.keyboard_listener = None
+        self.esc_key = None
+        
+        # Actions waiting to be shown; filled from listener threads, drained on the Tk thread
+        self.display_queue = queue.SimpleQueue()
+        self.displayed_count = 0
+        self.display_lines = 0
+        self.stop_requested = False
         
         # Create macros directory if it doesn't exist
         if not os.path.exists("macros"):
             os.makedirs("macros")
         
         self.setup_ui()
+        self.recover_journal()
+        self.root.after(DISPLAY_TICK_MS, self.process_display_queue)
+        
+    def recover_journal(self):
+        """Offer to recover a recording left behind by a crash"""
+        if not os.path.exists(JOURNAL_PATH):
+            return
+            
+        journal = RecordingJournal.recover(JOURNAL_PATH, tail_size=DISPLAY_MAX_LINES)
+        if journal.is_saved:
+            # Left over from a recording that was saved before the maker closed
+            journal.discard()
+        elif journal.count and messagebox.askyesno(
+            "Recover Recording",
+            f"An unsaved recording with {journal.count} actions was found.\n\nDo you want to recover it?"
+        ):
+            self.journal = journal
+            self.update_actions_display()
+            self.status_label.config(text=f"Recovered {journal.count} actions")
+        else:
+            journal.discard()
         
     def setup_ui(self):
         # Main frame
@@ -79,6 +127,33 @@ class MacroMaker:
         )
         self.save_button.pack(side=tk.LEFT)
         
+        # Save format option
+        self.binary_format = tk.BooleanVar(value=False)
+        binary_check = tk.Checkbutton(
+            main_frame,
+            text="Save in compact binary format",
+            variable=self.binary_format
+        )
+        binary_check.pack(anchor=tk.W)
+        
+        # Movement recording option
+        self.record_movement = tk.BooleanVar(value=False)
+        movement_check = tk.Checkbutton(
+            main_frame,
+            text="Record mouse movement and drags",
+            variable=self.record_movement
+        )
+        movement_check.pack(anchor=tk.W)
+        
+        # Optimization option
+        self.optimize_on_save = tk.BooleanVar(value=True)
+        optimize_check = tk.Checkbutton(
+            main_frame,
+            text="Optimize macro before saving",
+            variable=self.optimize_on_save
+        )
+        optimize_check.pack(anchor=tk.W, pady=(0, 10))
+        
         # Status label
         self.status_label = tk.Label(main_frame, text="Ready to record", font=("Arial", 10))
         self.status_label.pack(pady=(0, 10))
@@ -123,8 +198,14 @@ class MacroMaker:
     
     def start_recording(self):
         self.recording = True
-        self.start_time = time.time()
-        self.actions = []
+        self.stop_requested = False
+        self.start_ns = time.perf_counter_ns()
+        
+        # Stream the new recording to a fresh journal
+        if self.journal:
+            self.journal.discard()
+        self.journal = RecordingJournal(JOURNAL_PATH, tail_size=DISPLAY_MAX_LINES)
+        self.journal.open()
         
         # Update UI
         self.record_button.config(text="Stop Recording", bg="#f44336")
@@ -133,12 +214,29 @@ class MacroMaker:
         self.save_button.config(state=tk.DISABLED)
         
         # Clear actions display
-        self.actions_display.config(state=tk.NORMAL)
-        self.actions_display.delete(1.0, tk.END)
-        self.actions_display.config(state=tk.DISABLED)
+        self.clear_display()
+        
+        # Movement state is only touched by the capture consumer thread
+        self.movement_enabled = self.record_movement.get()
+        self.move_stroke = []
+        self.drag_press = None
+        self.drag_stroke = []
+        self.last_move_ns = 0
+        self.last_move_xy = (0, 0)
+        
+        # Hook callbacks only buffer raw events; the capture consumer turns them into actions
+        self.capture = CapturePipeline(self.normalize_event, self.add_action, finish=self.finish_capture)
+        self.capture.start()
+        
+        # pynput is only imported once recording starts, so the window opens without it
+        from pynput import mouse, keyboard
+        self.esc_key = keyboard.Key.esc
         
         # Start listeners
-        self.mouse_listener = mouse.Listener(on_click=self.on_click)
+        if self.movement_enabled:
+            self.mouse_listener = mouse.Listener(on_click=self.on_click, on_move=self.on_move)
+        else:
+            self.mouse_listener = mouse.Listener(on_click=self.on_click)
         self.keyboard_listener = keyboard.Listener(
             on_press=self.on_key_press,
             on_release=self.on_key_release
@@ -148,11 +246,7 @@ class MacroMaker:
         self.keyboard_listener.start()
         
         # Add initial wait action
-        self.add_action({
-            "type": "wait",
-            "duration": 1.0,
-            "timestamp": time.time() - self.start_time
-        })
+        self.capture.push(time.perf_counter_ns(), "wait", 1.0)
         
     def stop_recording(self):
         self.recording = False
@@ -163,91 +257,290 @@ class MacroMaker:
         if self.keyboard_listener:
             self.keyboard_listener.stop()
         
+        # Process everything already captured, then flush it to the journal
+        self.capture.stop()
+        self.journal.close()
+        
         # Update UI
+        stats = self.capture.summary()
         self.record_button.config(text="Start Recording", bg="#4CAF50")
-        self.status_label.config(text="Recording stopped", fg="black")
+        self.status_label.config(
+            text=(
+                f"Recording stopped ({stats['dropped']} dropped, {stats['late']} late, "
+                f"p99 hook overhead {stats['push_p99_ns'] / 1000:.0f}us)"
+            ),
+            fg="black"
+        )
         self.clear_button.config(state=tk.NORMAL)
         self.save_button.config(state=tk.NORMAL)
         
-        self.update_actions_display()
+        self.flush_display_queue()
         
     def on_click(self, x, y, button, pressed):
+        captured_ns = time.perf_counter_ns()
         if not self.recording:
             return
             
-        if pressed:  # Only record on press, not release
-            current_time = time.time()
-            action = {
+        if pressed:
+            self.capture.push(captured_ns, "click", x, y, button)
+        elif self.movement_enabled:  # Releases only matter for telling drags from clicks
+            self.capture.push(captured_ns, "release", x, y, button)
+            
+    def on_move(self, x, y):
+        captured_ns = time.perf_counter_ns()
+        if not self.recording:
+            return
+            
+        # Adaptive rate limit: fast movements are sampled densely, slow drifts sparsely
+        elapsed = captured_ns - self.last_move_ns
+        if elapsed < MOVE_MIN_INTERVAL_NS:
+            return
+        dx = x - self.last_move_xy[0]
+        dy = y - self.last_move_xy[1]
+        if elapsed < MOVE_MAX_INTERVAL_NS and dx * dx + dy * dy < MOVE_MIN_DISTANCE * MOVE_MIN_DISTANCE:
+            return
+            
+        self.last_move_ns = captured_ns
+        self.last_move_xy = (x, y)
+        self.capture.push(captured_ns, "move", x, y)
+            
+    def on_key_press(self, key):
+        captured_ns = time.perf_counter_ns()
+        if self.recording:
+            self.capture.push(captured_ns, "key_press", key)
+            
+    def normalize_event(self, captured_ns, kind, payload):
+        """Turn a raw captured event into actions; runs on the capture consumer thread"""
+        if self.stop_requested:
+            return []
+            
+        # Monotonic timestamps are immune to wall-clock adjustments during recording
+        timestamp = (captured_ns - self.start_ns) / 1e9
+        
+        if kind == "click":
+            x, y, button = payload
+            if self.movement_enabled:
+                # Whether this is a click or the start of a drag is decided on release
+                actions = self.flush_move_stroke()
+                self.drag_press = (x, y, button.name, timestamp)
+                self.drag_stroke = []
+                return actions
+                
+            return [{
                 "type": "click",
                 "x": x,
                 "y": y,
                 "button": button.name,
-                "timestamp": current_time - self.start_time
-            }
-            self.add_action(action)
+                "timestamp": timestamp
+            }]
             
-    def on_key_press(self, key):
-        if not self.recording:
-            return
+        if kind == "release":
+            x, y, _ = payload
+            return self.finish_press(x, y, timestamp)
             
-        # Stop recording on ESC
-        if key == keyboard.Key.esc:
-            self.stop_recording()
-            return
+        if kind == "move":
+            x, y = payload
+            if self.drag_press:
+                self.drag_stroke.append((x, y, timestamp))
+                return []
+                
+            actions = []
+            if self.move_stroke and timestamp - self.move_stroke[-1][2] > MOVE_STROKE_GAP:
+                actions = self.flush_move_stroke()
+            self.move_stroke.append((x, y, timestamp))
+            return actions
             
-        current_time = time.time()
+        if kind == "key_press":
+            key, = payload
+            
+            # Stop recording on ESC; the Tk thread picks the request up on its next tick
+            if key == self.esc_key:
+                self.recording = False
+                self.stop_requested = True
+                return []
+                
+            try:
+                # Handle special keys
+                if hasattr(key, 'name'):
+                    key_name = key.name
+                else:
+                    key_name = key.char
+            except AttributeError:
+                key_name = str(key)
+                
+            actions = self.flush_move_stroke()
+            actions.append({
+                "type": "key_press",
+                "key": key_name,
+                "timestamp": timestamp
+            })
+            return actions
+            
+        if kind == "wait":
+            duration, = payload
+            return [{
+                "type": "wait",
+                "duration": duration,
+                "timestamp": timestamp
+            }]
+            
+        return []
+        
+    def flush_move_stroke(self):
+        """Simplify the pending hover path into move actions"""
+        points = PathSimplifier.simplify(self.move_stroke, PATH_TOLERANCE)
+        self.move_stroke = []
+        return [
+            {"type": "move", "x": x, "y": y, "timestamp": timestamp}
+            for x, y, timestamp in points
+        ]
+        
+    def finish_press(self, x, y, timestamp):
+        """Emit a click, or a simplified drag if the mouse moved while the button was held"""
+        if not self.drag_press:
+            return []
+            
+        press_x, press_y, button, press_timestamp = self.drag_press
+        self.drag_press = None
         
-        try:
-            # Handle special keys
-            if hasattr(key, 'name'):
-                key_name = key.name
-            else:
-                key_name = key.char
-        except AttributeError:
-            key_name = str(key)
+        if not self.drag_stroke:
+            return [{
+                "type": "click",
+                "x": press_x,
+                "y": press_y,
+                "button": button,
+                "timestamp": press_timestamp
+            }]
             
-        action = {
-            "type": "key_press",
-            "key": key_name,
-            "timestamp": current_time - self.start_time
-        }
-        self.add_action(action)
+        path = [(press_x, press_y, press_timestamp)] + self.drag_stroke + [(x, y, timestamp)]
+        self.drag_stroke = []
+        points = PathSimplifier.simplify(path, PATH_TOLERANCE)
+        
+        actions = []
+        for i, (point_x, point_y, point_timestamp) in enumerate(points):
+            state = "down" if i == 0 else "up" if i == len(points) - 1 else "move"
+            actions.append({
+                "type": "drag",
+                "x": point_x,
+                "y": point_y,
+                "button": button,
+                "state": state,
+                "timestamp": point_timestamp
+            })
+        return actions
+        
+    def finish_capture(self):
+        """Emit whatever movement is still pending when capture stops"""
+        actions = self.flush_move_stroke()
+        if self.drag_press:
+            # Treat a button still held at the end as released where the mouse last was
+            if self.drag_stroke:
+                x, y, timestamp = self.drag_stroke[-1]
+            else:
+                x, y, _, timestamp = self.drag_press
+            actions.extend(self.finish_press(x, y, timestamp))
+        return actions
         
     def on_key_release(self, key):
         # We don't record key releases for simplicity
         pass
         
     def add_action(self, action):
-        self.actions.append(action)
-        self.update_actions_display()
+        self.journal.append(action)
+        self.display_queue.put(action)
+        
+    def format_action(self, number, action):
+        """Format a single action as a line of the actions display"""
+        if action["type"] == "click":
+            return f"{number}. Click {action['button']} at ({action['x']}, {action['y']}) [+{action['timestamp']:.2f}s]\n"
+        elif action["type"] == "key_press":
+            return f"{number}. Press key '{action['key']}' [+{action['timestamp']:.2f}s]\n"
+        elif action["type"] == "wait":
+            return f"{number}. Wait {action['duration']}s [+{action['timestamp']:.2f}s]\n"
+        elif action["type"] == "move":
+            return f"{number}. Move to ({action['x']}, {action['y']}) [+{action['timestamp']:.2f}s]\n"
+        elif action["type"] == "drag":
+            return f"{number}. Drag {action['button']} {action['state']} at ({action['x']}, {action['y']}) [+{action['timestamp']:.2f}s]\n"
+        else:
+            return f"{number}. Unknown action [+{action['timestamp']:.2f}s]\n"
+        
+    def process_display_queue(self):
+        """Periodic Tk-thread tick that applies stop requests and queued display updates"""
+        if self.stop_requested:
+            self.stop_recording()
+            self.stop_requested = False
+            
+        self.flush_display_queue()
+        self.root.after(DISPLAY_TICK_MS, self.process_display_queue)
+        
+    def flush_display_queue(self):
+        """Append all queued actions to the display in one batch"""
+        pending = []
+        while True:
+            try:
+                pending.append(self.display_queue.get_nowait())
+            except queue.Empty:
+                break
+                
+        if not pending:
+            return
+            
+        first_number = self.displayed_count + 1
+        self.displayed_count += len(pending)
+        
+        # Lines that would scroll straight out of the bounded view are never rendered
+        if len(pending) > DISPLAY_MAX_LINES:
+            first_number += len(pending) - DISPLAY_MAX_LINES
+            pending = pending[-DISPLAY_MAX_LINES:]
+            
+        text = "".join(self.format_action(first_number + i, action) for i, action in enumerate(pending))
         
-    def update_actions_display(self):
         self.actions_display.config(state=tk.NORMAL)
-        self.actions_display.delete(1.0, tk.END)
+        self.actions_display.insert(tk.END, text)
+        self.display_lines += len(pending)
         
-        for i, action in enumerate(self.actions):
-            if action["type"] == "click":
-                text = f"{i+1}. Click {action['button']} at ({action['x']}, {action['y']}) [+{action['timestamp']:.2f}s]\n"
-            elif action["type"] == "key_press":
-                text = f"{i+1}. Press key '{action['key']}' [+{action['timestamp']:.2f}s]\n"
-            elif action["type"] == "wait":
-                text = f"{i+1}. Wait {action['duration']}s [+{action['timestamp']:.2f}s]\n"
-            else:
-                text = f"{i+1}. Unknown action [+{action['timestamp']:.2f}s]\n"
-                
-            self.actions_display.insert(tk.END, text)
+        excess = self.display_lines - DISPLAY_MAX_LINES
+        if excess > 0:
+            self.actions_display.delete("1.0", f"{excess + 1}.0")
+            self.display_lines -= excess
             
+        self.actions_display.see(tk.END)
         self.actions_display.config(state=tk.DISABLED)
         
-    def clear_actions(self):
-        self.actions = []
+    def clear_display(self):
+        """Empty the actions display and drop anything still queued for it"""
+        while True:
+            try:
+                self.display_queue.get_nowait()
+            except queue.Empty:
+                break
+                
+        self.displayed_count = 0
+        self.display_lines = 0
         self.actions_display.config(state=tk.NORMAL)
         self.actions_display.delete(1.0, tk.END)
         self.actions_display.config(state=tk.DISABLED)
+        
+    def update_actions_display(self):
+        """Re-render the display from the journal's in-memory tail"""
+        self.clear_display()
+        
+        if self.journal:
+            # Only the most recent actions are kept in memory; the rest live in the journal
+            self.displayed_count = self.journal.count - len(self.journal.tail)
+            for action in self.journal.tail:
+                self.display_queue.put(action)
+            self.flush_display_queue()
+        
+    def clear_actions(self):
+        if self.journal:
+            self.journal.discard()
+            self.journal = None
+        self.clear_display()
         self.status_label.config(text="Actions cleared")
         
     def save_macro(self):
-        if not self.actions:
+        if not self.journal or not self.journal.count:
             messagebox.showwarning("No Actions", "No actions recorded to save.")
             return
             
@@ -258,22 +551,29 @@ class MacroMaker:
             
         # Clean filename
         macro_name = "".join(c for c in macro_name if c.isalnum() or c in (' ', '-', '_')).rstrip()
-        filename = f"{macro_name}.json"
+        extension = BINARY_EXTENSION if self.binary_format.get() else ".json"
+        filename = f"{macro_name}{extension}"
         filepath = os.path.join("macros", filename)
         
-        # Create macro data
-        macro_data = {
-            "name": macro_name,
-            "created": datetime.now().isoformat(),
-            "actions": self.actions,
-            "total_duration": max(action["timestamp"] for action in self.actions) if self.actions else 0
-        }
+        optimizer = MacroOptimizer() if self.optimize_on_save.get() else None
         
         try:
-            with open(filepath, 'w') as f:
-                json.dump(macro_data, f, indent=2)
+            # Compact the journal into the macro file without loading it into memory
+            self.journal.write_macro(
+                filepath,
+                macro_name,
+                datetime.now().isoformat(),
+                binary=self.binary_format.get(),
+                transform=optimizer.optimize_stream if optimizer else None
+            )
+            # The journal stays until the next recording or Clear, so the recording can be saved
+            # again under another name or format; it is only no longer offered for recovery
+            self.journal.mark_saved()
             
-            messagebox.showinfo("Success", f"Macro saved as {filename}")
+            message = f"Macro saved as {filename}"
+            if optimizer:
+                message += "\n\n" + MacroOptimizer.format_report("Optimized", optimizer.report)
+            messagebox.showinfo("Success", message)
             self.status_label.config(text=f"Macro saved: {filename}")
             
         except Exception as e:
@@ -0,0 +1,228 @@
+import sys
+import heapq
+import argparse
+
+from utils import MacroUtils
+from backup_store import BackupStore
+
+
+class MacroOptimizer:
+    """Normalizes recorded actions into a sorted, minimal plan before save or playback"""
+
+    KNOWN_TYPES = ('click', 'key_press', 'wait', 'move', 'drag')
+
+    def __init__(self, gap_threshold=0.005, repeat_window=0.04, reorder_window=256, precision=6):
+        # Gaps shorter than gap_threshold are snapped to zero, identical key presses within
+        # repeat_window are dropped, and out-of-order actions are resorted within reorder_window
+        # actions (None sorts everything at once)
+        self.gap_threshold = gap_threshold
+        self.repeat_window = repeat_window
+        self.reorder_window = reorder_window
+        self.precision = precision
+        self.report = None
+
+    @staticmethod
+    def estimate_runtime(actions):
+        """Playback time as the AHK runner schedules it: timestamp gaps plus wait durations"""
+        last_timestamp = 0.0
+        wait_total = 0.0
+        for action in actions:
+            if not isinstance(action, dict):
+                continue
+            last_timestamp = max(last_timestamp, action.get('timestamp', 0))
+            if action.get('type') == 'wait':
+                wait_total += action.get('duration', 0)
+        return last_timestamp + wait_total
+
+    def _sorted(self, actions, report):
+        """Yield playable actions in timestamp order using a bounded reorder buffer"""
+        heap = []
+        sequence = 0
+        highest_seen = None
+        last_yielded = None
+
+        for action in actions:
+            report['actions_before'] += 1
+            if not isinstance(action, dict) or action.get('type') not in self.KNOWN_TYPES:
+                report['noops_dropped'] += 1
+                continue
+            timestamp = action.get('timestamp')
+            if type(timestamp) not in (int, float):
+                report['noops_dropped'] += 1
+                continue
+
+            if highest_seen is not None and timestamp < highest_seen:
+                report['reordered'] += 1
+            highest_seen = timestamp if highest_seen is None else max(highest_seen, timestamp)
+
+            heapq.heappush(heap, (timestamp, sequence, action))
+            sequence += 1
+            if self.reorder_window is not None and len(heap) > self.reorder_window:
+                last_yielded = self._pop(heap, last_yielded)
+                yield last_yielded
+
+        while heap:
+            last_yielded = self._pop(heap, last_yielded)
+            yield last_yielded
+
+    @staticmethod
+    def _pop(heap, last_yielded):
+        timestamp, _, action = heapq.heappop(heap)
+        # An action older than the reorder window is clamped rather than replayed out of order
+        if last_yielded is not None and timestamp < last_yielded['timestamp']:
+            action = dict(action)
+            action['timestamp'] = last_yielded['timestamp']
+        return action
+
+    def _is_repeat(self, previous, action, timestamp):
+        """Whether an action only repeats the previous one"""
+        if previous['type'] != action['type']:
+            return False
+        if action['type'] == 'key_press':
+            return (previous.get('key') == action.get('key')
+                    and timestamp - previous['timestamp'] <= self.repeat_window)
+        if action['type'] == 'move':
+            return previous.get('x') == action.get('x') and previous.get('y') == action.get('y')
+        return False
+
+    def optimize_stream(self, actions):
+        """Optimize an iterable of actions lazily; self.report is complete once it is exhausted"""
+        report = self.report = {
+            'actions_before': 0,
+            'actions_after': 0,
+            'runtime_before': 0.0,
+            'runtime_after': 0.0,
+            'noops_dropped': 0,
+            'repeats_dropped': 0,
+            'waits_merged': 0,
+            'gaps_snapped': 0,
+            'reordered': 0
+        }
+        before_last = before_waits = 0.0
+        after_last = after_waits = 0.0
+        origin = None
+        previous = None
+        pending_wait = None
+
+        for action in self._sorted(actions, report):
+            source_timestamp = action['timestamp']
+            before_last = max(before_last, source_timestamp)
+            if origin is None:
+                # Only negative timestamps are shifted; the lead-in before the first action is kept
+                origin = min(source_timestamp, 0)
+            timestamp = round(source_timestamp - origin, self.precision)
+
+            if action['type'] == 'wait':
+                duration = action.get('duration', 0)
+                before_waits += duration
+                if duration <= 0:
+                    report['noops_dropped'] += 1
+                elif pending_wait:
+                    pending_wait['duration'] += duration
+                    report['waits_merged'] += 1
+                else:
+                    pending_wait = {'type': 'wait', 'duration': duration, 'timestamp': timestamp}
+                continue
+
+            # Bursts of near-zero gaps fire together instead of paying a sleep each
+            if previous is not None and 0 < timestamp - previous['timestamp'] < self.gap_threshold:
+                timestamp = previous['timestamp']
+                report['gaps_snapped'] += 1
+
+            if pending_wait is None and previous is not None and self._is_repeat(previous, action, timestamp):
+                report['repeats_dropped'] += 1
+                continue
+
+            if pending_wait:
+                # The synthetic lead-in wait only delays playback by however much it outlasts the
+                # gap before the first action; later waits add their full duration on top of the
+                # following gap at playback, so they are kept as they are
+                if previous is None:
+                    extra = round(pending_wait['timestamp'] + pending_wait['duration'] - timestamp, self.precision)
+                    pending_wait['duration'] = extra
+                if pending_wait['duration'] > 0:
+                    after_waits += pending_wait['duration']
+                    report['actions_after'] += 1
+                    yield pending_wait
+                else:
+                    report['waits_merged'] += 1
+                pending_wait = None
+
+            optimized = dict(action)
+            optimized['timestamp'] = timestamp
+            after_last = max(after_last, timestamp)
+            report['actions_after'] += 1
+            previous = optimized
+            yield optimized
+
+        if pending_wait:
+            after_last = max(after_last, pending_wait['timestamp'])
+            after_waits += pending_wait['duration']
+            report['actions_after'] += 1
+            yield pending_wait
+
+        report['runtime_before'] = before_last + before_waits
+        report['runtime_after'] = after_last + after_waits
+
+    def optimize(self, actions):
+        """Optimize a list of actions, returning the new list and the savings report"""
+        window = self.reorder_window
+        self.reorder_window = None
+        try:
+            optimized = list(self.optimize_stream(actions))
+        finally:
+            self.reorder_window = window
+        return optimized, self.report
+
+    def optimize_macro_file(self, filepath, write=False, backup_store=None):
+        """Optimize a macro file, rewriting it in its own format (after a backup) when write is set"""
+        data = MacroUtils.load_macro_data(filepath)
+        actions, report = self.optimize(data.get('actions', []))
+
+        if write:
+            success, message = MacroUtils.backup_macro(filepath, backup_store)
+            if not success:
+                raise Exception(message)
+            data['actions'] = actions
+            # total_duration is the recorded span, the last timestamp, as the recorder writes it
+            # and the validator checks it; wait durations on top of it are playback time, which
+            # estimate_runtime and the report's runtime figures account for
+            data['total_duration'] = max((action['timestamp'] for action in actions), default=0)
+            MacroUtils.save_macro_data(filepath, data)
+
+        return report
+
+    @staticmethod
+    def format_report(name, report):
+        """One-line summary of what an optimization saved"""
+        saved_actions = report['actions_before'] - report['actions_after']
+        saved_runtime = report['runtime_before'] - report['runtime_after']
+        return (
+            f"{name}: {report['actions_before']} -> {report['actions_after']} actions (-{saved_actions}), "
+            f"{report['runtime_before']:.2f}s -> {report['runtime_after']:.2f}s (-{saved_runtime:.2f}s)"
+        )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Optimize recorded macros and report the savings")
+    parser.add_argument("macros", nargs="+", help="macro files to optimize")
+    parser.add_argument("--write", action="store_true", help="rewrite the files in place after backing them up")
+    parser.add_argument("--gap-threshold", type=float, default=0.005, help="snap gaps shorter than this (seconds)")
+    parser.add_argument("--repeat-window", type=float, default=0.04, help="drop identical key presses within this (seconds)")
+    args = parser.parse_args(argv)
+
+    optimizer = MacroOptimizer(gap_threshold=args.gap_threshold, repeat_window=args.repeat_window)
+    backup_store = BackupStore()
+    status = 0
+    for path in args.macros:
+        try:
+            report = optimizer.optimize_macro_file(path, write=args.write, backup_store=backup_store)
+            print(MacroOptimizer.format_report(path, report))
+        except Exception as e:
+            print(f"Failed to optimize {path}: {e}")
+            status = 1
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,323 @@
+import os
+import sys
+import mmap
+import struct
+import hashlib
+import argparse
+
+from utils import MacroUtils
+from macro_optimizer import MacroOptimizer
+from playback import PlaybackSpeed
+
+# Compiled plans are plain text, one tab-separated step per line after a short header:
+#
+#   ASTDX-PLAN  <version>
+#   name        <macro name>
+#   actions     <step count>
+#   duration    <seconds>
+#   <delay ms>  C  <x>  <y>  <button>          click
+#   <delay ms>  K  <AHK send string>           key press, already resolved for Send
+#   <delay ms>  M  <x>  <y>                    mouse move
+#   <delay ms>  D  <x>  <y>  <button>  <D|U|M> drag press, release or held move
+#   <delay ms>  W  <duration ms>               explicit wait
+#
+# Steps are pre-sorted and the delay is how long to sleep before the step, so the runner
+# only iterates lines. Delays come from the absolute schedule, so rounding never accumulates.
+PLAN_VERSION = 1
+PLAN_EXTENSION = ".plan"
+PLAN_DIRECTORY = ".plans"
+
+# Every plan has a seek index beside it (<plan>.idx): little-endian uint64 pairs of (byte
+# offset of the step's line, scheduled ms of the step) for every PLAN_INDEX_STRIDE-th step.
+# Resuming at a step or a time then reads one index entry and at most a stride of lines.
+PLAN_INDEX_EXTENSION = ".idx"
+PLAN_INDEX_STRIDE = 256
+_INDEX_ENTRY = struct.Struct("<QQ")
+
+# Action type of each step op code, for reading the runner's timing output back
+PLAN_OP_TYPES = {'C': 'click', 'K': 'key_press', 'M': 'move', 'D': 'drag', 'W': 'wait'}
+
+# Maker key names that need a different AHK key name
+_AHK_KEY_NAMES = {
+    'space': 'Space', 'enter': 'Enter', 'tab': 'Tab', 'backspace': 'BackSpace',
+    'delete': 'Delete', 'insert': 'Insert', 'shift': 'Shift', 'shift_l': 'LShift',
+    'shift_r': 'RShift', 'ctrl': 'Ctrl', 'ctrl_l': 'LCtrl', 'ctrl_r': 'RCtrl',
+    'alt': 'Alt', 'alt_l': 'LAlt', 'alt_r': 'RAlt', 'alt_gr': 'RAlt', 'cmd': 'LWin',
+    'cmd_l': 'LWin', 'cmd_r': 'RWin', 'up': 'Up', 'down': 'Down', 'left': 'Left',
+    'right': 'Right', 'home': 'Home', 'end': 'End', 'page_up': 'PgUp',
+    'page_down': 'PgDn', 'escape': 'Escape', 'esc': 'Escape', 'caps_lock': 'CapsLock',
+    'num_lock': 'NumLock', 'scroll_lock': 'ScrollLock', 'print_screen': 'PrintScreen',
+    'pause': 'Pause', 'menu': 'AppsKey'
+}
+
+# Characters Send would treat as modifiers or syntax unless braced
+_AHK_SPECIAL_CHARS = set('+^!#{}')
+_CONTROL_CHARS = {'\t': '{Tab}', '\n': '{Enter}', '\r': '{Enter}'}
+
+
+# Plans are read back in text mode, where \r also ends a line, so no field may hold one
+_FIELD_BREAKS = str.maketrans('\t\n\r', '   ')
+
+
+def _plain(field):
+    """A field's text with tabs and line breaks turned into spaces"""
+    return str(field).translate(_FIELD_BREAKS)
+
+
+class MacroPlan:
+    """Ahead-of-time compilation of macros into the runner's line-oriented plan format"""
+
+    @staticmethod
+    def resolve_key(key):
+        """Translate a recorded key name into an AHK Send string"""
+        if len(key) == 1:
+            if key in _CONTROL_CHARS:
+                return _CONTROL_CHARS[key]
+            return "{" + key + "}" if key in _AHK_SPECIAL_CHARS else key
+        if key in _AHK_KEY_NAMES:
+            return "{" + _AHK_KEY_NAMES[key] + "}"
+        if key[0] == 'f' and key[1:].isdigit():
+            return "{F" + key[1:] + "}"
+        return "{" + key.replace("\t", "") + "}"
+
+    @staticmethod
+    def _step_fields(action):
+        """Op code and arguments of one action, or None for actions the runner ignores"""
+        action_type = action.get('type')
+        if action_type == 'click':
+            return ['C', action['x'], action['y'], action.get('button', 'left')]
+        if action_type == 'key_press':
+            return ['K', MacroPlan.resolve_key(str(action['key']))]
+        if action_type == 'move':
+            return ['M', action['x'], action['y']]
+        if action_type == 'drag':
+            state = {'down': 'D', 'up': 'U'}.get(action.get('state'), 'M')
+            return ['D', action['x'], action['y'], action.get('button', 'left'), state]
+        if action_type == 'wait':
+            return ['W', int(round(action.get('duration', 0) * 1000))]
+        return None
+
+    @staticmethod
+    def compile_actions(actions):
+        """Turn actions into (delay_ms, fields) steps, scheduled the way the AHK runner plays JSON"""
+        ordered = sorted(
+            (action for action in actions if isinstance(action, dict)),
+            key=lambda action: action.get('timestamp', 0)
+        )
+        steps = []
+        last_timestamp = 0.0
+        elapsed_ms = 0.0
+        emitted_ms = 0
+        pending_wait_ms = 0
+
+        for action in ordered:
+            fields = MacroPlan._step_fields(action)
+            timestamp = action.get('timestamp', 0)
+            if timestamp > last_timestamp:
+                elapsed_ms += (timestamp - last_timestamp) * 1000
+                last_timestamp = timestamp
+
+            if fields is None:
+                continue
+
+            target_ms = int(round(elapsed_ms)) + pending_wait_ms
+            steps.append((target_ms - emitted_ms, fields))
+            emitted_ms = target_ms
+
+            # The runner sleeps through a wait step itself, after its delay
+            if fields[0] == 'W':
+                pending_wait_ms += fields[1]
+                emitted_ms += fields[1]
+
+        return steps
+
+    @staticmethod
+    def render(name, steps):
+        """Render compiled steps as plan text"""
+        total_ms = sum(delay for delay, _ in steps) + sum(fields[1] for _, fields in steps if fields[0] == 'W')
+        lines = [
+            f"ASTDX-PLAN\t{PLAN_VERSION}",
+            f"name\t{_plain(name)}",
+            f"actions\t{len(steps)}",
+            f"duration\t{total_ms / 1000:.3f}"
+        ]
+        for delay, fields in steps:
+            lines.append("\t".join(_plain(field) for field in [delay] + fields))
+        return "\n".join(lines) + "\n"
+
+    @staticmethod
+    def build_index(data, steps):
+        """Seek index bytes for the rendered plan data of the given steps"""
+        entries = []
+        position = 0
+        for _ in range(4):
+            position = data.index(b"\n", position) + 1
+        scheduled_ms = 0
+        for number, (delay, fields) in enumerate(steps):
+            scheduled_ms += delay
+            if number % PLAN_INDEX_STRIDE == 0:
+                entries.append(_INDEX_ENTRY.pack(position, scheduled_ms))
+            position = data.index(b"\n", position) + 1
+            if fields[0] == 'W':
+                scheduled_ms += fields[1]
+        return b"".join(entries)
+
+    @staticmethod
+    def seek(plan_path, step=None, time_ms=None):
+        """Locate a step to resume a plan at: the given step, or the first one scheduled at or after time_ms.
+
+        Returns (step index, byte offset of its line, its scheduled ms), or None past the end.
+        """
+        index_path = plan_path + PLAN_INDEX_EXTENSION
+        count = os.path.getsize(index_path) // _INDEX_ENTRY.size
+        if count == 0:
+            return None
+
+        with open(index_path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as index:
+            if step is not None:
+                entry = step // PLAN_INDEX_STRIDE
+                if entry >= count:
+                    return None
+            else:
+                # Last entry scheduled at or before the target time
+                low, high = 0, count
+                while high - low > 1:
+                    middle = (low + high) // 2
+                    if _INDEX_ENTRY.unpack_from(index, middle * _INDEX_ENTRY.size)[1] <= time_ms:
+                        low = middle
+                    else:
+                        high = middle
+                entry = low
+            position, scheduled_ms = _INDEX_ENTRY.unpack_from(index, entry * _INDEX_ENTRY.size)
+
+        number = entry * PLAN_INDEX_STRIDE
+        with open(plan_path, 'rb') as f:
+            f.seek(position)
+            line = f.readline()
+            while line:
+                if number == step or (step is None and scheduled_ms >= time_ms):
+                    return number, position, scheduled_ms
+                fields = line.split(b"\t", 3)
+                if fields[1] == b"W":
+                    scheduled_ms += int(fields[2])
+                position += len(line)
+                number += 1
+                line = f.readline()
+                if line:
+                    scheduled_ms += int(line.split(b"\t", 1)[0])
+        return None
+
+    @staticmethod
+    def read_header(plan_path):
+        """Header fields of a plan, without reading its steps"""
+        header = {}
+        with open(plan_path, 'r', encoding='utf-8') as f:
+            for _ in range(4):
+                parts = f.readline().rstrip("\n").split("\t")
+                header[parts[0]] = parts[1] if len(parts) > 1 else ""
+        return header
+
+    @staticmethod
+    def read(plan_path):
+        """Parse a plan file back into its header and (delay_ms, fields) steps"""
+        header = {}
+        steps = []
+        with open(plan_path, 'r', encoding='utf-8') as f:
+            for line_number, line in enumerate(f):
+                parts = line.rstrip("\n").split("\t")
+                if line_number < 4:
+                    header[parts[0]] = parts[1]
+                    continue
+                steps.append((int(parts[0]), parts[1:]))
+        if header.get('ASTDX-PLAN') != str(PLAN_VERSION):
+            raise ValueError(f"Unsupported plan file: {plan_path}")
+        return header, steps
+
+    @staticmethod
+    def plan_path_for(macro_path, optimize=False, speed=None):
+        """Cache path of a macro's plan, keyed by the hash of its content and compile options"""
+        digest = hashlib.sha1()
+        digest.update(f"{PLAN_VERSION}:{int(optimize)}:".encode('utf-8'))
+        if speed is not None and not speed.is_normal:
+            digest.update(f"{speed.factor}:{speed.turbo_delay}:".encode('utf-8'))
+        with open(macro_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                digest.update(chunk)
+
+        directory = os.path.join(os.path.dirname(os.path.abspath(macro_path)), PLAN_DIRECTORY)
+        prefix = MacroPlan._plan_prefix(macro_path, optimize, speed)
+        return os.path.join(directory, f"{prefix}{digest.hexdigest()[:16]}{PLAN_EXTENSION}")
+
+    @staticmethod
+    def _plan_prefix(macro_path, optimize, speed=None):
+        """File name prefix shared by every cached plan of one macro, compile mode and speed,
+        e.g. 'farm.json.raw.1x.' or 'farm.json.opt.2x-t50.'; stale cleanup only touches its own"""
+        tag = "1x"
+        if speed is not None:
+            tag = f"{speed.factor:g}x"
+            if speed.turbo_delay is not None:
+                tag += f"-t{speed.turbo_delay * 1000:g}"
+        return f"{os.path.basename(macro_path)}.{'opt' if optimize else 'raw'}.{tag}."
+
+    @staticmethod
+    def compile_file(macro_path, optimize=False, speed=None):
+        """Compile a macro file to its cached plan, reusing the cache when the content is unchanged.
+
+        speed, a PlaybackSpeed, retimes the recorded gaps before they are baked into the delays.
+        """
+        plan_path = MacroPlan.plan_path_for(macro_path, optimize, speed)
+        index_path = plan_path + PLAN_INDEX_EXTENSION
+        if os.path.exists(plan_path) and os.path.exists(index_path):
+            return plan_path
+
+        data = MacroUtils.load_macro_data(macro_path)
+        actions = data.get('actions', [])
+        if optimize:
+            actions, _ = MacroOptimizer().optimize(actions)
+        if speed is not None:
+            actions = speed.apply(actions)
+        name = data.get('name', os.path.splitext(os.path.basename(macro_path))[0])
+        steps = MacroPlan.compile_actions(actions)
+        # Written as bytes so the index offsets hold on every platform's newline convention
+        data = MacroPlan.render(name, steps).encode('utf-8')
+        index = MacroPlan.build_index(data, steps)
+
+        directory = os.path.dirname(plan_path)
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+
+        # Drop stale plans of the same macro, mode and speed before writing the new one
+        prefix = MacroPlan._plan_prefix(macro_path, optimize, speed)
+        for filename in os.listdir(directory):
+            if filename.startswith(prefix) and filename.endswith((PLAN_EXTENSION, PLAN_INDEX_EXTENSION)):
+                os.remove(os.path.join(directory, filename))
+
+        # The index goes first: a plan without its index is never taken from the cache
+        for path, content in ((index_path, index), (plan_path, data)):
+            temp_path = path + ".tmp"
+            with open(temp_path, 'wb') as f:
+                f.write(content)
+            os.replace(temp_path, path)
+        return plan_path
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compile macros into cached plans for the AHK runner")
+    parser.add_argument("macros", nargs="+", help="macro files to compile")
+    parser.add_argument("--optimize", action="store_true", help="run the macro optimizer before compiling")
+    PlaybackSpeed.add_arguments(parser)
+    args = parser.parse_args(argv)
+
+    speed = PlaybackSpeed.from_args(args)
+    status = 0
+    for path in args.macros:
+        try:
+            print(MacroPlan.compile_file(path, optimize=args.optimize, speed=speed))
+        except Exception as e:
+            print(f"Failed to compile {path}: {e}")
+            status = 1
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
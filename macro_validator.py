@@ -0,0 +1,311 @@
+import os
+import sys
+import json
+import time
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+
+from utils import MacroUtils, MacroIndex
+from backup_store import BackupStore
+
+# Fields every action type needs on top of 'type' and 'timestamp', with the original messages
+ACTION_SCHEMA = {
+    'click': [(('x', 'y'), "Click action {i} missing coordinates"), (('button',), "Click action {i} missing button field")],
+    'key_press': [(('key',), "Key press action {i} missing key field")],
+    'wait': [(('duration',), "Wait action {i} missing duration field")],
+    'move': [(('x', 'y'), "Move action {i} missing coordinates")],
+    'drag': [(('x', 'y'), "Drag action {i} missing coordinates"), (('button',), "Drag action {i} missing button field")]
+}
+
+# Fields that must hold plain numbers when present
+NUMERIC_FIELDS = ('timestamp', 'x', 'y', 'duration')
+DRAG_STATES = frozenset(('down', 'move', 'up'))
+
+_NUMBER_TYPES = (int, float)
+
+
+def _compile_schema(schema):
+    """Flatten the schema into one required-key set per action type for the fast path"""
+    compiled = {}
+    for action_type, rules in schema.items():
+        required = {'type', 'timestamp'}
+        for fields, _ in rules:
+            required.update(fields)
+        compiled[action_type] = frozenset(required)
+    return compiled
+
+
+_REQUIRED_KEYS = _compile_schema(ACTION_SCHEMA)
+
+
+class MacroValidator:
+    """Validates whole macro libraries, reporting every problem per file and optionally repairing them"""
+
+    def __init__(self, fix=False, max_errors=50, backup_store=None):
+        # Errors beyond max_errors in one file are only counted, so broken giants stay readable;
+        # every fix is backed up into one store, shared by the worker processes
+        self.fix = fix
+        self.max_errors = max_errors
+        self.backup_store = backup_store or BackupStore()
+
+    def _action_errors(self, i, action):
+        """Slow path: every error of one action that failed the fast check"""
+        if not isinstance(action, dict):
+            return [f"Action {i} is not a dictionary"]
+        errors = []
+        if 'type' not in action:
+            errors.append(f"Action {i} missing 'type' field")
+        if 'timestamp' not in action:
+            errors.append(f"Action {i} missing 'timestamp' field")
+        for fields, message in ACTION_SCHEMA.get(action.get('type'), ()):
+            if any(field not in action for field in fields):
+                errors.append(message.format(i=i))
+        if action.get('type') == 'drag' and action.get('state') not in DRAG_STATES:
+            errors.append(f"Drag action {i} has invalid state field")
+        for field in NUMERIC_FIELDS:
+            if field in action and type(action[field]) not in _NUMBER_TYPES:
+                errors.append(f"Action {i} field '{field}' is not a number")
+        return errors
+
+    def check_actions(self, actions):
+        """Return (errors, error_count, warnings) for an actions list"""
+        errors = []
+        error_count = 0
+        unknown_types = set()
+        unsorted = 0
+        previous_timestamp = None
+        required_keys = _REQUIRED_KEYS
+        number_types = _NUMBER_TYPES
+
+        for i, action in enumerate(actions):
+            # Fast path: a subset test against the precompiled key set plus plain type checks
+            required = required_keys.get(action.get('type')) if type(action) is dict else None
+            if (required is not None and required <= action.keys()
+                    and type(action['timestamp']) in number_types
+                    and all(type(action[field]) in number_types for field in NUMERIC_FIELDS[1:] if field in action)
+                    and (action['type'] != 'drag' or action.get('state') in DRAG_STATES)):
+                timestamp = action['timestamp']
+            elif type(action) is dict and isinstance(action.get('type'), str) and action['type'] not in required_keys:
+                # Unknown types are skipped by both runners, so they are only a warning
+                unknown_types.add(str(action['type']))
+                timestamp = action.get('timestamp')
+                if type(timestamp) not in number_types:
+                    continue
+            else:
+                action_errors = self._action_errors(i, action)
+                error_count += len(action_errors)
+                room = self.max_errors - len(errors)
+                if room > 0:
+                    errors.extend(action_errors[:room])
+                timestamp = action.get('timestamp') if type(action) is dict else None
+                if type(timestamp) not in number_types:
+                    continue
+
+            if previous_timestamp is not None and timestamp < previous_timestamp:
+                unsorted += 1
+            else:
+                previous_timestamp = timestamp
+
+        warnings = []
+        if unknown_types:
+            warnings.append(f"Unknown action types: {', '.join(sorted(unknown_types))}")
+        if unsorted:
+            warnings.append(f"{unsorted} actions are out of timestamp order")
+        return errors, error_count, warnings
+
+    @staticmethod
+    def repair_actions(actions):
+        """Fix common issues, editing the action dicts in place; returns (actions, list of fixes applied)"""
+        fixes = []
+        repaired = [action for action in actions if isinstance(action, dict)]
+        if len(repaired) != len(actions):
+            fixes.append(f"dropped {len(actions) - len(repaired)} non-object actions")
+
+        missing_button = 0
+        for action in repaired:
+            if action.get('type') in ('click', 'drag') and 'button' not in action:
+                action['button'] = 'left'
+                missing_button += 1
+        if missing_button:
+            fixes.append(f"set missing button to 'left' on {missing_button} actions")
+
+        timestamps = [action.get('timestamp') for action in repaired]
+        if all(type(timestamp) in _NUMBER_TYPES for timestamp in timestamps):
+            if any(later < earlier for earlier, later in zip(timestamps, timestamps[1:])):
+                # Stable, so simultaneous actions keep their recorded order
+                repaired.sort(key=lambda action: action['timestamp'])
+                fixes.append("sorted actions by timestamp")
+
+        return repaired, fixes
+
+    def validate_file(self, filepath):
+        """Validate one macro file, repairing it if it fails and fixing is enabled; returns a result dict"""
+        result = {
+            'file': filepath,
+            'valid': False,
+            'errors': [],
+            'error_count': 0,
+            'warnings': [],
+            'fixes': []
+        }
+        try:
+            data = MacroUtils.load_macro_data(filepath)
+        except json.JSONDecodeError as e:
+            result['errors'] = [f"Invalid JSON: {str(e)}"]
+            result['error_count'] = 1
+            return result
+        except Exception as e:
+            result['errors'] = [f"Error validating file: {str(e)}"]
+            result['error_count'] = 1
+            return result
+
+        if not isinstance(data, dict) or 'actions' not in data:
+            result['errors'] = ["Missing 'actions' field"]
+            result['error_count'] = 1
+            return result
+        if not isinstance(data['actions'], list):
+            result['errors'] = ["'actions' must be a list"]
+            result['error_count'] = 1
+            return result
+
+        errors, error_count, warnings = self._check(data)
+        if error_count and self.fix:
+            # Only files that failed are repaired; valid ones are never rewritten
+            fixes = self._repair(data)
+            if fixes:
+                try:
+                    result['backup'] = self._write(filepath, data)
+                    result['fixes'] = fixes
+                    errors, error_count, warnings = self._check(data)
+                except Exception as e:
+                    errors.append(f"Failed to write fixes: {str(e)}")
+                    error_count += 1
+
+        result['errors'].extend(errors)
+        result['error_count'] += error_count
+        result['warnings'] = warnings
+        result['valid'] = result['error_count'] == 0
+        return result
+
+    def _check(self, data):
+        """check_actions plus the file-level checks; returns (errors, error_count, warnings)"""
+        errors, error_count, warnings = self.check_actions(data['actions'])
+        if data.get('actions_count', len(data['actions'])) != len(data['actions']):
+            # A stale count would show the wrong size in the macro list
+            errors.insert(0, f"'actions_count' is {data['actions_count']} but there are {len(data['actions'])} actions")
+            error_count += 1
+        return errors, error_count, warnings
+
+    def _repair(self, data):
+        """Repair a macro dict in place; returns the list of fixes applied"""
+        actions, fixes = self.repair_actions(data['actions'])
+        total_duration = max(
+            (action['timestamp'] for action in actions if type(action.get('timestamp')) in _NUMBER_TYPES),
+            default=0
+        )
+        if data.get('total_duration') != total_duration:
+            fixes.append(f"recomputed total_duration ({data.get('total_duration')} -> {total_duration})")
+        if data.get('actions_count', len(actions)) != len(actions):
+            fixes.append(f"recomputed actions_count ({data['actions_count']} -> {len(actions)})")
+        if fixes:
+            data['actions'] = actions
+            data['total_duration'] = total_duration
+            if 'actions_count' in data:
+                data['actions_count'] = len(actions)
+        return fixes
+
+    def _write(self, filepath, data):
+        """Rewrite a macro in its own format after backing it up; returns the backup's name"""
+        success, message = MacroUtils.backup_macro(filepath, self.backup_store)
+        if not success:
+            raise Exception(message)
+        MacroUtils.save_macro_data(filepath, data)
+        return message
+
+    @staticmethod
+    def collect_files(paths):
+        """Expand files and directories into the macro files to check"""
+        files = []
+        for path in paths:
+            if os.path.isdir(path):
+                for filename in sorted(os.listdir(path)):
+                    if filename.startswith('.') or not filename.endswith(MacroIndex.MACRO_EXTENSIONS):
+                        continue
+                    files.append(os.path.join(path, filename))
+            else:
+                files.append(path)
+        return files
+
+    def validate_many(self, filepaths, jobs=None):
+        """Validate files across a process pool and return the structured summary"""
+        start = time.perf_counter()
+        jobs = jobs or os.cpu_count() or 1
+
+        if jobs == 1 or len(filepaths) < 2 * jobs:
+            results = [self.validate_file(filepath) for filepath in filepaths]
+        else:
+            # Several chunks per worker keeps the pool balanced when file sizes vary
+            chunksize = max(1, len(filepaths) // (jobs * 8))
+            with ProcessPoolExecutor(max_workers=jobs) as pool:
+                results = list(pool.map(self.validate_file, filepaths, chunksize=chunksize))
+
+        return {
+            'files': len(results),
+            'valid': sum(1 for result in results if result['valid']),
+            'invalid': sum(1 for result in results if not result['valid']),
+            'with_warnings': sum(1 for result in results if result['warnings']),
+            'fixed': sum(1 for result in results if result['fixes']),
+            'jobs': jobs,
+            'elapsed': time.perf_counter() - start,
+            'results': results
+        }
+
+    @staticmethod
+    def format_summary(summary, verbose=False):
+        """Human-readable summary, listing every file with errors (and warnings when verbose)"""
+        lines = []
+        for result in summary['results']:
+            if result['valid'] and not result['fixes'] and not (verbose and result['warnings']):
+                continue
+            lines.append(f"{result['file']}: {'OK' if result['valid'] else 'INVALID'}")
+            for fix in result['fixes']:
+                lines.append(f"  fixed: {fix}")
+            if result['fixes']:
+                lines.append(f"  backup: {result['backup']}")
+            for error in result['errors']:
+                lines.append(f"  error: {error}")
+            hidden = result['error_count'] - len(result['errors'])
+            if hidden > 0:
+                lines.append(f"  ... and {hidden} more errors")
+            if verbose:
+                for warning in result['warnings']:
+                    lines.append(f"  warning: {warning}")
+        lines.append(
+            f"{summary['files']} files: {summary['valid']} valid, {summary['invalid']} invalid, "
+            f"{summary['fixed']} fixed, {summary['with_warnings']} with warnings "
+            f"({summary['elapsed']:.2f}s on {summary['jobs']} workers)"
+        )
+        return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Validate (and optionally repair) macro files in bulk")
+    parser.add_argument("paths", nargs="*", default=["macros"], help="macro files or directories (default: macros)")
+    parser.add_argument("--jobs", type=int, default=None, help="worker processes (default: one per CPU)")
+    parser.add_argument("--fix", action="store_true", help="repair files that fail validation (missing buttons, non-object actions, stale "
+                        "counts), backing each one up first")
+    parser.add_argument("--json", action="store_true", help="print the summary as JSON")
+    parser.add_argument("--verbose", action="store_true", help="also list warnings")
+    args = parser.parse_args(argv)
+
+    validator = MacroValidator(fix=args.fix)
+    summary = validator.validate_many(MacroValidator.collect_files(args.paths), jobs=args.jobs)
+    if args.json:
+        print(json.dumps(summary, indent=2))
+    else:
+        print(MacroValidator.format_summary(summary, verbose=args.verbose))
+    return 0 if summary['invalid'] == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,234 @@
+import os
+import sys
+import time
+import errno
+import select
+import struct
+import argparse
+import threading
+
+from utils import MacroIndex
+
+# inotify event masks (linux/inotify.h)
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+
+_WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_TO | IN_MOVED_FROM | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF
+_EVENT_HEADER = struct.Struct("iIII")
+
+
+class _InotifyBackend:
+    """Linux inotify through libc, reporting changed file names; raises OSError when unavailable"""
+
+    def __init__(self, directory):
+        import ctypes
+        import ctypes.util
+
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self._fd = libc.inotify_init1(os.O_NONBLOCK | getattr(os, 'O_CLOEXEC', 0))
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        if libc.inotify_add_watch(self._fd, os.fsencode(directory), _WATCH_MASK) < 0:
+            error = ctypes.get_errno()
+            os.close(self._fd)
+            raise OSError(error, f"inotify_add_watch failed for {directory}")
+
+    def wait(self, timeout):
+        """Names touched within timeout seconds; None means events were lost and a rescan is needed"""
+        readable, _, _ = select.select([self._fd], [], [], timeout)
+        if not readable:
+            return set()
+        try:
+            data = os.read(self._fd, 64 * 1024)
+        except OSError as e:
+            if e.errno == errno.EAGAIN:
+                return set()
+            raise
+
+        names = set()
+        offset = 0
+        while offset + _EVENT_HEADER.size <= len(data):
+            _, mask, _, length = _EVENT_HEADER.unpack_from(data, offset)
+            offset += _EVENT_HEADER.size
+            name = data[offset:offset + length].rstrip(b"\0")
+            offset += length
+            if mask & (IN_Q_OVERFLOW | IN_DELETE_SELF | IN_MOVE_SELF | IN_IGNORED):
+                return None
+            if name:
+                names.add(os.fsdecode(name))
+        return names
+
+    def close(self):
+        os.close(self._fd)
+
+
+class _PollingBackend:
+    """Portable fallback: reports names whose stat changed between polls"""
+
+    def __init__(self, directory, interval=1.0):
+        self.interval = interval
+        self._directory = directory
+        self._snapshot = DirectoryWatcher.snapshot(directory)
+
+    def wait(self, timeout):
+        time.sleep(min(timeout, self.interval))
+        snapshot = DirectoryWatcher.snapshot(self._directory)
+        previous = self._snapshot
+        self._snapshot = snapshot
+        return {name for name in snapshot.keys() | previous.keys() if snapshot.get(name) != previous.get(name)}
+
+    def close(self):
+        pass
+
+
+class DirectoryWatcher:
+    """Watches one directory and reports debounced created/modified/deleted events for macro files.
+
+    Uses inotify on Linux and stat-diff polling elsewhere (or when inotify is unavailable).
+    on_events is called from the watcher thread with a list of (kind, filename) tuples once
+    no further change has arrived for debounce seconds, so a burst of writes to the same
+    files is delivered as one batch with one event per file.
+    """
+
+    def __init__(self, directory, on_events, extensions=MacroIndex.MACRO_EXTENSIONS, debounce=0.3,
+                 poll_interval=1.0, use_inotify=True):
+        self.directory = directory
+        self.on_events = on_events
+        self.extensions = extensions
+        self.debounce = debounce
+        self.poll_interval = poll_interval
+        self.use_inotify = use_inotify
+        self.backend_name = None
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    @staticmethod
+    def snapshot(directory):
+        """{filename: (mtime_ns, size)} for the files in a directory"""
+        result = {}
+        try:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    try:
+                        stat = entry.stat()
+                    except OSError:
+                        continue
+                    result[entry.name] = (stat.st_mtime_ns, stat.st_size)
+        except OSError:
+            pass
+        return result
+
+    def _relevant(self, filename):
+        return not filename.startswith('.') and filename.endswith(self.extensions)
+
+    def _make_backend(self):
+        if self.use_inotify and sys.platform.startswith('linux'):
+            try:
+                backend = _InotifyBackend(self.directory)
+                self.backend_name = "inotify"
+                return backend
+            except (OSError, AttributeError):
+                pass
+        self.backend_name = "polling"
+        return _PollingBackend(self.directory, self.poll_interval)
+
+    def start(self):
+        """Start watching on a daemon thread"""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop_event.clear()
+        backend = self._make_backend()
+        self._thread = threading.Thread(target=self._watch_loop, args=(backend,), daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join(timeout=2)
+            self._thread = None
+
+    def _watch_loop(self, backend):
+        # Files known to exist, to tell created from modified; kept in step with delivered events
+        known = {name: stat for name, stat in self.snapshot(self.directory).items() if self._relevant(name)}
+        touched = set()
+        deadline = None
+        try:
+            while not self._stop_event.is_set():
+                timeout = self.poll_interval if deadline is None else max(0.0, deadline - time.monotonic())
+                names = backend.wait(timeout)
+                if names is None:
+                    # Events were lost: diff the whole directory instead
+                    names = set(known) | set(self.snapshot(self.directory))
+                names = {name for name in names if self._relevant(name)}
+                if names:
+                    touched |= names
+                    deadline = time.monotonic() + self.debounce
+                    continue
+                if deadline is None or time.monotonic() < deadline:
+                    continue
+
+                events = self._classify(touched, known)
+                touched = set()
+                deadline = None
+                if events:
+                    try:
+                        self.on_events(events)
+                    except Exception as e:
+                        print(f"Directory watcher callback failed: {e}")
+        finally:
+            backend.close()
+
+    def _classify(self, names, known):
+        """Turn touched names into events by comparing with what existed before the burst"""
+        events = []
+        for name in sorted(names):
+            try:
+                stat = os.stat(os.path.join(self.directory, name))
+                current = (stat.st_mtime_ns, stat.st_size)
+            except OSError:
+                current = None
+            previous = known.get(name)
+            if current is None:
+                if previous is not None:
+                    del known[name]
+                    events.append(('deleted', name))
+            elif previous is None:
+                known[name] = current
+                events.append(('created', name))
+            elif previous != current:
+                known[name] = current
+                events.append(('modified', name))
+        return events
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Print debounced change events for a macros directory")
+    parser.add_argument("directory", nargs="?", default="macros")
+    parser.add_argument("--debounce", type=float, default=0.3)
+    parser.add_argument("--poll", action="store_true", help="use stat polling instead of inotify")
+    args = parser.parse_args(argv)
+
+    def print_events(events):
+        for kind, name in events:
+            print(f"{kind:<9} {name}", flush=True)
+        print(f"-- {len(events)} events", flush=True)
+
+    watcher = DirectoryWatcher(args.directory, print_events, debounce=args.debounce, use_inotify=not args.poll)
+    watcher.start()
+    print(f"Watching {args.directory} with {watcher.backend_name} (Ctrl+C to stop)", flush=True)
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        watcher.stop()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
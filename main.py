@@ -1,39 +1,75 @@
 import tkinter as tk
 from tkinter import messagebox, ttk
-import json
 import os
 import subprocess
-import requests
 import threading
+import queue
 from datetime import datetime
-import tempfile
-import shutil
+from utils import MacroIndex, MacroHandle
+from macro_executor import MacroExecutor, AHK_SCRIPT_URL
+from run_report import RunReport
+from macro_browser import MacroBrowser, MacroSearchIndex
+from macro_watcher import DirectoryWatcher
+from checkpoints import CheckpointStore
+from playback import PlaybackSpeed, TURBO_DELAY_MS
+
+# How often the Tk thread applies widget updates queued by worker threads
+UI_TICK_MS = 50
+# Quiet seconds after a selection before it is prepared, so scrolling through the table
+# prepares only the macro it stops on
+SELECTION_SETTLE = 0.15
 
 class MacroRunner:
     def __init__(self):
         self.root = tk.Tk()
         self.root.title("Macro Runner - ASTDX")
-        self.root.geometry("500x400")
+        self.root.geometry("560x585")
         self.root.resizable(False, False)
         
         # GitHub URL for AHK script
-        self.ahk_script_url = "https://raw.githubusercontent.com/Quincyzx/Astdx/main/astdx_macro_runner.ahk"
+        self.ahk_script_url = AHK_SCRIPT_URL
         
         # Create macros directory if it doesn't exist
         if not os.path.exists("macros"):
             os.makedirs("macros")
         
-        # AutoHotkey executable paths (common locations)
-        self.ahk_paths = [
-            r"C:\Program Files\AutoHotkey\AutoHotkey.exe",
-            r"C:\Program Files (x86)\AutoHotkey\AutoHotkey.exe",
-            r"C:\AutoHotkey\AutoHotkey.exe",
-            "autohotkey.exe",  # If in PATH
-            "ahk.exe"  # Alternative name
-        ]
+        # Persistent metadata index so refreshes only re-parse changed files; it is loaded
+        # by the first background refresh so the window can paint first
+        self.macro_index = None
+        # Loaded macros by file name, and the search index behind the macro table
+        self.macros = {}
+        self.search_index = MacroSearchIndex()
+        self._loader = None
+        
+        # Watches the macros directory once the first load is done; the lock keeps the
+        # watcher's incremental index updates apart from full refreshes
+        self.watcher = None
+        self.index_lock = threading.Lock()
+        
+        # Shared with the command line: script updates, AutoHotkey lookup, plan compiling and
+        # the persistent runner worker for the Python engine (started on first use)
+        self.executor = MacroExecutor()
+        self.script_updater = self.executor.script_updater
+        self.runner_client = self.executor.runner_client
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
+        
+        # Widget updates from worker threads are queued here and applied on the Tk thread
+        self.ui_queue = queue.SimpleQueue()
+        self.cancel_event = threading.Event()
+        # Looping arguments of the run in progress, None for a single run
+        self.run_loop = None
+        # Latest selection waiting for the selection loader (checkpoint read, runner cache warm-up);
+        # a newer selection replaces one not yet picked up
+        self._selection_request = None
+        self._selection_ready = threading.Condition()
+        self._selection_loader = None
+        self._closing = False
         
         self.setup_ui()
-        self.load_macros()
+        
+        # Populate the macro list once the window is up
+        self.root.after_idle(self.load_macros)
+        self.root.after(UI_TICK_MS, self.process_ui_queue)
         
     def setup_ui(self):
         # Main frame
@@ -52,23 +88,15 @@ class MacroRunner:
         list_label = tk.Label(selection_frame, text="Available Macros:", font=("Arial", 12, "bold"))
         list_label.pack(anchor=tk.W, pady=(0, 5))
         
-        # Macro listbox with scrollbar
-        listbox_frame = tk.Frame(selection_frame)
-        listbox_frame.pack(fill=tk.BOTH, expand=True)
-        
-        scrollbar = tk.Scrollbar(listbox_frame)
-        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
-        
-        self.macro_listbox = tk.Listbox(
-            listbox_frame,
-            yscrollcommand=scrollbar.set,
-            font=("Arial", 10)
+        # Searchable macro table; only the visible rows are rendered, so large libraries stay fast.
+        # Double-click or Enter runs the macro
+        self.macro_browser = MacroBrowser(
+            selection_frame,
+            self.search_index,
+            on_select=self.on_macro_select,
+            on_activate=lambda key: self.run_selected_macro()
         )
-        self.macro_listbox.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
-        scrollbar.config(command=self.macro_listbox.yview)
-        
-        # Bind double-click to run macro
-        self.macro_listbox.bind('<Double-1>', lambda e: self.run_selected_macro())
+        self.macro_browser.pack(fill=tk.BOTH, expand=True)
         
         # Macro info frame
         info_frame = tk.Frame(main_frame)
@@ -79,12 +107,77 @@ class MacroRunner:
             text="Select a macro to see details",
             font=("Arial", 9),
             justify=tk.LEFT,
-            wraplength=460
+            wraplength=520
         )
         self.info_label.pack(anchor=tk.W)
         
-        # Bind selection change to show info
-        self.macro_listbox.bind('<<ListboxSelect>>', self.on_macro_select)
+        # Playback engine selection
+        engine_frame = tk.Frame(main_frame)
+        engine_frame.pack(fill=tk.X, pady=(0, 10))
+        
+        engine_label = tk.Label(engine_frame, text="Playback engine:", font=("Arial", 9))
+        engine_label.pack(side=tk.LEFT)
+        
+        self.engine_var = tk.StringVar(value="ahk")
+        tk.Radiobutton(engine_frame, text="AutoHotkey", variable=self.engine_var, value="ahk").pack(side=tk.LEFT)
+        tk.Radiobutton(engine_frame, text="Python", variable=self.engine_var, value="python").pack(side=tk.LEFT)
+        
+        # Optimize the actions (sorted, merged waits, dropped repeats) before they are played
+        self.optimize_var = tk.BooleanVar(value=False)
+        tk.Checkbutton(engine_frame, text="Optimize", variable=self.optimize_var).pack(side=tk.RIGHT)
+        
+        # Write a per-action timing report (reports/*.jsonl) for each run
+        self.report_var = tk.BooleanVar(value=False)
+        tk.Checkbutton(engine_frame, text="Timing report", variable=self.report_var).pack(side=tk.RIGHT)
+        
+        # Playback speed: a factor for the recorded gaps, and turbo mode that caps every gap at a
+        # minimum safe delay; explicit waits always keep their length
+        speed_frame = tk.Frame(main_frame)
+        speed_frame.pack(fill=tk.X, pady=(0, 10))
+        
+        tk.Label(speed_frame, text="Speed:", font=("Arial", 9)).pack(side=tk.LEFT)
+        self.speed_var = tk.StringVar(value="1")
+        tk.Spinbox(
+            speed_frame, textvariable=self.speed_var, width=5,
+            values=("0.25", "0.5", "1", "1.5", "2", "3", "4", "5")
+        ).pack(side=tk.LEFT, padx=(5, 0))
+        tk.Label(speed_frame, text="x", font=("Arial", 9)).pack(side=tk.LEFT)
+        
+        self.turbo_var = tk.BooleanVar(value=False)
+        tk.Checkbutton(
+            speed_frame, text="Turbo, min gap (ms):", variable=self.turbo_var
+        ).pack(side=tk.LEFT, padx=(15, 0))
+        self.turbo_delay_var = tk.StringVar(value=str(TURBO_DELAY_MS))
+        tk.Spinbox(
+            speed_frame, textvariable=self.turbo_delay_var, from_=0, to=1000, increment=10, width=5
+        ).pack(side=tk.LEFT)
+        
+        for variable in (self.speed_var, self.turbo_var, self.turbo_delay_var, self.optimize_var):
+            variable.trace_add('write', lambda *args: self.refresh_selected_info())
+        
+        # Looping: the engine replays the macro it already loaded, with no restart or confirmation
+        # between iterations; a time limit of 0 means none
+        repeat_frame = tk.Frame(main_frame)
+        repeat_frame.pack(fill=tk.X, pady=(0, 10))
+        
+        tk.Label(repeat_frame, text="Repeat:", font=("Arial", 9)).pack(side=tk.LEFT)
+        self.repeat_var = tk.StringVar(value="1")
+        tk.Spinbox(
+            repeat_frame, textvariable=self.repeat_var, from_=0, to=9999, width=5
+        ).pack(side=tk.LEFT, padx=(5, 0))
+        tk.Label(repeat_frame, text="times (0 = until stopped)", font=("Arial", 9)).pack(side=tk.LEFT)
+        
+        tk.Label(repeat_frame, text="Gap (s):", font=("Arial", 9)).pack(side=tk.LEFT, padx=(15, 0))
+        self.repeat_gap_var = tk.StringVar(value="0")
+        tk.Spinbox(
+            repeat_frame, textvariable=self.repeat_gap_var, from_=0, to=3600, increment=0.5, width=5
+        ).pack(side=tk.LEFT)
+        
+        tk.Label(repeat_frame, text="For (min):", font=("Arial", 9)).pack(side=tk.LEFT, padx=(15, 0))
+        self.repeat_for_var = tk.StringVar(value="0")
+        tk.Spinbox(
+            repeat_frame, textvariable=self.repeat_for_var, from_=0, to=1440, increment=5, width=5
+        ).pack(side=tk.LEFT)
         
         # Control buttons frame
         control_frame = tk.Frame(main_frame)
@@ -133,17 +226,30 @@ class MacroRunner:
         self.status_label = tk.Label(main_frame, text="Ready", font=("Arial", 10))
         self.status_label.pack(pady=(0, 10))
         
-        # Progress bar
-        self.progress = ttk.Progressbar(main_frame, mode='indeterminate')
-        self.progress.pack(fill=tk.X, pady=(0, 10))
+        # Progress bar with the cancel button for the run in progress
+        progress_frame = tk.Frame(main_frame)
+        progress_frame.pack(fill=tk.X, pady=(0, 10))
+        
+        self.cancel_button = tk.Button(progress_frame, text="Cancel", command=self.cancel_run, state=tk.DISABLED)
+        self.cancel_button.pack(side=tk.RIGHT, padx=(10, 0))
+        
+        # Continue a stopped or timed-out run from its checkpoint; enabled when the selected macro has one
+        self.resume_button = tk.Button(
+            progress_frame, text="Resume", command=lambda: self.run_selected_macro(resume=True), state=tk.DISABLED
+        )
+        self.resume_button.pack(side=tk.RIGHT, padx=(10, 0))
+        
+        self.progress = ttk.Progressbar(progress_frame, mode='indeterminate')
+        self.progress.pack(side=tk.LEFT, fill=tk.X, expand=True)
         
         # Instructions
         instructions = (
             "Instructions:\n"
-            "1. Select a macro from the list above\n"
+            "1. Select a macro from the list above (type to search, click a column to sort)\n"
             "2. Click 'Run Selected Macro' or double-click the macro name\n"
             "3. The macro will be executed using AutoHotkey\n"
-            "4. Use 'Refresh List' to reload available macros\n"
+            "4. The list follows the macros folder; 'Refresh List' rescans it fully\n"
+            "   Stopped or timed-out runs can continue with 'Resume'\n"
             "5. Use 'Update AHK Script' to download the latest execution script"
         )
         
@@ -152,56 +258,125 @@ class MacroRunner:
             text=instructions,
             font=("Arial", 8),
             justify=tk.LEFT,
-            wraplength=460
+            wraplength=520
         )
         instructions_label.pack()
         
     def load_macros(self):
-        """Load available macros from the macros directory"""
-        self.macro_listbox.delete(0, tk.END)
+        """Refresh the macro index in the background and fill the list when it is done"""
+        if self._loader and self._loader.is_alive():
+            return
+            
+        self.status_label.config(text="Loading macros...")
+        self.refresh_button.config(state=tk.DISABLED)
+        
+        result = {}
+        
+        def load_thread():
+            try:
+                with self.index_lock:
+                    if self.macro_index is None:
+                        self.macro_index = MacroIndex("macros")
+                    self.macro_index.refresh()
+            except Exception as e:
+                result['error'] = e
+                
+        self._loader = threading.Thread(target=load_thread, daemon=True)
+        self._loader.start()
+        self.root.after(20, self._poll_macro_loader, result)
+        
+    def _poll_macro_loader(self, result):
+        """Tk-thread poll that waits for the background refresh to finish"""
+        if self._loader.is_alive():
+            self.root.after(20, self._poll_macro_loader, result)
+            return
+            
+        self.refresh_button.config(state=tk.NORMAL)
+        if 'error' in result:
+            self.status_label.config(text="Failed to load macros")
+            messagebox.showerror("Error", f"Failed to load macros: {str(result['error'])}")
+            return
+        self.populate_macro_list()
+        self.start_watcher()
+        
+    def populate_macro_list(self):
+        """Fill the macro table from the refreshed index"""
         self.macros = {}
         
-        try:
-            macro_files = [f for f in os.listdir("macros") if f.endswith('.json')]
+        with self.index_lock:
+            entries = list(self.macro_index.entries.items())
             
-            if not macro_files:
-                self.macro_listbox.insert(tk.END, "No macros found")
-                self.status_label.config(text="No macros found. Use Macro Maker to create some.")
-                return
+        for filename, entry in entries:
+            if 'error' in entry:
+                print(f"Error loading macro {filename}: {entry['error']}")
+                continue
                 
-            for filename in macro_files:
-                filepath = os.path.join("macros", filename)
-                try:
-                    with open(filepath, 'r') as f:
-                        macro_data = json.load(f)
-                    
-                    macro_name = macro_data.get('name', filename.replace('.json', ''))
-                    self.macros[macro_name] = {
-                        'file': filename,
-                        'data': macro_data
-                    }
-                    self.macro_listbox.insert(tk.END, macro_name)
-                    
-                except Exception as e:
-                    print(f"Error loading macro {filename}: {e}")
-                    continue
-                    
-            self.status_label.config(text=f"Loaded {len(self.macros)} macros")
+            self.macros[filename] = {
+                'name': entry['name'],
+                'file': filename,
+                'handle': MacroHandle(os.path.join("macros", filename), header=entry),
+                'predicted': {}
+            }
             
-        except Exception as e:
-            messagebox.showerror("Error", f"Failed to load macros: {str(e)}")
-            
-    def on_macro_select(self, event):
-        """Display information about the selected macro"""
-        selection = self.macro_listbox.curselection()
-        if not selection:
+        self.search_index.set_entries({filename: macro['handle'].header for filename, macro in self.macros.items()})
+        self.macro_browser.refresh()
+        
+        if not self.macros:
+            self.status_label.config(text="No macros found. Use Macro Maker to create some.")
             return
+        self.status_label.config(text=f"Loaded {len(self.macros)} macros")
             
-        macro_name = self.macro_listbox.get(selection[0])
-        if macro_name in self.macros:
-            macro_data = self.macros[macro_name]['data']
+    def start_watcher(self):
+        """Follow changes to the macros directory from now on (inotify, or polling as a fallback)"""
+        if self.watcher is None:
+            self.watcher = DirectoryWatcher("macros", self.on_macro_events)
+            self.watcher.start()
             
-            created = macro_data.get('created', 'Unknown')
+    def on_macro_events(self, events):
+        """Watcher thread: re-read only the changed files, then update the table on the Tk thread"""
+        with self.index_lock:
+            added, changed, removed = self.macro_index.update([filename for _, filename in events])
+            changes = [(filename, self.macro_index.entries.get(filename)) for filename in added + changed + removed]
+        if changes:
+            self.call_in_ui(self.apply_macro_changes, changes)
+            
+    def apply_macro_changes(self, changes):
+        """Apply incremental index changes to the macro table (Tk thread)"""
+        selected = self.macro_browser.selected()
+        for filename, entry in changes:
+            if entry is None or 'error' in entry:
+                self.macros.pop(filename, None)
+                self.search_index.remove(filename)
+                continue
+            self.macros[filename] = {
+                'name': entry['name'],
+                'file': filename,
+                'handle': MacroHandle(os.path.join("macros", filename), header=entry),
+                'predicted': {}
+            }
+            self.search_index.upsert(filename, entry)
+            
+        self.macro_browser.refresh()
+        if selected in (filename for filename, _ in changes):
+            if selected in self.macros:
+                self.on_macro_select(selected)
+            else:
+                self.info_label.config(text="Select a macro to see details")
+        self.status_label.config(text=f"Loaded {len(self.macros)} macros ({len(changes)} updated)")
+        
+    def on_macro_select(self, key):
+        """Display information about the selected macro and get it ready to run in the background"""
+        if key in self.macros:
+            self.show_macro_info(key)
+            self.prepare_selection(key)
+            
+    def show_macro_info(self, key):
+        """Fill the info panel from the macro's header and what the selection loader found (Tk thread)"""
+        if key in self.macros:
+            macro_name = self.macros[key]['name']
+            macro_info = self.macros[key]['handle'].header
+            
+            created = macro_info.get('created', 'Unknown')
             if created != 'Unknown':
                 try:
                     created_dt = datetime.fromisoformat(created)
@@ -209,8 +384,8 @@ class MacroRunner:
                 except:
                     pass
                     
-            actions_count = len(macro_data.get('actions', []))
-            duration = macro_data.get('total_duration', 0)
+            actions_count = macro_info.get('actions_count', 0)
+            duration = macro_info.get('total_duration', 0)
             
             info_text = (
                 f"Macro: {macro_name}\n"
@@ -219,125 +394,440 @@ class MacroRunner:
                 f"Duration: {duration:.2f} seconds"
             )
             
+            speed = self.current_speed()
+            if speed is None:
+                info_text += "\nPredicted: invalid speed settings"
+            elif speed.key in self.macros[key]['predicted']:
+                info_text += f"\nPredicted: {self.macros[key]['predicted'][speed.key]:.2f} seconds at {speed}"
+            else:
+                info_text += "\nPredicted: calculating..."
+                self.predict_runtime(key, speed)
+            
+            last_run = self.macros[key].get('last_run')
+            if last_run:
+                info_text += (
+                    f"\nLast run: {last_run['elapsed']:.2f} seconds at {last_run['speed']} "
+                    f"(predicted {last_run['predicted']:.2f})"
+                )
+            
+            checkpoint = self.macros[key].get('checkpoint')
+            if checkpoint:
+                mode = ", optimized" if checkpoint['optimize'] else ""
+                info_text += f"\nCheckpoint: {CheckpointStore.describe(checkpoint)}, {checkpoint['engine']} engine{mode}"
+            
             self.info_label.config(text=info_text)
+            running = str(self.run_button.cget('state')) == tk.DISABLED
+            self.resume_button.config(state=tk.NORMAL if checkpoint and not running else tk.DISABLED)
+            
+    def prepare_selection(self, key):
+        """Hand the selection to the selection loader, replacing any selection it has not started on"""
+        speed = self.current_speed()
+        # Warm the runner worker's cache too, so a Python-engine run starts immediately
+        warm = (self.optimize_var.get(), speed) if self.engine_var.get() == "python" and speed is not None else None
+        with self._selection_ready:
+            self._selection_request = (key, self.macros[key]['handle'].filepath, warm)
+            self._selection_ready.notify()
+        if self._selection_loader is None:
+            self._selection_loader = threading.Thread(target=self._selection_loop, name="Selection loader", daemon=True)
+            self._selection_loader.start()
+            
+    def _selection_loop(self):
+        """Selection loader thread: read the checkpoint and preload the schedule of the latest selection only"""
+        while True:
+            with self._selection_ready:
+                while self._selection_request is None:
+                    self._selection_ready.wait()
+                # Every newer selection restarts the wait, so only the one the user settles on goes on
+                while self._selection_ready.wait(SELECTION_SETTLE):
+                    pass
+                request, self._selection_request = self._selection_request, None
+            key, filepath, warm = request
+            
+            checkpoint = self.executor.checkpoints.load(filepath)
+            self.call_in_ui(self._show_selection_checkpoint, key, checkpoint)
+            
+            # Loads run one at a time here; a selection made meanwhile is prepared once this one is done
+            if warm is not None and self._selection_request is None and not self._closing:
+                try:
+                    self.runner_client.load(filepath, *warm)
+                except Exception as e:
+                    print(f"Failed to preload {key}: {e}")
+                    
+    def _show_selection_checkpoint(self, key, checkpoint):
+        """Store the checkpoint the selection loader read, redrawing the panel if the macro is still selected"""
+        if key not in self.macros:
+            return
+        self.macros[key]['checkpoint'] = checkpoint
+        if self.macro_browser.selected() == key:
+            self.show_macro_info(key)
+            
+    def refresh_selected_info(self):
+        """Redraw the info panel of the selected macro, e.g. after the speed settings changed"""
+        selected = self.macro_browser.selected()
+        if selected in self.macros:
+            self.on_macro_select(selected)
+            
+    def current_speed(self):
+        """PlaybackSpeed from the speed controls, or None while they hold invalid input"""
+        try:
+            turbo_delay = float(self.turbo_delay_var.get()) / 1000.0 if self.turbo_var.get() else None
+            return PlaybackSpeed(float(self.speed_var.get()), turbo_delay)
+        except (ValueError, tk.TclError):
+            return None
+            
+    def current_loop(self):
+        """MacroExecutor.run looping arguments from the repeat controls, or None while they hold invalid input"""
+        try:
+            repeat = int(self.repeat_var.get())
+            gap = float(self.repeat_gap_var.get())
+            minutes = float(self.repeat_for_var.get())
+        except ValueError:
+            return None
+        if repeat < 0 or gap < 0 or minutes < 0:
+            return None
+        # A time limit with the default single repeat loops until it runs out, as in the CLI
+        if minutes and repeat == 1:
+            repeat = 0
+        return {'repeat': repeat, 'repeat_for': minutes * 60 if minutes else None, 'gap': gap}
+        
+    def predict_runtime(self, key, speed):
+        """Work out a macro's runtime at a speed in the background, then show it"""
+        macro = self.macros[key]
+        if speed.key in macro.setdefault('predicting', set()):
+            return
+        macro['predicting'].add(speed.key)
+        
+        def predict_thread():
+            try:
+                with macro['handle'].materialized() as actions:
+                    macro['predicted'][speed.key] = speed.duration(actions)
+            except Exception as e:
+                print(f"Failed to predict runtime of {key}: {e}")
+                return
+            finally:
+                macro['predicting'].discard(speed.key)
+            self.call_in_ui(lambda: self.macros.get(key) is macro and self.macro_browser.selected() == key
+                            and self.show_macro_info(key))
+            
+        threading.Thread(target=predict_thread, daemon=True).start()
             
     def find_autohotkey_executable(self):
         """Find AutoHotkey executable on the system"""
-        for path in self.ahk_paths:
-            if os.path.exists(path):
-                return path
-            else:
-                # Try to find it using shutil.which
-                try:
-                    found_path = shutil.which(path)
-                    if found_path:
-                        return found_path
-                except:
-                    continue
-        return None
+        return self.executor.find_autohotkey_executable()
+        
+    def call_in_ui(self, callback, *args):
+        """Queue a widget update from any thread; it runs on the Tk thread on the next tick"""
+        self.ui_queue.put((callback, args))
+        
+    def process_ui_queue(self):
+        """Periodic Tk-thread tick that applies the widget updates queued by worker threads"""
+        while True:
+            try:
+                callback, args = self.ui_queue.get_nowait()
+            except queue.Empty:
+                break
+            try:
+                callback(*args)
+            except Exception as e:
+                print(f"UI update failed: {e}")
+        self.root.after(UI_TICK_MS, self.process_ui_queue)
+        
+    def set_status(self, text):
+        """Set the status line from any thread"""
+        self.call_in_ui(lambda: self.status_label.config(text=text))
         
     def download_ahk_script(self):
         """Download the latest AHK script from GitHub"""
+        self.progress.start()
+        self.status_label.config(text="Downloading AHK script...")
+        self.download_button.config(state=tk.DISABLED)
+        
         def download_thread():
             try:
-                self.progress.start()
-                self.status_label.config(text="Downloading AHK script...")
-                self.download_button.config(state=tk.DISABLED)
-                
-                response = requests.get(self.ahk_script_url, timeout=30)
-                response.raise_for_status()
-                
-                with open("astdx_macro_runner.ahk", 'w', encoding='utf-8') as f:
-                    f.write(response.text)
-                
-                self.progress.stop()
-                self.status_label.config(text="AHK script downloaded successfully")
-                messagebox.showinfo("Success", "AHK script downloaded successfully!")
+                # Conditional request: an unchanged script is not downloaded or rewritten
+                success, message = self.script_updater.update()
                 
-            except requests.RequestException as e:
-                self.progress.stop()
-                self.status_label.config(text="Failed to download AHK script")
-                messagebox.showerror("Download Error", f"Failed to download AHK script:\n{str(e)}")
+                if success:
+                    self.set_status(f"AHK script: {message}")
+                    self.call_in_ui(messagebox.showinfo, "Success", f"AHK script is ready.\n\n{message}")
+                else:
+                    self.set_status("Failed to download AHK script")
+                    self.call_in_ui(messagebox.showerror, "Download Error", f"Failed to download AHK script:\n{message}")
                 
             except Exception as e:
-                self.progress.stop()
-                self.status_label.config(text="Error downloading AHK script")
-                messagebox.showerror("Error", f"Error downloading AHK script:\n{str(e)}")
+                self.set_status("Error downloading AHK script")
+                self.call_in_ui(messagebox.showerror, "Error", f"Error downloading AHK script:\n{str(e)}")
                 
             finally:
-                self.download_button.config(state=tk.NORMAL)
-                self.progress.stop()
+                self.call_in_ui(self.download_button.config, {'state': tk.NORMAL})
+                self.call_in_ui(self.progress.stop)
                 
         threading.Thread(target=download_thread, daemon=True).start()
         
-    def run_selected_macro(self):
-        """Run the selected macro"""
-        selection = self.macro_listbox.curselection()
-        if not selection:
+    def begin_run(self):
+        """Put the controls into the running state (Tk thread)"""
+        self.cancel_event.clear()
+        self.run_button.config(state=tk.DISABLED)
+        self.resume_button.config(state=tk.DISABLED)
+        self.cancel_button.config(state=tk.NORMAL)
+        self.progress.config(mode='indeterminate', value=0)
+        self.progress.start()
+        self.status_label.config(text="Running macro...")
+        
+    def end_run(self):
+        """Return the controls to the idle state (Tk thread)"""
+        self.progress.stop()
+        self.progress.config(mode='indeterminate', value=0)
+        self.run_button.config(state=tk.NORMAL)
+        self.cancel_button.config(state=tk.DISABLED)
+        # Show the checkpoint the run left behind, or that it is gone
+        selected = self.macro_browser.selected()
+        if selected in self.macros:
+            self.on_macro_select(selected)
+        
+    def show_progress(self, info):
+        """Show per-action progress and the time left (Tk thread)"""
+        if self.cancel_event.is_set():
+            return
+        if str(self.progress.cget('mode')) != 'determinate':
+            self.progress.stop()
+            self.progress.config(mode='determinate')
+        self.progress.config(maximum=max(info['total'], 1), value=info['fired'])
+        
+        remaining = max(info['duration'] - info['offset'], 0)
+        minutes, seconds = divmod(int(round(remaining)), 60)
+        text = f"Executing macro... {info['fired']}/{info['total']} actions, {minutes}:{seconds:02d} left"
+        if self.run_loop is not None:
+            repeat = self.run_loop['repeat']
+            text = f"Iteration {info.get('iteration', 1)}{f'/{repeat}' if repeat else ''}: {text}"
+        self.status_label.config(text=text)
+        
+    def cancel_run(self):
+        """Stop the run in progress (Tk thread)"""
+        self.cancel_event.set()
+        self.cancel_button.config(state=tk.DISABLED)
+        self.status_label.config(text="Cancelling...")
+        # Stopping may wait on the runner worker, so keep it off the Tk thread
+        threading.Thread(target=self.executor.stop, daemon=True).start()
+        
+    def report_result(self, key, result):
+        """Show how a run ended (Tk thread)"""
+        macro = self.macros.get(key)
+        macro_name = macro['name'] if macro else key
+        iterations = result.get('iterations')
+        if iterations and not iterations['count']:
+            iterations = None
+        if iterations and macro:
+            # A loop's last run is its typical iteration
+            macro['last_run'] = {
+                'elapsed': iterations['time']['mean'] / 1000.0,
+                'predicted': result.get('predicted', 0.0),
+                'speed': result.get('speed', "1x")
+            }
+        if iterations and (result['completed'] or not result.get('checkpoint')):
+            # Stopping is the usual end of a loop, so both ways show its throughput
+            summary = RunReport.format_iterations(iterations)
+            self.status_label.config(text=f"Macro looped: {summary}")
+            messagebox.showinfo(
+                "Loop Finished" if result['completed'] else "Loop Stopped",
+                f"Macro '{macro_name}' looped {summary}.\n\nTook {result['elapsed']:.2f} seconds in total."
+            )
+        elif result['completed']:
+            if macro:
+                macro['last_run'] = {
+                    'elapsed': result['elapsed'],
+                    'predicted': result.get('predicted', 0.0),
+                    'speed': result.get('speed', "1x")
+                }
+            if 'timing' in result:
+                timing = result['timing']
+                self.status_label.config(
+                    text=f"Macro executed successfully (lateness p99 {timing['lateness']['p99']:.2f} ms, "
+                         f"final drift {timing['final_drift']:.2f} ms)"
+                )
+            elif 'mean_abs_error' in result:
+                self.status_label.config(
+                    text=f"Macro executed successfully (mean timing error {result['mean_abs_error'] * 1000:.2f} ms)"
+                )
+            else:
+                self.status_label.config(text="Macro executed successfully")
+            messagebox.showinfo(
+                "Success",
+                f"Macro '{macro_name}' executed successfully!\n\n"
+                f"Took {result['elapsed']:.2f} seconds (predicted {result.get('predicted', 0.0):.2f})"
+            )
+        elif result.get('checkpoint'):
+            self.status_label.config(text=f"Macro execution stopped at {CheckpointStore.describe(result['checkpoint'])}")
+            done = f"after {RunReport.format_iterations(iterations)}, " if iterations else ""
+            messagebox.showinfo(
+                "Execution Stopped",
+                f"Macro execution stopped {done}at {CheckpointStore.describe(result['checkpoint'])}.\n\n"
+                "Click 'Resume' to continue from there."
+            )
+        elif 'actions_fired' in result:
+            self.status_label.config(text="Macro execution stopped")
+            messagebox.showinfo(
+                "Execution Stopped",
+                f"Macro execution stopped after {result['actions_fired']} of {result['actions_total']} actions."
+            )
+        else:
+            self.status_label.config(text="Macro execution stopped")
+            
+    def run_selected_macro(self, resume=False):
+        """Run the selected macro, from its checkpoint when resuming"""
+        key = self.macro_browser.selected()
+        if key is None:
             messagebox.showwarning("No Selection", "Please select a macro to run.")
             return
             
-        macro_name = self.macro_listbox.get(selection[0])
-        if macro_name not in self.macros:
+        if key not in self.macros:
             messagebox.showerror("Error", "Invalid macro selection.")
             return
             
+        speed = self.current_speed()
+        if speed is None:
+            messagebox.showerror("Invalid Speed", "Enter a positive speed factor and turbo gap.")
+            return
+        if resume:
+            speed = self.resume_speed(self.macros[key]['handle'].filepath, speed)
+            
+        loop = self.current_loop()
+        if loop is None:
+            messagebox.showerror("Invalid Repeat", "Enter a whole number of repeats and non-negative gap and time.")
+            return
+        self.run_loop = loop if loop['repeat'] != 1 or loop['repeat_for'] is not None else None
+            
+        if self.engine_var.get() == "python":
+            self.run_with_python_engine(key, resume, speed, loop)
+            return
+            
+        macro_name = self.macros[key]['name']
+        handle = self.macros[key]['handle']
+        optimize = self.resume_optimize(handle.filepath) if resume else self.optimize_var.get()
+        report = RunReport.default_path(handle.filepath) if self.report_var.get() else None
+        self.begin_run()
+        
         def run_thread():
             try:
-                self.progress.start()
-                self.status_label.config(text="Running macro...")
-                self.run_button.config(state=tk.DISABLED)
+                # Validates, compiles the cached plan and runs the AHK script on it
+                result = self.executor.run(
+                    handle.filepath,
+                    engine="ahk",
+                    optimize=optimize,
+                    on_status=self.set_status,
+                    on_progress=lambda info: self.call_in_ui(self.show_progress, info),
+                    report=report,
+                    resume=resume,
+                    speed=speed,
+                    **loop
+                )
+                self.call_in_ui(self.report_result, key, result)
                 
-                # Check if AHK script exists, download if not
-                ahk_script_path = "astdx_macro_runner.ahk"
-                if not os.path.exists(ahk_script_path):
-                    self.status_label.config(text="Downloading AHK script...")
-                    response = requests.get(self.ahk_script_url, timeout=30)
-                    response.raise_for_status()
-                    
-                    with open(ahk_script_path, 'w', encoding='utf-8') as f:
-                        f.write(response.text)
-                
-                # Find AutoHotkey executable
-                ahk_exe = self.find_autohotkey_executable()
-                if not ahk_exe:
-                    raise Exception("AutoHotkey executable not found. Please install AutoHotkey.")
+            except subprocess.TimeoutExpired:
+                self.set_status("Macro execution timed out")
+                self.call_in_ui(
+                    messagebox.showerror, "Timeout",
+                    "Macro execution timed out.\n\nClick 'Resume' to continue from where it stopped."
+                )
                 
-                # Get macro file path
-                macro_file = self.macros[macro_name]['file']
-                macro_path = os.path.abspath(os.path.join("macros", macro_file))
+            except Exception as e:
+                self.set_status("Error running macro")
+                self.call_in_ui(messagebox.showerror, "Execution Error", f"Error running macro:\n{str(e)}")
                 
-                # Run the AHK script with the macro file as parameter
-                cmd = [ahk_exe, ahk_script_path, macro_path]
+            finally:
+                self.call_in_ui(self.end_run)
                 
-                self.status_label.config(text="Executing macro...")
-                result = subprocess.run(cmd, capture_output=True, text=True, timeout=300)
+        threading.Thread(target=run_thread, daemon=True).start()
+        
+    def run_with_python_engine(self, key, resume=False, speed=None, loop=None):
+        """Run a macro with the built-in drift-compensated playback engine"""
+        macro_name = self.macros[key]['name']
+        handle = self.macros[key]['handle']
+        info = handle.header
+        speed = speed or PlaybackSpeed()
+        loop = loop or {'repeat': 1, 'repeat_for': None, 'gap': 0.0}
+        
+        confirm_text = (
+            "Are you sure you want to execute the macro?\n\n"
+            f"Name: {macro_name}\n"
+            f"Actions: {info.get('actions_count', 0)}\n"
+            f"Duration: {info.get('total_duration', 0)} seconds"
+        )
+        predicted = self.macros[key]['predicted'].get(speed.key)
+        if predicted is not None:
+            confirm_text += f"\nPredicted: {predicted:.2f} seconds at {speed}"
+        if self.run_loop is not None:
+            times = f"{loop['repeat']} times" if loop['repeat'] else "until stopped"
+            limit = f", for at most {loop['repeat_for'] / 60:g} min" if loop['repeat_for'] else ""
+            confirm_text += f"\nRepeat: {times}{limit}, {loop['gap']:g} s apart"
+            
+        if not messagebox.askyesno("Resume Execution" if resume else "Confirm Execution", confirm_text):
+            return
+            
+        optimize = self.resume_optimize(handle.filepath) if resume else self.optimize_var.get()
+        report = RunReport.default_path(handle.filepath) if self.report_var.get() else None
+        self.begin_run()
+        
+        def run_thread():
+            hotkeys = None
+            try:
+                # Validate and parse in the worker before the countdown; runs of a cached macro start immediately
+                self.executor.prepare(handle.filepath, engine="python", optimize=optimize, speed=speed)
                 
-                if result.returncode == 0:
-                    self.status_label.config(text="Macro executed successfully")
-                    messagebox.showinfo("Success", f"Macro '{macro_name}' executed successfully!")
-                else:
-                    error_msg = result.stderr or result.stdout or "Unknown error"
-                    raise Exception(f"AHK execution failed: {error_msg}")
+                # Same stop hotkey as the AHK runner
+                from pynput import keyboard
+                hotkeys = keyboard.GlobalHotKeys({'<ctrl>+<alt>+q': self.executor.stop})
+                hotkeys.start()
                 
-            except subprocess.TimeoutExpired:
-                self.status_label.config(text="Macro execution timed out")
-                messagebox.showerror("Timeout", "Macro execution timed out.")
+                for remaining in (3, 2, 1):
+                    self.set_status(f"Starting in {remaining}... (Ctrl+Alt+Q to stop)")
+                    if self.cancel_event.wait(1):
+                        self.set_status("Macro execution cancelled")
+                        return
                 
-            except requests.RequestException as e:
-                self.status_label.config(text="Failed to download AHK script")
-                messagebox.showerror("Download Error", f"Failed to download AHK script:\n{str(e)}")
+                result = self.executor.run(
+                    handle.filepath,
+                    engine="python",
+                    optimize=optimize,
+                    on_status=self.set_status,
+                    on_progress=lambda info: self.call_in_ui(self.show_progress, info),
+                    report=report,
+                    resume=resume,
+                    speed=speed,
+                    **loop
+                )
+                self.call_in_ui(self.report_result, key, result)
                 
             except Exception as e:
-                self.status_label.config(text="Error running macro")
-                messagebox.showerror("Execution Error", f"Error running macro:\n{str(e)}")
+                self.set_status("Error running macro")
+                self.call_in_ui(messagebox.showerror, "Execution Error", f"Error running macro:\n{str(e)}")
                 
             finally:
-                self.run_button.config(state=tk.NORMAL)
-                self.progress.stop()
+                if hotkeys:
+                    hotkeys.stop()
+                self.call_in_ui(self.end_run)
                 
         threading.Thread(target=run_thread, daemon=True).start()
         
+    def resume_optimize(self, macro_path):
+        """Optimize setting to resume with: the checkpoint's, since positions differ between the two"""
+        checkpoint = self.executor.checkpoints.load(macro_path)
+        return checkpoint['optimize'] if checkpoint else self.optimize_var.get()
+        
+    def resume_speed(self, macro_path, speed):
+        """Speed to resume with: the checkpoint's, since its position is in that speed's timing"""
+        checkpoint = self.executor.checkpoints.load(macro_path)
+        return CheckpointStore.speed_of(checkpoint) if checkpoint else speed
+        
+    def on_close(self):
+        """Shut the runner worker and the directory watcher down together with the window"""
+        # Keeps the selection loader from starting the worker again
+        self._closing = True
+        if self.watcher is not None:
+            self.watcher.stop()
+        self.runner_client.close()
+        self.root.destroy()
+        
     def run(self):
         self.root.mainloop()
 
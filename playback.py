@@ -0,0 +1,414 @@
+import time
+import bisect
+import threading
+from collections.abc import Sequence
+
+# Turbo mode's default minimum gap between recorded actions, in milliseconds
+TURBO_DELAY_MS = 50
+
+
+class RecordingBackend:
+    """Output backend that only records what would have been sent, for headless timing tests"""
+
+    def __init__(self, clock=time.perf_counter):
+        self.clock = clock
+        self.events = []
+
+    def _record(self, *event):
+        self.events.append((self.clock(),) + event)
+
+    def move(self, x, y):
+        self._record('move', x, y)
+
+    def click(self, x, y, button):
+        self._record('click', x, y, button)
+
+    def button_down(self, x, y, button):
+        self._record('button_down', x, y, button)
+
+    def button_up(self, x, y, button):
+        self._record('button_up', x, y, button)
+
+    def press_key(self, key):
+        self._record('key_press', key)
+        return True
+
+
+class PynputBackend:
+    """Output backend that sends input through pynput's mouse and keyboard controllers"""
+
+    def __init__(self):
+        # Imported lazily so headless tools can use the engine without pynput installed
+        from pynput import mouse, keyboard
+        self._mouse_module = mouse
+        self._keyboard_module = keyboard
+        self.mouse = mouse.Controller()
+        self.keyboard = keyboard.Controller()
+
+    def _button(self, name):
+        return getattr(self._mouse_module.Button, name or 'left', self._mouse_module.Button.left)
+
+    def move(self, x, y):
+        self.mouse.position = (x, y)
+
+    def click(self, x, y, button):
+        self.mouse.position = (x, y)
+        self.mouse.click(self._button(button))
+
+    def button_down(self, x, y, button):
+        self.mouse.position = (x, y)
+        self.mouse.press(self._button(button))
+
+    def button_up(self, x, y, button):
+        self.mouse.position = (x, y)
+        self.mouse.release(self._button(button))
+
+    def press_key(self, key):
+        """Tap a key recorded by the maker: a character or a pynput Key name"""
+        if len(key) == 1:
+            self.keyboard.tap(key)
+            return True
+        special = getattr(self._keyboard_module.Key, key, None)
+        if special is None:
+            return False
+        self.keyboard.tap(special)
+        return True
+
+
+class PlaybackSpeed:
+    """How fast recorded gaps are replayed: gaps are divided by factor, and in turbo mode also
+    capped at turbo_delay seconds, the shortest gap considered safe. Gaps already shorter stay
+    as they are, and explicit wait actions always keep their full duration.
+    """
+
+    def __init__(self, factor=1.0, turbo_delay=None):
+        if factor <= 0:
+            raise ValueError(f"Speed factor must be positive, not {factor}")
+        if turbo_delay is not None and turbo_delay < 0:
+            raise ValueError(f"Turbo delay must not be negative, not {turbo_delay}")
+        self.factor = float(factor)
+        self.turbo_delay = None if turbo_delay is None else float(turbo_delay)
+
+    @classmethod
+    def from_params(cls, params):
+        """Speed from request or job parameters: "speed" and "turbo_delay", both optional"""
+        return cls(params.get('speed') or 1.0, params.get('turbo_delay'))
+
+    @staticmethod
+    def add_arguments(parser):
+        """Add --speed and --turbo to a command line parser"""
+        parser.add_argument("--speed", type=float, default=1.0,
+                            help="playback speed factor for recorded gaps (2 = twice as fast)")
+        parser.add_argument("--turbo", type=float, nargs="?", const=TURBO_DELAY_MS, default=None, metavar="MS",
+                            help=f"cap recorded gaps at MS milliseconds (default {TURBO_DELAY_MS}); waits are kept")
+
+    @classmethod
+    def from_args(cls, args):
+        return cls(args.speed, None if args.turbo is None else args.turbo / 1000.0)
+
+    def params(self):
+        """Parameters for a runner request; empty at normal speed"""
+        if self.is_normal:
+            return {}
+        return {'speed': self.factor, 'turbo_delay': self.turbo_delay}
+
+    @property
+    def is_normal(self):
+        return self.factor == 1.0 and self.turbo_delay is None
+
+    @property
+    def key(self):
+        """Hashable identity, for caches of retimed schedules and plans"""
+        return (self.factor, self.turbo_delay)
+
+    def __str__(self):
+        text = f"{self.factor:g}x"
+        if self.turbo_delay is not None:
+            text += f" turbo {self.turbo_delay * 1000:g} ms"
+        return text
+
+    def gap(self, seconds):
+        """Retimed length of one recorded gap"""
+        seconds /= self.factor
+        if self.turbo_delay is not None:
+            seconds = min(seconds, self.turbo_delay)
+        return seconds
+
+    def apply(self, actions):
+        """Actions sorted by timestamp with retimed timestamps; the actions themselves at normal speed"""
+        if self.is_normal:
+            return actions
+        ordered = sorted(
+            (action for action in actions if isinstance(action, dict)),
+            key=lambda action: action.get('timestamp', 0)
+        )
+        retimed = []
+        last_timestamp = 0.0
+        current = 0.0
+        for action in ordered:
+            timestamp = action.get('timestamp', 0)
+            if timestamp > last_timestamp:
+                current += self.gap(timestamp - last_timestamp)
+                last_timestamp = timestamp
+            retimed.append(dict(action, timestamp=round(current, 6)))
+        return retimed
+
+    def duration(self, actions):
+        """Predicted playback time at this speed: retimed gaps plus full wait durations"""
+        timestamps = []
+        waits = 0.0
+        for action in actions:
+            if not isinstance(action, dict):
+                continue
+            timestamps.append(action.get('timestamp', 0))
+            if action.get('type') == 'wait':
+                waits += action.get('duration', 0)
+        timestamps.sort()
+        total = 0.0
+        last_timestamp = 0.0
+        for timestamp in timestamps:
+            if timestamp > last_timestamp:
+                total += self.gap(timestamp - last_timestamp)
+                last_timestamp = timestamp
+        return total + waits
+
+
+class LazySchedule(Sequence):
+    """Schedule over columnar actions (macro_format.ColumnarActions): the offsets are computed
+    up front, and each (offset, action) pair is built only when something reads it"""
+
+    def __init__(self, offsets, order, actions, duration):
+        self.offsets = offsets
+        self.duration = duration
+        self._order = order
+        self._actions = actions
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        return self.offsets[index], self._actions[self._order[index]]
+
+
+class PlaybackEngine:
+    """Replays actions against absolute monotonic deadlines so timing error never accumulates"""
+
+    def __init__(self, backend, spin_threshold=0.001, max_sleep=0.05, clock=time.perf_counter, sleep=time.sleep):
+        # Sleeps until spin_threshold before each deadline and busy-waits the rest; sleeps are
+        # capped at max_sleep so a stop request is noticed promptly
+        self.backend = backend
+        self.spin_threshold = spin_threshold
+        self.max_sleep = max_sleep
+        self.clock = clock
+        self.sleep = sleep
+        self._stop_event = threading.Event()
+
+    @staticmethod
+    def schedule(actions):
+        """Offsets from playback start for each action, in firing order.
+
+        Follows the AHK runner's semantics: actions fire at their timestamp, and every wait
+        action pushes all later actions back by its duration. Columnar actions are scheduled
+        from their columns into a LazySchedule, without building their dicts.
+        """
+        if hasattr(actions, 'column'):
+            return PlaybackEngine._schedule_columns(actions)
+        ordered = sorted(
+            (action for action in actions if isinstance(action, dict)),
+            key=lambda action: action.get('timestamp', 0)
+        )
+        plan = []
+        wait_offset = 0.0
+        for action in ordered:
+            offset = max(action.get('timestamp', 0), 0) + wait_offset
+            if action.get('type') == 'wait':
+                wait_offset += action.get('duration', 0)
+            plan.append((offset, action))
+        return plan
+
+    @staticmethod
+    def _schedule_columns(actions):
+        timestamps = actions.column('timestamp', 0)
+        skipped = actions.non_dict_indexes
+        indexes = range(len(actions)) if not skipped else [i for i in range(len(actions)) if i not in skipped]
+        order = sorted(indexes, key=timestamps.__getitem__)
+        offsets = [timestamp if timestamp > 0 else 0 for timestamp in map(timestamps.__getitem__, order)]
+
+        duration = offsets[-1] if offsets else 0.0
+        waits = set(actions.indexes_of('type', 'wait'))
+        if waits:
+            # Shift the run of actions after each wait in one go rather than one action at a time
+            durations = actions.column('duration', 0)
+            shift = 0.0
+            start = 0
+            for position in [position for position, index in enumerate(order) if index in waits]:
+                if shift:
+                    offsets[start:position + 1] = [offset + shift for offset in offsets[start:position + 1]]
+                wait = durations[order[position]]
+                duration = max(duration, offsets[position] + wait)
+                shift += wait
+                start = position + 1
+            if shift:
+                offsets[start:] = [offset + shift for offset in offsets[start:]]
+            duration = max(duration, offsets[-1])
+        return LazySchedule(offsets, order, actions, duration)
+
+    @staticmethod
+    def schedule_duration(plan):
+        """Scheduled length of a run, including a trailing wait"""
+        if isinstance(plan, LazySchedule):
+            return plan.duration
+        duration = 0.0
+        for offset, action in plan:
+            end = offset + (action.get('duration', 0) if action.get('type') == 'wait' else 0)
+            duration = max(duration, end)
+        return duration
+
+    @staticmethod
+    def seek(plan, offset):
+        """Index of the first scheduled action at or after offset seconds, len(plan) past the end"""
+        if isinstance(plan, LazySchedule):
+            return bisect.bisect_left(plan.offsets, offset)
+        return bisect.bisect_left(plan, offset, key=lambda item: item[0])
+
+    def stop(self):
+        """Ask a running playback to stop before its next action"""
+        self._stop_event.set()
+
+    def reset(self):
+        """Clear an earlier stop request; done when a run is accepted, so a stop that arrives
+        while the run is still loading is not lost"""
+        self._stop_event.clear()
+
+    @property
+    def stopped(self):
+        return self._stop_event.is_set()
+
+    def _wait_until(self, deadline):
+        """Coarse sleep, then spin through the last sub-millisecond before the deadline"""
+        while not self._stop_event.is_set():
+            remaining = deadline - self.clock()
+            if remaining <= 0:
+                return
+            if remaining > self.spin_threshold:
+                self.sleep(min(remaining - self.spin_threshold, self.max_sleep))
+
+    def _dispatch(self, action):
+        """Send one action to the backend"""
+        action_type = action.get('type')
+        backend = self.backend
+        if action_type == 'click':
+            backend.click(action['x'], action['y'], action.get('button', 'left'))
+        elif action_type == 'key_press':
+            backend.press_key(action['key'])
+        elif action_type == 'move':
+            backend.move(action['x'], action['y'])
+        elif action_type == 'drag':
+            state = action.get('state')
+            if state == 'down':
+                backend.button_down(action['x'], action['y'], action.get('button', 'left'))
+            elif state == 'up':
+                backend.button_up(action['x'], action['y'], action.get('button', 'left'))
+            else:
+                backend.move(action['x'], action['y'])
+
+    def play(self, actions, on_progress=None, report=None):
+        """Play actions afresh (earlier stops are cleared) to completion or until stopped, returning timing statistics"""
+        self.reset()
+        return self.play_schedule(self.schedule(actions), on_progress, report)
+
+    def play_schedule(self, plan, on_progress=None, report=None, start_index=0):
+        """Play an already computed schedule of (offset, action) pairs.
+
+        report, if given, is a RunReport that receives every fired action's timing. With
+        start_index, playback resumes at that action: it fires at once and the rest keep
+        their original spacing. Progress and report indexes stay those of the whole plan.
+        A stop requested since the last reset() ends playback before the first action.
+        """
+        return self._play_once(plan, on_progress, report, start_index)
+
+    def play_loop(self, plan, repeat=1, duration=None, gap=0.0, on_progress=None, report=None, start_index=0,
+                  on_iteration=None):
+        """Play a schedule over and over until repeat iterations are done (0 = until stopped).
+
+        No iteration starts once duration seconds have passed since the first one began, and
+        gap seconds separate iterations. Only the first iteration honours start_index. Unlike a
+        single run, each iteration also sits out a trailing wait before the next one starts.
+        Returns the last iteration's result, with 'completed' False when stopped, 'iterations'
+        the number of finished iterations and 'iteration_times' their lengths in seconds.
+        on_iteration(number, result) is called after each iteration. As with play_schedule, a
+        stop requested since the last reset() counts.
+        """
+        if not plan:
+            # Nothing to play would otherwise loop as fast as it can
+            repeat = 1
+        length = self.schedule_duration(plan)
+        session_start = self.clock()
+        iteration_times = []
+        index = start_index
+        while True:
+            iteration_start = self.clock()
+            result = self._play_once(plan, on_progress, report, index)
+            if result['completed']:
+                base = 0.0 if index == 0 else plan[index][0] if index < len(plan) else length
+                self._wait_until(iteration_start + length - base)
+            if not result['completed'] or self._stop_event.is_set():
+                break
+            iteration_times.append(self.clock() - iteration_start)
+            if on_iteration:
+                on_iteration(len(iteration_times), result)
+            if repeat and len(iteration_times) >= repeat:
+                break
+            if duration is not None and self.clock() - session_start >= duration:
+                break
+            # A stop during the gap ends the loop between iterations
+            if gap > 0 and self._stop_event.wait(gap):
+                break
+            index = 0
+        result['completed'] = result['completed'] and not self._stop_event.is_set()
+        result['iterations'] = len(iteration_times)
+        result['iteration_times'] = iteration_times
+        return result
+
+    def _play_once(self, plan, on_progress, report, start_index):
+        start = self.clock()
+        # Only a resumed run is rebased; from the top the lead-in before the first action is kept
+        base = plan[start_index][0] if 0 < start_index < len(plan) else 0.0
+        fired = 0
+        max_late = 0.0
+        total_error = 0.0
+
+        for index in range(start_index, len(plan)):
+            offset, action = plan[index]
+            offset -= base
+            deadline = start + offset
+            self._wait_until(deadline)
+            if self._stop_event.is_set():
+                break
+
+            fire_time = self.clock()
+            self._dispatch(action)
+            fired += 1
+            if report is not None:
+                report.record(index, action.get('type'), offset, fire_time - start, self.clock() - start)
+
+            error = fire_time - deadline
+            total_error += abs(error)
+            max_late = max(max_late, error)
+
+            if on_progress:
+                on_progress(index + 1, len(plan))
+
+        position = start_index + fired
+        return {
+            'completed': position >= len(plan),
+            'start_index': start_index,
+            'actions_fired': fired,
+            'actions_total': len(plan),
+            'offset': plan[position - 1][0] if position else 0.0,
+            'elapsed': self.clock() - start,
+            'mean_abs_error': total_error / fired if fired else 0.0,
+            'max_late': max_late
+        }
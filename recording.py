@@ -0,0 +1,435 @@
+import os
+import json
+import queue
+import threading
+import time
+from collections import deque
+
+from macro_format import BinaryMacroFormat
+
+# NumPy is imported on the first path simplification rather than at startup
+np = None
+_numpy_checked = False
+
+
+def _load_numpy():
+    """Import NumPy once, leaving np as None when it is not installed (pure Python fallback)"""
+    global np, _numpy_checked
+    if not _numpy_checked:
+        _numpy_checked = True
+        try:
+            import numpy
+            np = numpy
+        except ImportError:
+            np = None
+    return np
+
+
+# Room reserved in a streamed JSON macro's header for actions_count and total_duration, enough
+# for any int count and any float repr
+_HEADER_FIELD_WIDTH = 24
+
+
+class RecordingJournal:
+    """Append-only JSONL journal that streams recorded actions to disk from a background writer"""
+
+    _STOP = object()
+
+    def __init__(self, path, flush_interval=0.25, batch_size=256, tail_size=200):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.count = 0
+        self.total_duration = 0
+        self.tail = deque(maxlen=tail_size)
+        self._queue = queue.SimpleQueue()
+        self._file = None
+        self._writer = None
+        self.write_error = None
+
+    @property
+    def is_open(self):
+        return self._writer is not None
+
+    @property
+    def saved_marker(self):
+        return self.path + ".saved"
+
+    @property
+    def is_saved(self):
+        """Whether the recording has been saved to a macro file since it was journaled"""
+        return os.path.exists(self.saved_marker)
+
+    def mark_saved(self):
+        """Note that the recording is safely in a macro file, so it is not offered for recovery"""
+        with open(self.saved_marker, 'w'):
+            pass
+
+    def open(self, truncate=True):
+        """Open the journal file and start the background writer"""
+        directory = os.path.dirname(self.path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+
+        if truncate and self.is_saved:
+            os.remove(self.saved_marker)
+        self._file = open(self.path, 'w' if truncate else 'a', encoding='utf-8')
+        self._writer = threading.Thread(target=self._write_loop, daemon=True)
+        self._writer.start()
+
+    def append(self, action):
+        """Queue an action for the writer; never blocks on disk I/O"""
+        self._queue.put(action)
+        self.count += 1
+        self.tail.append(action)
+        timestamp = action.get('timestamp', 0)
+        if timestamp > self.total_duration:
+            self.total_duration = timestamp
+
+    def _write_loop(self):
+        """Drain the queue in batches, flushing each batch to disk"""
+        stopping = False
+        while not stopping:
+            try:
+                item = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                continue
+
+            batch = []
+            while True:
+                if item is self._STOP:
+                    stopping = True
+                    break
+                batch.append(json.dumps(item, separators=(',', ':')))
+                if len(batch) >= self.batch_size:
+                    break
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+
+            if batch:
+                try:
+                    self._file.write("\n".join(batch) + "\n")
+                    self._file.flush()
+                except OSError as e:
+                    self.write_error = e
+
+    def close(self):
+        """Flush outstanding actions and stop the writer"""
+        if self._writer is None:
+            return
+        self._queue.put(self._STOP)
+        self._writer.join()
+        self._writer = None
+        self._file.close()
+        self._file = None
+
+    def discard(self):
+        """Close the journal and delete its file"""
+        self.close()
+        for path in (self.path, self.saved_marker):
+            if os.path.exists(path):
+                os.remove(path)
+        self.count = 0
+        self.total_duration = 0
+        self.tail.clear()
+
+    def iter_actions(self):
+        """Read the journaled actions back, ignoring a torn last line from a crash"""
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    continue
+
+    @classmethod
+    def recover(cls, path, **kwargs):
+        """Rebuild a closed journal's counters from an existing journal file"""
+        journal = cls(path, **kwargs)
+        for action in journal.iter_actions():
+            journal.count += 1
+            journal.tail.append(action)
+            timestamp = action.get('timestamp', 0)
+            if timestamp > journal.total_duration:
+                journal.total_duration = timestamp
+        return journal
+
+    def write_macro(self, filepath, name, created, binary=False, transform=None):
+        """Compact the journal into a macro file, streaming the actions instead of loading them.
+
+        transform, if given, maps the journaled action stream to the stream that gets saved
+        (e.g. MacroOptimizer.optimize_stream). The journal is read once either way: JSON is
+        streamed and its counts patched into the header afterwards, while the binary format,
+        which needs the count up front, buffers the transformed actions.
+        """
+        self.close()
+        if self.write_error:
+            raise self.write_error
+
+        actions = transform(self.iter_actions()) if transform else self.iter_actions()
+        temp_path = filepath + ".tmp"
+        if binary:
+            count = self.count
+            total_duration = self.total_duration
+            if transform:
+                actions = list(actions)
+                count = len(actions)
+                total_duration = max((action.get('timestamp', 0) for action in actions), default=0)
+            macro_data = {
+                "name": name,
+                "created": created,
+                "actions_count": count,
+                "total_duration": total_duration,
+                "actions": None
+            }
+            BinaryMacroFormat.save(temp_path, macro_data, actions, count)
+        else:
+            self._write_json(temp_path, name, created, actions)
+        os.replace(temp_path, filepath)
+
+    @staticmethod
+    def _write_json(path, name, created, actions):
+        """Stream actions into a JSON macro, then fill in the counts reserved in its header"""
+        reserved = b" " * _HEADER_FIELD_WIDTH
+        with open(path, 'wb') as f:
+            f.write(b"{\n")
+            f.write(f'  "name": {json.dumps(name)},\n'.encode('utf-8'))
+            f.write(f'  "created": {json.dumps(created)},\n'.encode('utf-8'))
+            f.write(b'  "actions_count": ')
+            count_offset = f.tell()
+            f.write(reserved + b',\n  "total_duration": ')
+            duration_offset = f.tell()
+            f.write(reserved + b',\n  "actions": [')
+
+            count = 0
+            total_duration = 0
+            separator = b"\n    "
+            for action in actions:
+                f.write(separator + json.dumps(action).encode('utf-8'))
+                separator = b",\n    "
+                count += 1
+                total_duration = max(total_duration, action.get('timestamp', 0))
+            f.write(b"\n  ]\n}" if count else b"]\n}")
+
+            # The values overwrite the start of their padding; the spaces left over are whitespace
+            for offset, value in ((count_offset, count), (duration_offset, total_duration)):
+                text = json.dumps(value).encode('utf-8')
+                if len(text) > _HEADER_FIELD_WIDTH:
+                    raise ValueError(f"{value!r} does not fit the macro header")
+                f.seek(offset)
+                f.write(text)
+
+
+class EventRingBuffer:
+    """Preallocated ring buffer that input hooks push raw events into"""
+
+    def __init__(self, capacity=8192):
+        self.capacity = capacity
+        self._slots = [None] * capacity
+        self._head = 0
+        self._tail = 0
+        self._lock = threading.Lock()
+        self.dropped = 0
+
+    def __len__(self):
+        return self._head - self._tail
+
+    def push(self, item):
+        """Store an event, counting it as dropped when the consumer has fallen a full buffer behind"""
+        with self._lock:
+            if self._head - self._tail >= self.capacity:
+                self.dropped += 1
+                return False
+            self._slots[self._head % self.capacity] = item
+            self._head += 1
+            return True
+
+    def pop_all(self):
+        """Take every buffered event in arrival order (single consumer only)"""
+        head = self._head
+        items = []
+        while self._tail < head:
+            index = self._tail % self.capacity
+            items.append(self._slots[index])
+            self._slots[index] = None
+            self._tail += 1
+        return items
+
+
+class CaptureStats:
+    """Counters and a log2 histogram of push overhead for the capture pipeline.
+
+    The overhead is the time a hook callback spends handing its event to the ring buffer,
+    not how long the event took to reach the callback (pynput has no OS event timestamps).
+    The mouse and keyboard listener threads both record into it, so updates take a lock.
+    """
+
+    BUCKETS = 40
+
+    def __init__(self):
+        self.captured = 0
+        self.processed = 0
+        self.late = 0
+        self.push_overhead = [0] * self.BUCKETS
+        self._lock = threading.Lock()
+
+    def record_push(self, overhead_ns):
+        """Count a hook callback and bucket its push overhead by power of two nanoseconds"""
+        bucket = min(max(overhead_ns, 1).bit_length() - 1, self.BUCKETS - 1)
+        with self._lock:
+            self.captured += 1
+            self.push_overhead[bucket] += 1
+
+    def record_processed(self, late):
+        """Count an event the consumer took, and whether it arrived late"""
+        with self._lock:
+            self.processed += 1
+            if late:
+                self.late += 1
+
+    def overhead_percentile(self, percentile):
+        """Upper bound in nanoseconds of the histogram bucket holding the given percentile"""
+        with self._lock:
+            histogram = list(self.push_overhead)
+        total = sum(histogram)
+        if not total:
+            return 0
+        threshold = total * percentile / 100.0
+        running = 0
+        for bucket, count in enumerate(histogram):
+            running += count
+            if running >= threshold:
+                return 2 ** (bucket + 1)
+        return 2 ** self.BUCKETS
+
+    def summary(self, dropped=0):
+        with self._lock:
+            counts = {'captured': self.captured, 'processed': self.processed, 'dropped': dropped, 'late': self.late}
+        counts.update({
+            'push_p50_ns': self.overhead_percentile(50),
+            'push_p99_ns': self.overhead_percentile(99),
+            'push_max_ns': self.overhead_percentile(100)
+        })
+        return counts
+
+
+class CapturePipeline:
+    """Hands raw input events from the hook callbacks to a consumer thread that turns them into actions.
+
+    normalize(captured_ns, kind, payload) returns a list of actions for each raw event, and the
+    optional finish() returns any actions still held back once capture stops.
+    """
+
+    def __init__(self, normalize, sink, finish=None, capacity=8192, poll_interval=0.002, late_threshold_ms=50):
+        self.normalize = normalize
+        self.sink = sink
+        self.finish = finish
+        self.poll_interval = poll_interval
+        self.late_threshold_ns = int(late_threshold_ms * 1_000_000)
+        self.buffer = EventRingBuffer(capacity)
+        self.stats = CaptureStats()
+        self._running = False
+        self._consumer = None
+
+    def push(self, captured_ns, kind, *payload):
+        """Called from input hooks: record the event and its push overhead, nothing else"""
+        self.buffer.push((captured_ns, kind, payload))
+        self.stats.record_push(time.perf_counter_ns() - captured_ns)
+
+    def start(self):
+        self._running = True
+        self._consumer = threading.Thread(target=self._consume_loop, daemon=True)
+        self._consumer.start()
+
+    def stop(self):
+        """Stop the consumer once everything already captured has been processed"""
+        if self._consumer is None:
+            return
+        self._running = False
+        self._consumer.join()
+        self._consumer = None
+
+    def summary(self):
+        return self.stats.summary(self.buffer.dropped)
+
+    def _consume_loop(self):
+        while True:
+            running = self._running
+            events = self.buffer.pop_all()
+            now = time.perf_counter_ns()
+            for captured_ns, kind, payload in events:
+                self.stats.record_processed(now - captured_ns > self.late_threshold_ns)
+                for action in self.normalize(captured_ns, kind, payload):
+                    self.sink(action)
+            if not running:
+                if self.finish is not None:
+                    for action in self.finish():
+                        self.sink(action)
+                break
+            if not events:
+                time.sleep(self.poll_interval)
+
+
+class PathSimplifier:
+    """Ramer-Douglas-Peucker simplification of recorded (x, y, timestamp) mouse paths"""
+
+    @staticmethod
+    def _farthest_numpy(xy, start, end):
+        origin = xy[start]
+        segment = xy[end] - origin
+        offsets = xy[start + 1:end] - origin
+        length = np.hypot(segment[0], segment[1])
+        if length == 0:
+            distances = np.hypot(offsets[:, 0], offsets[:, 1])
+        else:
+            distances = np.abs(segment[0] * offsets[:, 1] - segment[1] * offsets[:, 0]) / length
+        index = int(np.argmax(distances))
+        return start + 1 + index, float(distances[index])
+
+    @staticmethod
+    def _farthest_python(points, start, end):
+        x0, y0 = points[start][0], points[start][1]
+        dx, dy = points[end][0] - x0, points[end][1] - y0
+        length = (dx * dx + dy * dy) ** 0.5
+        best_index, best_distance = start + 1, -1.0
+        for index in range(start + 1, end):
+            px, py = points[index][0] - x0, points[index][1] - y0
+            if length == 0:
+                distance = (px * px + py * py) ** 0.5
+            else:
+                distance = abs(dx * py - dy * px) / length
+            if distance > best_distance:
+                best_index, best_distance = index, distance
+        return best_index, best_distance
+
+    @staticmethod
+    def simplify(points, tolerance=2.0):
+        """Keep only the points needed to stay within tolerance pixels of the original path"""
+        count = len(points)
+        if count < 3:
+            return list(points)
+
+        keep = [False] * count
+        keep[0] = keep[-1] = True
+
+        if _load_numpy() is not None:
+            xy = np.asarray([(point[0], point[1]) for point in points], dtype=np.float64)
+            farthest = lambda start, end: PathSimplifier._farthest_numpy(xy, start, end)
+        else:
+            farthest = lambda start, end: PathSimplifier._farthest_python(points, start, end)
+
+        # Iterative rather than recursive so long drags cannot hit the recursion limit
+        stack = [(0, count - 1)]
+        while stack:
+            start, end = stack.pop()
+            if end - start < 2:
+                continue
+            index, distance = farthest(start, end)
+            if distance > tolerance:
+                keep[index] = True
+                stack.append((start, index))
+                stack.append((index, end))
+
+        return [point for point, kept in zip(points, keep) if kept]
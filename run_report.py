@@ -0,0 +1,200 @@
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+from datetime import datetime
+
+# Run reports are JSONL: a "run" header line, one "action" line per fired action and a final
+# "summary" line. Times are milliseconds from the start of playback:
+#
+#   scheduled  when the action was due
+#   fired      when the engine started sending it (lateness = fired - scheduled)
+#   sent       when sending returned (latency = sent - fired)
+#
+# Drift is sent - scheduled: how far behind schedule the run is once an action has gone out.
+REPORT_DIRECTORY = "reports"
+REPORT_EXTENSION = ".jsonl"
+PERCENTILES = (50, 90, 95, 99)
+METRICS = ('lateness', 'latency', 'drift')
+
+
+class RunReport:
+    """Per-action timing of one playback run, for either engine"""
+
+    def __init__(self, macro=None, engine=None, meta=None):
+        self.meta = meta or {
+            'macro': macro,
+            'engine': engine,
+            'started': time.time(),
+            'host': platform.node(),
+            'platform': platform.platform()
+        }
+        self.samples = []
+
+    def record(self, index, action_type, scheduled, fired, sent):
+        """Add one action's times, in seconds from the start of playback"""
+        self.samples.append((index, action_type, scheduled, fired, sent))
+
+    @staticmethod
+    def percentile(ordered, pct):
+        """Linearly interpolated percentile of an already sorted list"""
+        if not ordered:
+            return 0.0
+        position = (len(ordered) - 1) * pct / 100.0
+        lower = int(position)
+        upper = min(lower + 1, len(ordered) - 1)
+        return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+    @classmethod
+    def _stats(cls, values):
+        """Mean, min, max and percentiles in milliseconds"""
+        ordered = sorted(value * 1000.0 for value in values)
+        stats = {
+            'mean': round(sum(ordered) / len(ordered), 3) if ordered else 0.0,
+            'min': round(ordered[0], 3) if ordered else 0.0,
+            'max': round(ordered[-1], 3) if ordered else 0.0
+        }
+        for pct in PERCENTILES:
+            stats[f"p{pct}"] = round(cls.percentile(ordered, pct), 3)
+        return stats
+
+    def summary(self):
+        """Percentile summary of lateness, send latency and drift, plus the final drift"""
+        samples = self.samples
+        drift = [sent - scheduled for _, _, scheduled, _, sent in samples]
+        return {
+            'actions': len(samples),
+            'lateness': self._stats(fired - scheduled for _, _, scheduled, fired, _ in samples),
+            'latency': self._stats(sent - fired for _, _, _, fired, sent in samples),
+            'drift': self._stats(drift),
+            'final_drift': round(drift[-1] * 1000.0, 3) if drift else 0.0
+        }
+
+    def write(self, path):
+        """Write the report as JSONL, creating the directory if needed; returns the summary"""
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        summary = self.summary()
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(json.dumps(dict(self.meta, type='run')) + "\n")
+            for index, action_type, scheduled, fired, sent in self.samples:
+                f.write(json.dumps({
+                    'type': 'action',
+                    'index': index,
+                    'action': action_type,
+                    'scheduled': round(scheduled * 1000.0, 3),
+                    'fired': round(fired * 1000.0, 3),
+                    'sent': round(sent * 1000.0, 3)
+                }) + "\n")
+            f.write(json.dumps(dict(summary, type='summary')) + "\n")
+        return summary
+
+    @classmethod
+    def load(cls, path):
+        """Read a report written by write()"""
+        report = None
+        samples = []
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                record = json.loads(line)
+                kind = record.pop('type', None)
+                if kind == 'run':
+                    report = cls(meta=record)
+                elif kind == 'action':
+                    samples.append((
+                        record['index'], record['action'],
+                        record['scheduled'] / 1000.0, record['fired'] / 1000.0, record['sent'] / 1000.0
+                    ))
+        if report is None:
+            raise ValueError(f"Not a run report: {path}")
+        report.samples = samples
+        return report
+
+    @staticmethod
+    def default_path(macro_path, directory=REPORT_DIRECTORY):
+        """reports/<macro file stem>-<local time to the millisecond>.jsonl"""
+        stem = os.path.splitext(os.path.basename(macro_path))[0]
+        stamp = datetime.now().strftime("%Y%m%d-%H%M%S-%f")[:-3]
+        return os.path.join(directory, f"{stem}-{stamp}{REPORT_EXTENSION}")
+
+    @staticmethod
+    def compare(before, after):
+        """Rows of (metric, statistic, before, after, change) for two summaries"""
+        rows = []
+        for metric in METRICS:
+            for statistic in before[metric]:
+                old = before[metric][statistic]
+                new = after[metric].get(statistic, 0.0)
+                rows.append((metric, statistic, old, new, round(new - old, 3)))
+        rows.append(('drift', 'final', before['final_drift'], after['final_drift'],
+                     round(after['final_drift'] - before['final_drift'], 3)))
+        return rows
+
+    @staticmethod
+    def format_summary(summary):
+        """One line per metric, in milliseconds"""
+        lines = [f"{summary['actions']} actions, final drift {summary['final_drift']:.3f} ms"]
+        for metric in METRICS:
+            stats = summary[metric]
+            percentiles = "  ".join(f"p{pct} {stats[f'p{pct}']:8.3f}" for pct in PERCENTILES)
+            lines.append(f"  {metric:<9} mean {stats['mean']:8.3f}  {percentiles}  max {stats['max']:8.3f} ms")
+        return "\n".join(lines)
+
+    @classmethod
+    def iteration_summary(cls, times, wall_time):
+        """Sustained throughput of a looped run: iteration count, per-iteration time statistics
+        in milliseconds and iterations per hour over wall_time seconds, gaps included"""
+        return {
+            'count': len(times),
+            'time': cls._stats(times),
+            'per_hour': round(len(times) * 3600.0 / wall_time, 2) if wall_time > 0 else 0.0
+        }
+
+    @staticmethod
+    def format_iterations(summary):
+        """One line, e.g. '12 iterations, mean 29.81 s (p95 30.12 s, max 30.40 s), 118.5/hour'"""
+        stats = summary['time']
+        noun = "iteration" if summary['count'] == 1 else "iterations"
+        return (f"{summary['count']} {noun}, mean {stats['mean'] / 1000:.2f} s "
+                f"(p95 {stats['p95'] / 1000:.2f} s, max {stats['max'] / 1000:.2f} s), {summary['per_hour']:g}/hour")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Summarize or compare playback timing reports")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    show_parser = subparsers.add_parser("show", help="print the percentile summary of reports")
+    show_parser.add_argument("reports", nargs="+")
+    show_parser.add_argument("--json", action="store_true")
+
+    diff_parser = subparsers.add_parser("diff", help="compare two reports, e.g. across runs or machines")
+    diff_parser.add_argument("before")
+    diff_parser.add_argument("after")
+    diff_parser.add_argument("--json", action="store_true")
+
+    args = parser.parse_args(argv)
+
+    if args.command == "show":
+        summaries = {path: RunReport.load(path).summary() for path in args.reports}
+        if args.json:
+            print(json.dumps(summaries, indent=2))
+        else:
+            for path, summary in summaries.items():
+                print(path)
+                print(RunReport.format_summary(summary))
+        return 0
+
+    rows = RunReport.compare(RunReport.load(args.before).summary(), RunReport.load(args.after).summary())
+    if args.json:
+        print(json.dumps([dict(zip(('metric', 'statistic', 'before', 'after', 'change'), row)) for row in rows], indent=2))
+    else:
+        for metric, statistic, old, new, change in rows:
+            print(f"{metric:<9} {statistic:<6} {old:10.3f} {new:10.3f} {change:+10.3f} ms")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
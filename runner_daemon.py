@@ -0,0 +1,400 @@
+"""Long-lived macro runner worker.
+
+The GUI starts this once and talks to it over stdin/stdout with one JSON object per line,
+so back-to-back runs skip process startup and re-parsing. Any executable that speaks the
+same protocol can stand in for it.
+
+Requests carry an "id" and a "cmd"; every request gets exactly one response with the same
+"id" and "ok" (plus "error" when ok is false). Commands:
+
+    {"id": 1, "cmd": "ping"}                      -> {"id": 1, "ok": true, "pid": ...}
+    {"id": 2, "cmd": "load", "path": "..."}       -> {"id": 2, "ok": true, "actions": 120, "duration": 30.0, ...}
+    {"id": 3, "cmd": "run", "path": "..."}        -> {"id": 3, "ok": true, "result": {...}} once playback ends
+    {"id": 4, "cmd": "stop"}                      -> {"id": 4, "ok": true, "running": true}
+    {"id": 5, "cmd": "unload", "path": "..."}     -> {"id": 5, "ok": true}
+    {"id": 6, "cmd": "shutdown"}                  -> {"id": 6, "ok": true}, then the worker exits
+
+While a run is in progress the worker keeps reading requests, so "stop" takes effect
+immediately; a second "run" is rejected with "error": "busy". "load" and "run" accept an
+optional "optimize": true to play the MacroOptimizer output instead of the raw actions,
+and "speed" (factor) and "turbo_delay" (seconds) to retime the recorded gaps (see
+PlaybackSpeed). "load" answers with the scheduled "duration" in seconds, and the "run"
+result carries "predicted", the scheduled length of the part that was played.
+"run" also accepts "report": a path where the per-action timing report is written as JSONL;
+the result then carries the report's percentile summary under "timing". To resume part way
+through, "run" takes "start" (an action index) or "start_time" (seconds into the schedule;
+the first action due at or after it); the result's "start_index" is where playback began and
+"offset" the scheduled time of the last action fired.
+"run" loops over the resident schedule with "repeat" (iterations, 0 = until stopped),
+"repeat_for" (seconds after which no new iteration starts) and "gap" (seconds between
+iterations); only the first iteration honours a start position. A looped result carries
+"iterations", the number finished, and "iteration_times", their lengths in seconds.
+
+Messages without an "id" key but with an "event" key are unsolicited notifications and may
+be ignored. While a macro plays, the worker streams progress notifications for the "run"
+request, at most one per progress_interval seconds plus one for the final action:
+
+    {"event": "progress", "request": 3, "fired": 40, "total": 120, "offset": 12.5, "duration": 30.0,
+     "iteration": 1}
+
+"offset" is the fired action's scheduled time and "duration" the scheduled length of the
+whole run, both in seconds from the start of playback; "iteration" counts from 1. A looped
+run also sends one notification per finished iteration:
+
+    {"event": "iteration", "request": 3, "iteration": 1, "elapsed": 30.02}
+"""
+import os
+import sys
+import json
+import time
+import queue
+import argparse
+import itertools
+import threading
+import subprocess
+from collections import OrderedDict
+
+from utils import MacroUtils
+from playback import PlaybackEngine, PlaybackSpeed, PynputBackend, RecordingBackend
+from macro_optimizer import MacroOptimizer
+from run_report import RunReport
+
+# Parsed schedules kept resident, least recently used first out; each entry is one macro
+CACHE_SIZE = 4
+
+
+class RunnerDaemon:
+    """Worker side of the runner protocol: keeps the last few parsed macro schedules resident between runs"""
+
+    def __init__(self, backend, output=None, progress_interval=0.05, cache_size=CACHE_SIZE):
+        self.engine = PlaybackEngine(backend)
+        self.output = output or sys.stdout
+        self.progress_interval = progress_interval
+        self.cache_size = cache_size
+        # path -> ((mtime, size, optimize, speed), schedule), most recently used last
+        self.cache = OrderedDict()
+        self._cache_lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._run_thread = None
+
+    def send(self, message):
+        with self._write_lock:
+            self.output.write(json.dumps(message) + "\n")
+            self.output.flush()
+
+    def _load(self, path, optimize=False, speed=None):
+        """Parse and schedule a macro once, re-parsing only when the file or the options changed"""
+        speed = speed or PlaybackSpeed()
+        stat = os.stat(path)
+        key = (stat.st_mtime_ns, stat.st_size, optimize, speed.key)
+        with self._cache_lock:
+            cached = self.cache.get(path)
+            if cached and cached[0] == key:
+                self.cache.move_to_end(path)
+                return cached[1], True
+
+        # Binary macros stay columnar, so only the actions that get played are built as dicts
+        data = MacroUtils.load_macro_data(path, lazy=True)
+        actions = data.get('actions', [])
+        if optimize:
+            actions, _ = MacroOptimizer().optimize(actions)
+        schedule = PlaybackEngine.schedule(speed.apply(actions))
+        with self._cache_lock:
+            self.cache[path] = (key, schedule)
+            self.cache.move_to_end(path)
+            while len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+        return schedule, False
+
+    def _progress_reporter(self, request_id, schedule, iteration=None):
+        """Playback progress callback that sends throttled progress notifications"""
+        duration = PlaybackEngine.schedule_duration(schedule)
+        last_sent = [0.0]
+        iteration = iteration or [1]
+
+        def report(fired, total):
+            now = time.monotonic()
+            if fired < total and now - last_sent[0] < self.progress_interval:
+                return
+            last_sent[0] = now
+            self.send({
+                'event': 'progress',
+                'request': request_id,
+                'fired': fired,
+                'total': total,
+                'offset': schedule[fired - 1][0],
+                'duration': duration,
+                'iteration': iteration[0]
+            })
+
+        return report
+
+    def _run(self, request_id, path, optimize=False, report_path=None, start=None, start_time=None, speed=None,
+             repeat=1, repeat_for=None, gap=0.0):
+        try:
+            schedule, _ = self._load(path, optimize, speed)
+            # Seeking is a lookup in the resident schedule, never a re-parse
+            if start is not None:
+                start_index = min(max(int(start), 0), len(schedule))
+            elif start_time is not None:
+                start_index = PlaybackEngine.seek(schedule, float(start_time))
+            else:
+                start_index = 0
+            report = RunReport(macro=path, engine="python") if report_path else None
+            if repeat == 1 and repeat_for is None:
+                result = self.engine.play_schedule(
+                    schedule, self._progress_reporter(request_id, schedule), report, start_index
+                )
+            else:
+                # Every iteration replays the same resident schedule
+                iteration = [1]
+
+                def on_iteration(number, finished):
+                    iteration[0] = number + 1
+                    self.send({
+                        'event': 'iteration', 'request': request_id, 'iteration': number,
+                        'elapsed': finished['elapsed']
+                    })
+
+                result = self.engine.play_loop(
+                    schedule, int(repeat), None if repeat_for is None else float(repeat_for), float(gap),
+                    self._progress_reporter(request_id, schedule, iteration), report, start_index, on_iteration
+                )
+            duration = PlaybackEngine.schedule_duration(schedule)
+            skipped = 0.0 if start_index == 0 else schedule[start_index][0] if start_index < len(schedule) else duration
+            result['predicted'] = duration - skipped
+            if report is not None:
+                result['timing'] = report.write(report_path)
+                result['report'] = report_path
+            self.send({'id': request_id, 'ok': True, 'result': result})
+        except Exception as e:
+            self.send({'id': request_id, 'ok': False, 'error': str(e)})
+
+    def handle(self, request):
+        """Handle one request; returns False when the worker should exit"""
+        request_id = request.get('id')
+        command = request.get('cmd')
+
+        try:
+            if command == 'ping':
+                self.send({'id': request_id, 'ok': True, 'pid': os.getpid()})
+            elif command == 'load':
+                schedule, cached = self._load(
+                    request['path'], request.get('optimize', False), PlaybackSpeed.from_params(request)
+                )
+                self.send({
+                    'id': request_id, 'ok': True, 'actions': len(schedule), 'cached': cached,
+                    'duration': PlaybackEngine.schedule_duration(schedule)
+                })
+            elif command == 'unload':
+                with self._cache_lock:
+                    self.cache.pop(request['path'], None)
+                self.send({'id': request_id, 'ok': True})
+            elif command == 'run':
+                if self._run_thread and self._run_thread.is_alive():
+                    self.send({'id': request_id, 'ok': False, 'error': 'busy'})
+                else:
+                    # Accepting the run clears old stops; one sent while it loads still counts
+                    self.engine.reset()
+                    self._run_thread = threading.Thread(
+                        target=self._run,
+                        args=(
+                            request_id, request['path'], request.get('optimize', False), request.get('report'),
+                            request.get('start'), request.get('start_time'), PlaybackSpeed.from_params(request),
+                            request.get('repeat', 1), request.get('repeat_for'), request.get('gap') or 0.0
+                        ),
+                        daemon=True
+                    )
+                    self._run_thread.start()
+            elif command == 'stop':
+                running = bool(self._run_thread and self._run_thread.is_alive())
+                self.engine.stop()
+                self.send({'id': request_id, 'ok': True, 'running': running})
+            elif command == 'shutdown':
+                self.engine.stop()
+                if self._run_thread:
+                    self._run_thread.join()
+                self.send({'id': request_id, 'ok': True})
+                return False
+            else:
+                self.send({'id': request_id, 'ok': False, 'error': f"Unknown command: {command}"})
+        except Exception as e:
+            self.send({'id': request_id, 'ok': False, 'error': str(e)})
+        return True
+
+    def serve(self, input_stream=None):
+        """Read requests until shutdown or end of input"""
+        for line in input_stream or sys.stdin:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                request = json.loads(line)
+            except ValueError as e:
+                self.send({'id': None, 'ok': False, 'error': f"Invalid request: {e}"})
+                continue
+            if not self.handle(request):
+                break
+        self.engine.stop()
+
+
+class RunnerClient:
+    """GUI side of the runner protocol: starts the worker once and multiplexes requests over its pipes"""
+
+    def __init__(self, command=None, timeout=10):
+        self.command = command or [sys.executable, os.path.abspath(__file__), "--backend", "pynput"]
+        self.timeout = timeout
+        self.process = None
+        self._ids = itertools.count(1)
+        self._pending = {}
+        self._event_handlers = {}
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        # Serializes starting and closing the worker, so concurrent requests never spawn two
+        self._process_lock = threading.Lock()
+        self._reader = None
+
+    @property
+    def alive(self):
+        return self.process is not None and self.process.poll() is None
+
+    def start(self):
+        """Start the worker process if it is not already running"""
+        with self._process_lock:
+            if self.alive:
+                return
+            creationflags = getattr(subprocess, 'CREATE_NO_WINDOW', 0) if os.name == 'nt' else 0
+            self.process = subprocess.Popen(
+                self.command,
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+                text=True,
+                bufsize=1,
+                creationflags=creationflags
+            )
+            self._reader = threading.Thread(target=self._read_loop, args=(self.process,), daemon=True)
+            self._reader.start()
+
+    def _read_loop(self, process):
+        for line in process.stdout:
+            try:
+                message = json.loads(line)
+            except ValueError:
+                continue
+            # Notifications go to the handler registered for their request
+            if 'event' in message and 'id' not in message:
+                with self._lock:
+                    handler = self._event_handlers.get(message.get('request'))
+                if handler is not None:
+                    handler(message)
+                continue
+            with self._lock:
+                waiter = self._pending.get(message.get('id'))
+            if waiter is not None:
+                waiter.put(message)
+
+        # The worker went away: fail everything still waiting
+        with self._lock:
+            waiters = list(self._pending.values())
+        for waiter in waiters:
+            waiter.put({'ok': False, 'error': "Runner process exited"})
+
+    def request(self, command, timeout=None, on_event=None, **params):
+        """Send a request and wait for its response; failures come back as ok=False responses.
+
+        on_event, if given, is called on the reader thread with each notification for the request.
+        """
+        try:
+            self.start()
+        except OSError as e:
+            return {'ok': False, 'error': f"Failed to start runner: {e}"}
+
+        request_id = next(self._ids)
+        waiter = queue.Queue()
+        with self._lock:
+            self._pending[request_id] = waiter
+            if on_event is not None:
+                self._event_handlers[request_id] = on_event
+
+        try:
+            message = dict(params, id=request_id, cmd=command)
+            process = self.process
+            try:
+                if process is None:
+                    raise OSError("worker closed")
+                with self._write_lock:
+                    process.stdin.write(json.dumps(message) + "\n")
+                    process.stdin.flush()
+            except OSError as e:
+                return {'ok': False, 'error': f"Runner unavailable: {e}"}
+
+            try:
+                return waiter.get(timeout=self.timeout if timeout is None else timeout)
+            except queue.Empty:
+                return {'ok': False, 'error': f"Runner did not answer '{command}' in time"}
+        finally:
+            with self._lock:
+                self._pending.pop(request_id, None)
+                self._event_handlers.pop(request_id, None)
+
+    def ping(self):
+        return self.request('ping')
+
+    def load(self, path, optimize=False, speed=None):
+        params = speed.params() if speed else {}
+        return self.request('load', path=os.path.abspath(path), optimize=optimize, **params)
+
+    def run(self, path, timeout=None, optimize=False, on_progress=None, report=None, start=None, start_time=None,
+            speed=None, repeat=1, repeat_for=None, gap=0.0):
+        """Run a macro and block until it finishes; timeout None waits indefinitely.
+
+        on_progress, if given, receives each progress and iteration notification as a dict;
+        report, if given, is the path the worker writes the timing report to. start (action
+        index) or start_time (seconds) resume playback part way through; speed is a
+        PlaybackSpeed. repeat, repeat_for and gap loop the macro inside the worker.
+        """
+        timeout = threading.TIMEOUT_MAX if timeout is None else timeout
+        params = speed.params() if speed else {}
+        if report:
+            params['report'] = os.path.abspath(report)
+        if start is not None:
+            params['start'] = start
+        elif start_time is not None:
+            params['start_time'] = start_time
+        if repeat != 1 or repeat_for is not None:
+            params.update(repeat=repeat, repeat_for=repeat_for, gap=gap)
+        return self.request(
+            'run', timeout=timeout, on_event=on_progress, path=os.path.abspath(path), optimize=optimize, **params
+        )
+
+    def stop(self):
+        return self.request('stop')
+
+    def close(self):
+        """Ask the worker to exit, killing it if it does not"""
+        if not self.alive:
+            return
+        self.request('shutdown', timeout=2)
+        with self._process_lock:
+            process, self.process = self.process, None
+        if process is None:
+            return
+        try:
+            process.wait(timeout=2)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Persistent macro runner worker (JSON lines on stdin/stdout)")
+    parser.add_argument("--backend", choices=("pynput", "stub"), default="pynput",
+                        help="send real input, or only record it (for headless testing)")
+    args = parser.parse_args(argv)
+
+    backend = PynputBackend() if args.backend == "pynput" else RecordingBackend()
+    RunnerDaemon(backend).serve()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,157 @@
+import os
+import json
+import time
+import hashlib
+import threading
+
+# One pooled session for every download, so repeated checks reuse the TLS connection
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_session():
+    """Shared HTTP session, created on first use so requests is only imported when needed"""
+    global _session
+    with _session_lock:
+        if _session is None:
+            import requests
+            _session = requests.Session()
+            _session.headers['User-Agent'] = "ASTDX-MacroRunner"
+        return _session
+
+
+class ScriptUpdater:
+    """Keeps a local copy of a remote file current with conditional, verified and atomic downloads.
+
+    Validators (ETag / Last-Modified) and the SHA-256 of the local copy are kept in a sidecar
+    JSON file next to it. A copy that no longer matches its recorded hash is fetched again.
+    """
+
+    def __init__(self, url, local_path, expected_sha256=None, timeout=(3.05, 10), offline_timeout=(1.5, 5)):
+        # timeout is used when there is no usable local copy; once there is one, the shorter
+        # offline_timeout applies, because a slow network can fall back to the cached copy
+        self.url = url
+        self.local_path = local_path
+        self.meta_path = local_path + ".meta.json"
+        self.expected_sha256 = expected_sha256.lower() if expected_sha256 else None
+        self.timeout = timeout
+        self.offline_timeout = offline_timeout
+
+    @staticmethod
+    def _sha256(path):
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 16), b""):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    def _load_meta(self):
+        try:
+            with open(self.meta_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save_meta(self, meta):
+        temp_path = self.meta_path + ".tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(meta, f, indent=2)
+        os.replace(temp_path, self.meta_path)
+
+    def has_valid_copy(self, meta=None):
+        """Whether the local copy exists and still matches the hash recorded when it was downloaded"""
+        if not os.path.exists(self.local_path):
+            return False
+        meta = self._load_meta() if meta is None else meta
+        if 'sha256' not in meta:
+            # A copy from before the updater existed is trusted until the next successful download
+            return True
+        try:
+            return self._sha256(self.local_path) == meta['sha256']
+        except OSError:
+            return False
+
+    def ensure(self, max_age=None):
+        """Make sure a usable copy exists, only touching the network when it is missing, invalid or older than max_age seconds"""
+        meta = self._load_meta()
+        if self.has_valid_copy(meta):
+            if max_age is None or time.time() - meta.get('checked_at', 0) < max_age:
+                return True, "Using cached copy"
+        return self.update()
+
+    def update(self, force=False):
+        """Fetch the file if it changed upstream; returns (success, message), where success means a usable copy is in place"""
+        meta = self._load_meta()
+        have_copy = self.has_valid_copy(meta)
+
+        headers = {}
+        if have_copy and not force:
+            if meta.get('etag'):
+                headers['If-None-Match'] = meta['etag']
+            if meta.get('last_modified'):
+                headers['If-Modified-Since'] = meta['last_modified']
+
+        import requests
+        try:
+            response = get_session().get(
+                self.url,
+                headers=headers,
+                timeout=self.offline_timeout if have_copy else self.timeout
+            )
+            if response.status_code == 304 and have_copy:
+                meta['checked_at'] = time.time()
+                self._save_meta(meta)
+                return True, "Already up to date"
+            response.raise_for_status()
+        except requests.RequestException as e:
+            if have_copy:
+                return True, f"Using cached copy (update check failed: {e})"
+            return False, f"Request error: {str(e)}"
+
+        content = response.content
+        sha256 = hashlib.sha256(content).hexdigest()
+        if not content:
+            return self._reject(have_copy, "server returned an empty file")
+        if self.expected_sha256 and sha256 != self.expected_sha256:
+            return self._reject(have_copy, f"checksum mismatch (got {sha256})")
+
+        meta.update({
+            'url': self.url,
+            'etag': response.headers.get('ETag'),
+            'last_modified': response.headers.get('Last-Modified'),
+            'sha256': sha256,
+            'size': len(content),
+            'checked_at': time.time()
+        })
+
+        # Identical content: keep the file untouched and only record the new validators
+        if have_copy and self._sha256(self.local_path) == sha256:
+            self._save_meta(meta)
+            return True, "Already up to date"
+
+        try:
+            directory = os.path.dirname(os.path.abspath(self.local_path))
+            if not os.path.exists(directory):
+                os.makedirs(directory)
+            temp_path = self.local_path + ".tmp"
+            with open(temp_path, 'wb') as f:
+                f.write(content)
+                f.flush()
+                os.fsync(f.fileno())
+
+            # Verify what actually reached the disk before it replaces the working copy
+            if self._sha256(temp_path) != sha256:
+                os.remove(temp_path)
+                return self._reject(have_copy, "written file failed verification")
+            os.replace(temp_path, self.local_path)
+            self._save_meta(meta)
+        except OSError as e:
+            return False, f"Error saving file: {str(e)}"
+
+        return True, "File downloaded successfully"
+
+    @staticmethod
+    def _reject(have_copy, reason):
+        if have_copy:
+            return True, f"Kept cached copy: {reason}"
+        return False, f"Download rejected: {reason}"
@@ -0,0 +1,62 @@
+import os
+import sys
+import subprocess
+import tempfile
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import backup_store
+from backup_store import BackupStore
+
+
+class BackupStoreLockTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.store = BackupStore(os.path.join(self.directory.name, ".backups"))
+        self.macro = os.path.join(self.directory.name, "farm.json")
+        with open(self.macro, 'w') as f:
+            f.write('{"name": "farm", "actions": []}')
+        os.makedirs(self.store.root)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def write_lock(self, content):
+        with open(self.store.lock_path, 'w') as f:
+            f.write(content)
+
+    def test_lock_of_an_exited_process_is_broken(self):
+        process = subprocess.Popen([sys.executable, "-c", "pass"])
+        process.wait()
+        self.write_lock(f"{process.pid} feedface")
+
+        entry, created = self.store.backup(self.macro)
+        self.assertTrue(created)
+        self.assertFalse(os.path.exists(self.store.lock_path))
+        self.assertTrue(os.path.exists(self.store._object_path(entry['hash'])))
+
+    def test_lock_of_a_live_process_is_never_broken(self):
+        process = subprocess.Popen([sys.executable, "-c", "import time; time.sleep(30)"])
+        try:
+            self.write_lock(f"{process.pid} feedface")
+            # Even an old lock is kept while its process runs
+            os.utime(self.store.lock_path, (0, 0))
+            with mock.patch.object(backup_store, 'LOCK_TIMEOUT', 0.2):
+                with self.assertRaisesRegex(Exception, f"locked by process {process.pid}"):
+                    self.store.backup(self.macro)
+            self.assertEqual(self.store._read_lock(), f"{process.pid} feedface")
+        finally:
+            process.kill()
+            process.wait()
+
+    def test_release_leaves_a_lock_taken_over_by_another_process(self):
+        with self.store._manifest_lock():
+            self.write_lock("1 someone-else")
+        self.assertEqual(self.store._read_lock(), "1 someone-else")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,56 @@
+import os
+import sys
+import json
+import tempfile
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from checkpoints import CheckpointStore
+from macro_executor import MacroExecutor
+from playback import PlaybackSpeed
+from runner_daemon import RunnerClient
+
+
+class CheckpointSpeedTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.macro = os.path.join(self.directory.name, "farm.json")
+        with open(self.macro, 'w') as f:
+            json.dump({'name': 'farm', 'actions': [
+                {'type': 'key_press', 'key': 'a', 'timestamp': index * 0.01} for index in range(5)
+            ]}, f)
+        self.store = CheckpointStore()
+        self.fast = PlaybackSpeed(2.0)
+        self.store.save(self.macro, "python", False, 3, 5, 0.01, speed=self.fast)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_checkpoint_records_its_speed(self):
+        checkpoint = self.store.load(self.macro)
+        self.assertEqual(CheckpointStore.speed_of(checkpoint).key, self.fast.key)
+        self.assertEqual(CheckpointStore.describe(checkpoint), "action 3/5 (0:00 in at 2x)")
+
+        del checkpoint['speed']
+        self.assertTrue(CheckpointStore.speed_of(checkpoint).is_normal)
+
+    def test_resume_only_at_the_checkpoint_speed(self):
+        client = RunnerClient(command=[sys.executable, os.path.join(ROOT, "runner_daemon.py"), "--backend", "stub"])
+        self.addCleanup(client.close)
+        executor = MacroExecutor(engine="python", runner_client=client, checkpoints=self.store)
+
+        with self.assertRaisesRegex(Exception, "Checkpoint was taken at 2x, not 1x"):
+            executor.run(self.macro, resume=True)
+        self.assertIsNotNone(self.store.load(self.macro))
+
+        result = executor.run(self.macro, resume=True, speed=self.fast)
+        self.assertTrue(result['completed'])
+        self.assertEqual(result['start_index'], 3)
+        self.assertIsNone(self.store.load(self.macro))
+
+
+if __name__ == "__main__":
+    unittest.main()
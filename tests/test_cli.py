@@ -0,0 +1,65 @@
+import os
+import sys
+import json
+import tempfile
+import subprocess
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class CliRunTest(unittest.TestCase):
+    """Runs cli.py headless on the Python engine with the stub backend"""
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.macros = os.path.join(self.directory.name, "macros")
+        os.makedirs(self.macros)
+        with open(os.path.join(self.macros, "farm.json"), 'w') as f:
+            json.dump({'name': 'farm', 'actions': [
+                {'type': 'key_press', 'key': 'a', 'timestamp': index * 0.01} for index in range(5)
+            ]}, f)
+        with open(os.path.join(self.macros, "broken.json"), 'w') as f:
+            f.write('{"name": "broken", "actions": [')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def run_cli(self, *args, as_json=True):
+        return subprocess.run(
+            [sys.executable, os.path.join(ROOT, "cli.py"), "--dir", self.macros, "run",
+             "--engine", "python", "--backend", "stub"] + (["--json"] if as_json else []) + list(args),
+            cwd=self.directory.name, capture_output=True, text=True, timeout=60
+        )
+
+    def test_looped_run_succeeds(self):
+        process = self.run_cli("farm", "--iterations", "3")
+        self.assertEqual(process.returncode, 0, process.stdout + process.stderr)
+        summary = json.loads(process.stdout)
+        self.assertEqual((summary['runs'], summary['succeeded'], summary['failed']), (1, 1, 0))
+        self.assertEqual(summary['stop_reason'], "finished")
+
+        process = self.run_cli("farm", "--iterations", "3", as_json=False)
+        self.assertEqual(process.returncode, 0)
+        self.assertIn("[ok] farm.json in", process.stdout)
+        self.assertIn(": 3 iterations,", process.stdout)
+
+    def test_failed_run_exits_1(self):
+        process = self.run_cli("farm", "broken")
+        self.assertEqual(process.returncode, 1, process.stdout + process.stderr)
+        summary = json.loads(process.stdout)
+        self.assertEqual((summary['succeeded'], summary['failed']), (1, 1))
+
+    def test_unknown_macro_exits_2(self):
+        process = self.run_cli("nothere")
+        self.assertEqual(process.returncode, 2)
+        self.assertIn("Macro not found", process.stdout)
+
+    def test_repeat_below_1_is_rejected(self):
+        process = self.run_cli("farm", "--repeat", "0")
+        self.assertEqual(process.returncode, 2)
+        self.assertIn("--repeat must be at least 1", process.stderr)
+
+
+if __name__ == "__main__":
+    unittest.main()
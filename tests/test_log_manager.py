@@ -0,0 +1,57 @@
+import os
+import sys
+import json
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils import LogManager
+
+
+class AsyncLogManagerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "ops.log")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def messages(self):
+        with open(self.path, encoding='utf-8') as f:
+            return [json.loads(line)['message'] for line in f]
+
+    def test_close_writes_queued_and_later_records(self):
+        manager = LogManager(self.path, async_mode=True)
+        manager.info("first", step=1)
+        manager.close()
+        manager.info("after close")
+
+        self.assertEqual(self.messages(), ["first", "after close"])
+
+    def test_record_queued_behind_the_sentinel_is_not_lost(self):
+        manager = LogManager(self.path, async_mode=True)
+        manager.info("before")
+        # Reproduce the race: the writer stops at a sentinel and a record lands behind it
+        manager._queue.put(None)
+        manager.info("late")
+        manager._writer.join(5)
+        manager.close()
+
+        self.assertEqual(self.messages(), ["before", "late"])
+
+    def test_drops_are_reported_on_close(self):
+        manager = LogManager(self.path, async_mode=True, max_queue=1)
+        manager._queue.put(None)
+        manager._writer.join(5)
+        manager.info("queued")
+        manager.info("dropped")
+        # The writer is gone and the queue is full, so the sentinel cannot be queued
+        manager.close(timeout=0.1)
+
+        self.assertEqual(self.messages(), ["queued", "Log queue full, records dropped"])
+
+
+if __name__ == "__main__":
+    unittest.main()
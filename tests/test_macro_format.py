@@ -0,0 +1,61 @@
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from macro_format import BinaryMacroFormat, ColumnarActions
+from playback import PlaybackEngine, LazySchedule
+
+ACTIONS = [
+    {'type': 'click', 'x': 10, 'y': 20, 'button': 'left', 'timestamp': 0.5},
+    {'type': 'wait', 'duration': 0.75, 'timestamp': 1.0},
+    {'type': 'key_press', 'key': 'a', 'timestamp': 1.25},
+    "not an action",
+    {'type': 'drag', 'x': 5, 'y': 6, 'button': 'left', 'state': 'down', 'timestamp': 0.25},
+    {'type': 'click', 'x': 30, 'y': 40, 'button': 'right', 'timestamp': 2, 'note': 'kept verbatim'},
+    {'type': 'wait', 'duration': 0.5, 'timestamp': 3.0}
+]
+
+
+class ColumnarActionsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "farm.astm")
+        BinaryMacroFormat.save(self.path, {'name': 'farm', 'actions': ACTIONS})
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_lazy_load_reads_the_same_actions(self):
+        actions = BinaryMacroFormat.load(self.path, lazy=True)['actions']
+        self.assertIsInstance(actions, ColumnarActions)
+        self.assertEqual(len(actions), len(ACTIONS))
+        self.assertEqual(list(actions), ACTIONS)
+        self.assertEqual(actions[-1], ACTIONS[-1])
+        self.assertEqual(actions[1:3], ACTIONS[1:3])
+        self.assertEqual(BinaryMacroFormat.load(self.path)['actions'], ACTIONS)
+
+    def test_column_fills_in_missing_fields(self):
+        actions = BinaryMacroFormat.load(self.path, lazy=True)['actions']
+        self.assertEqual(actions.column('duration', 0),
+                         [action.get('duration', 0) if isinstance(action, dict) else 0 for action in ACTIONS])
+        self.assertEqual(actions.indexes_of('type', 'wait'), [1, 6])
+        self.assertEqual(actions.non_dict_indexes, {3})
+
+    def test_columnar_schedule_matches_the_dict_schedule(self):
+        actions = BinaryMacroFormat.load(self.path, lazy=True)['actions']
+        lazy = PlaybackEngine.schedule(actions)
+        plan = PlaybackEngine.schedule(ACTIONS)
+
+        self.assertIsInstance(lazy, LazySchedule)
+        self.assertEqual(list(lazy), plan)
+        self.assertEqual(PlaybackEngine.schedule_duration(lazy), PlaybackEngine.schedule_duration(plan))
+        for offset in (0, 1.0, 1.3, 2.5, 10):
+            self.assertEqual(PlaybackEngine.seek(lazy, offset), PlaybackEngine.seek(plan, offset))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,99 @@
+import os
+import sys
+import json
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils import MacroUtils, MacroHandle
+from recording import RecordingJournal
+
+ACTIONS = [
+    {'type': 'click', 'x': 10, 'y': 20, 'button': 'left', 'timestamp': 0.5},
+    {'type': 'key_press', 'key': 'a', 'timestamp': 1.25},
+    {'type': 'click', 'x': 30, 'y': 40, 'button': 'right', 'timestamp': 2.0}
+]
+
+
+class MacroHeaderTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def path(self, name):
+        return os.path.join(self.directory.name, name)
+
+    def write_json(self, name, data):
+        with open(self.path(name), 'w') as f:
+            json.dump(data, f, indent=2)
+        return self.path(name)
+
+    def test_saved_macro_stores_its_counts_ahead_of_the_actions(self):
+        path = self.write_json("farm.json", MacroUtils.with_summary({'name': 'farm', 'created': 'now', 'actions': ACTIONS}))
+        with open(path) as f:
+            text = f.read()
+        self.assertLess(text.index('"actions_count"'), text.index('"actions"'))
+
+        self.assertEqual(MacroUtils.read_macro_header(path), {
+            'name': 'farm', 'created': 'now', 'actions_count': 3, 'total_duration': 2.0
+        })
+
+    def test_header_read_stops_before_the_actions(self):
+        path = self.write_json("farm.json", MacroUtils.with_summary({'name': 'farm', 'created': 'now', 'actions': ACTIONS}))
+        # Anything after the start of the actions array is never looked at
+        with open(path, 'r+') as f:
+            text = f.read()
+            f.seek(text.index('"actions":') + len('"actions":'))
+            f.write(' [not json')
+            f.truncate()
+
+        self.assertEqual(MacroUtils.read_macro_header(path)['actions_count'], 3)
+
+    def test_legacy_macro_is_parsed_in_full(self):
+        path = self.write_json("old.json", {'name': 'old', 'created': 'then', 'actions': ACTIONS, 'total_duration': 2.0})
+
+        self.assertEqual(MacroUtils.read_macro_header(path), {
+            'name': 'old', 'created': 'then', 'actions_count': 3, 'total_duration': 2.0
+        })
+
+    def test_journal_writes_counts_for_both_formats(self):
+        journal = RecordingJournal(self.path("journal.jsonl"))
+        journal.open()
+        for action in ACTIONS:
+            journal.append(action)
+
+        for name, binary in (("rec.json", False), ("rec.astm", True)):
+            journal.write_macro(self.path(name), "rec", "now", binary=binary)
+            header = MacroUtils.read_macro_header(self.path(name))
+            self.assertEqual((header['actions_count'], header['total_duration']), (3, 2.0))
+            self.assertEqual(MacroUtils.load_macro_data(self.path(name))['actions'], ACTIONS)
+
+    def test_handle_reads_metadata_without_the_actions(self):
+        path = self.write_json("farm.json", MacroUtils.with_summary({'name': 'farm', 'created': 'now', 'actions': ACTIONS}))
+        with open(path, 'r+') as f:
+            text = f.read()
+            f.seek(text.index('"actions":') + len('"actions":'))
+            f.write(' [not json')
+            f.truncate()
+
+        handle = MacroHandle(path)
+        self.assertEqual(handle.name, 'farm')
+        self.assertEqual(handle.header['actions_count'], 3)
+        self.assertFalse(handle.is_loaded)
+
+    def test_stale_count_fails_validation(self):
+        data = MacroUtils.with_summary({'name': 'farm', 'actions': ACTIONS})
+        data['actions_count'] = 5
+        path = self.write_json("farm.json", data)
+
+        valid, message = MacroUtils.validate_macro_file(path)
+        self.assertFalse(valid)
+        self.assertIn("actions_count", message)
+
+
+if __name__ == "__main__":
+    unittest.main()
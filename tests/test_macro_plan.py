@@ -0,0 +1,38 @@
+import os
+import sys
+import json
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from macro_plan import MacroPlan
+
+
+class MacroPlanTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_line_breaks_in_fields_keep_the_header_intact(self):
+        path = os.path.join(self.directory.name, "farm.json")
+        with open(path, 'w') as f:
+            json.dump({'name': "farm\r\nloop\tone", 'actions': [
+                {'type': 'key_press', 'key': "a\rb", 'timestamp': 0.1},
+                {'type': 'click', 'x': 1, 'y': 2, 'button': 'left', 'timestamp': 0.25}
+            ]}, f)
+
+        plan_path = MacroPlan.compile_file(path)
+        header, steps = MacroPlan.read(plan_path)
+
+        self.assertEqual(header['name'], "farm  loop one")
+        self.assertEqual(header['actions'], "2")
+        self.assertEqual(MacroPlan.read_header(plan_path), header)
+        self.assertEqual(steps, [(100, ['K', '{a b}']), (150, ['C', '1', '2', 'left'])])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,66 @@
+import os
+import sys
+import json
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from macro_validator import MacroValidator
+from backup_store import BackupStore
+
+
+class MacroValidatorFixTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        store = BackupStore(os.path.join(self.directory.name, ".backups"))
+        self.validator = MacroValidator(fix=True, backup_store=store)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def write(self, name, data):
+        path = os.path.join(self.directory.name, name)
+        with open(path, 'w') as f:
+            json.dump(data, f)
+        return path
+
+    def test_valid_file_is_left_alone(self):
+        # total_duration differs from the last timestamp, but nothing fails validation
+        path = self.write("good.json", {'name': 'good', 'total_duration': 9.5, 'actions': [
+            {'type': 'key_press', 'key': 'a', 'timestamp': 2.0},
+            {'type': 'key_press', 'key': 'b', 'timestamp': 1.0}
+        ]})
+        with open(path, 'rb') as f:
+            before = f.read()
+
+        result = self.validator.validate_file(path)
+        self.assertTrue(result['valid'])
+        self.assertEqual(result['fixes'], [])
+        with open(path, 'rb') as f:
+            self.assertEqual(f.read(), before)
+
+    def test_invalid_file_is_repaired_and_each_fix_reported(self):
+        path = self.write("bad.json", {'name': 'bad', 'actions': [
+            {'type': 'click', 'x': 1, 'y': 2, 'timestamp': 1.5},
+            "stray"
+        ]})
+
+        result = self.validator.validate_file(path)
+        self.assertTrue(result['valid'], result['errors'])
+        self.assertEqual(result['fixes'], [
+            "dropped 1 non-object actions",
+            "set missing button to 'left' on 1 actions",
+            "recomputed total_duration (None -> 1.5)"
+        ])
+        self.assertTrue(result['backup'].startswith("bad.json@"))
+        self.assertFalse(os.path.exists(path + ".tmp"))
+        with open(path) as f:
+            data = json.load(f)
+        self.assertEqual(data['actions_count'], 1)
+        self.assertEqual(data['actions'][0]['button'], 'left')
+
+
+if __name__ == "__main__":
+    unittest.main()
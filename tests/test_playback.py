@@ -0,0 +1,93 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from playback import PlaybackEngine, RecordingBackend
+
+ACTIONS = [
+    {'type': 'click', 'x': 1, 'y': 2, 'button': 'left', 'timestamp': 0.5},
+    {'type': 'key_press', 'key': 'a', 'timestamp': 0.25},
+    {'type': 'wait', 'duration': 2.0, 'timestamp': 1.0},
+    {'type': 'move', 'x': 3, 'y': 4, 'timestamp': 1.5},
+    {'type': 'drag', 'x': 5, 'y': 6, 'button': 'right', 'state': 'down', 'timestamp': 1.75}
+]
+
+
+class VirtualClock:
+    """Clock whose sleeps advance time instantly, so deadlines can be checked exactly"""
+
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+class PlaybackEngineTest(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = VirtualClock()
+        self.backend = RecordingBackend(clock=self.clock)
+        # No spin phase: the virtual clock only moves when the engine sleeps
+        self.engine = PlaybackEngine(self.backend, spin_threshold=0, clock=self.clock, sleep=self.clock.sleep)
+
+    def fired(self, start):
+        return [(round(event[0] - start, 9),) + event[1:] for event in self.backend.events]
+
+    def test_schedule_sorts_and_pushes_actions_back_by_waits(self):
+        plan = PlaybackEngine.schedule(ACTIONS)
+        self.assertEqual([offset for offset, _ in plan], [0.25, 0.5, 1.0, 3.5, 3.75])
+        self.assertEqual([action['type'] for _, action in plan], ['key_press', 'click', 'wait', 'move', 'drag'])
+        self.assertEqual(PlaybackEngine.schedule_duration(plan), 3.75)
+        self.assertEqual(PlaybackEngine.seek(plan, 1.1), 3)
+
+    def test_actions_fire_at_their_deadlines(self):
+        start = self.clock.now
+        result = self.engine.play(ACTIONS)
+
+        self.assertTrue(result['completed'])
+        self.assertEqual(result['actions_fired'], 5)
+        self.assertEqual(result['max_late'], 0)
+        self.assertEqual(self.fired(start), [
+            (0.25, 'key_press', 'a'),
+            (0.5, 'click', 1, 2, 'left'),
+            (3.5, 'move', 3, 4),
+            (3.75, 'button_down', 5, 6, 'right')
+        ])
+
+    def test_start_index_resumes_with_the_original_spacing(self):
+        plan = PlaybackEngine.schedule(ACTIONS)
+        start = self.clock.now
+        result = self.engine.play_schedule(plan, start_index=3)
+
+        self.assertEqual(result['start_index'], 3)
+        self.assertEqual(result['actions_fired'], 2)
+        self.assertEqual(self.fired(start), [(0.0, 'move', 3, 4), (0.25, 'button_down', 5, 6, 'right')])
+
+    def test_stop_before_playback_fires_nothing(self):
+        self.engine.stop()
+        result = self.engine.play_schedule(PlaybackEngine.schedule(ACTIONS))
+
+        self.assertFalse(result['completed'])
+        self.assertEqual(result['actions_fired'], 0)
+        self.assertEqual(self.backend.events, [])
+
+    def test_loop_repeats_the_whole_schedule(self):
+        plan = PlaybackEngine.schedule(ACTIONS)
+        start = self.clock.now
+        result = self.engine.play_loop(plan, repeat=3)
+
+        self.assertTrue(result['completed'])
+        self.assertEqual(result['iterations'], 3)
+        self.assertEqual(result['iteration_times'], [3.75, 3.75, 3.75])
+        # Each iteration starts once the previous one's full length has passed
+        self.assertEqual([time for time, kind, *_ in self.fired(start) if kind == 'key_press'], [0.25, 4.0, 7.75])
+
+
+if __name__ == "__main__":
+    unittest.main()
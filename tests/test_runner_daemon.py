@@ -0,0 +1,99 @@
+import os
+import sys
+import json
+import time
+import tempfile
+import threading
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from runner_daemon import RunnerClient, CACHE_SIZE
+
+
+class RunnerDaemonProtocolTest(unittest.TestCase):
+    """Talks JSON lines to a real worker process running the stub backend"""
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.client = RunnerClient(command=[sys.executable, os.path.join(ROOT, "runner_daemon.py"), "--backend", "stub"])
+
+    def tearDown(self):
+        self.client.close()
+        self.directory.cleanup()
+
+    def write_macro(self, name, count, spacing):
+        path = os.path.join(self.directory.name, name)
+        with open(path, 'w') as f:
+            json.dump({'name': name, 'actions': [
+                {'type': 'key_press', 'key': 'a', 'timestamp': index * spacing} for index in range(count)
+            ]}, f)
+        return path
+
+    def test_ping_and_unknown_command(self):
+        response = self.client.ping()
+        self.assertTrue(response['ok'])
+        self.assertEqual(response['pid'], self.client.process.pid)
+
+        response = self.client.request('bogus')
+        self.assertFalse(response['ok'])
+        self.assertIn("Unknown command", response['error'])
+
+    def test_load_reports_the_schedule_and_caches_it(self):
+        path = self.write_macro("farm.json", 5, 0.5)
+
+        first = self.client.load(path)
+        self.assertEqual((first['ok'], first['actions'], first['duration'], first['cached']), (True, 5, 2.0, False))
+        self.assertTrue(self.client.load(path)['cached'])
+
+    def test_cache_evicts_the_least_recently_used_macro(self):
+        paths = [self.write_macro(f"m{index}.json", 2, 0.1) for index in range(CACHE_SIZE + 1)]
+        for path in paths[:CACHE_SIZE]:
+            self.client.load(path)
+        # Touch the oldest, so the second oldest is the one evicted
+        self.assertTrue(self.client.load(paths[0])['cached'])
+        self.client.load(paths[CACHE_SIZE])
+
+        self.assertTrue(self.client.load(paths[0])['cached'])
+        self.assertFalse(self.client.load(paths[1])['cached'])
+
+    def test_run_streams_progress_and_returns_the_result(self):
+        path = self.write_macro("farm.json", 5, 0.01)
+        events = []
+
+        response = self.client.run(path, timeout=10, on_progress=events.append, repeat=2)
+        self.assertTrue(response['ok'], response)
+        result = response['result']
+        self.assertTrue(result['completed'])
+        self.assertEqual(result['iterations'], 2)
+        self.assertEqual(result['actions_total'], 5)
+        progress = [event for event in events if event['event'] == 'progress']
+        self.assertEqual((progress[-1]['fired'], progress[-1]['iteration']), (5, 2))
+        self.assertEqual([event['iteration'] for event in events if event['event'] == 'iteration'], [1, 2])
+
+    def test_stop_ends_a_run_and_a_second_run_is_busy(self):
+        path = self.write_macro("long.json", 100, 0.1)
+        playing = threading.Event()
+        responses = []
+        runner = threading.Thread(target=lambda: responses.append(
+            self.client.run(path, timeout=30, on_progress=lambda event: playing.set())
+        ))
+        started = time.monotonic()
+        runner.start()
+        self.assertTrue(playing.wait(10))
+
+        self.assertEqual(self.client.run(path, timeout=5)['error'], 'busy')
+        stop = self.client.stop()
+        self.assertTrue(stop['ok'])
+        self.assertTrue(stop['running'])
+        runner.join(10)
+
+        result = responses[0]['result']
+        self.assertFalse(result['completed'])
+        self.assertLess(result['actions_fired'], 100)
+        self.assertLess(time.monotonic() - started, 9)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,152 @@
+import os
+import sys
+import hashlib
+import tempfile
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from script_updater import ScriptUpdater
+
+SCRIPT = b"; ASTDX Macro Runner\r\nMsgBox, 0, Test, Hello\r\n"
+ETAG = '"v1"'
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    """Serves the server's current script, honouring If-None-Match, or fails as the server's mode says"""
+
+    def do_GET(self):
+        server = self.server
+        server.requests.append(dict(self.headers))
+        if server.mode == 'truncate':
+            # Promise the whole file, send half of it and hang up
+            self.send_response(200)
+            self.send_header("Content-Length", str(len(server.content)))
+            self.end_headers()
+            self.wfile.write(server.content[:len(server.content) // 2])
+            self.wfile.flush()
+            self.close_connection = True
+            return
+        if self.headers.get('If-None-Match') == server.etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("ETag", server.etag)
+        self.send_header("Content-Length", str(len(server.content)))
+        self.end_headers()
+        self.wfile.write(server.content)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class ScriptUpdaterTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), StandInHandler)
+        self.server.mode = 'normal'
+        self.server.content = SCRIPT
+        self.server.etag = ETAG
+        self.server.requests = []
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}/astdx_macro_runner.ahk"
+
+        self.directory = tempfile.TemporaryDirectory()
+        self.local_path = os.path.join(self.directory.name, "astdx_macro_runner.ahk")
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.directory.cleanup()
+
+    def updater(self, **kwargs):
+        return ScriptUpdater(self.url, self.local_path, **kwargs)
+
+    def read_local(self):
+        with open(self.local_path, 'rb') as f:
+            return f.read()
+
+    def test_downloads_and_records_validators(self):
+        success, message = self.updater().update()
+        self.assertTrue(success, message)
+        self.assertEqual(self.read_local(), SCRIPT)
+        meta = self.updater()._load_meta()
+        self.assertEqual(meta['etag'], ETAG)
+        self.assertEqual(meta['sha256'], hashlib.sha256(SCRIPT).hexdigest())
+
+    def test_not_modified_keeps_the_file(self):
+        self.updater().update()
+        mtime = os.stat(self.local_path).st_mtime_ns
+
+        success, message = self.updater().update()
+        self.assertTrue(success)
+        self.assertEqual(message, "Already up to date")
+        self.assertEqual(self.server.requests[-1].get('If-None-Match'), ETAG)
+        self.assertEqual(os.stat(self.local_path).st_mtime_ns, mtime)
+
+    def test_changed_script_replaces_the_copy(self):
+        self.updater().update()
+        self.server.content = SCRIPT + b"; v2\r\n"
+        self.server.etag = '"v2"'
+
+        success, message = self.updater().update()
+        self.assertTrue(success, message)
+        self.assertEqual(self.read_local(), SCRIPT + b"; v2\r\n")
+
+    def test_bad_checksum_is_rejected(self):
+        success, message = self.updater(expected_sha256="0" * 64).update()
+        self.assertFalse(success)
+        self.assertIn("checksum mismatch", message)
+        self.assertFalse(os.path.exists(self.local_path))
+
+    def test_bad_checksum_keeps_the_cached_copy(self):
+        self.updater().update()
+        self.server.content = b"; tampered\r\n"
+        self.server.etag = '"v2"'
+
+        success, message = self.updater(expected_sha256=hashlib.sha256(SCRIPT).hexdigest()).update()
+        self.assertTrue(success)
+        self.assertIn("Kept cached copy", message)
+        self.assertEqual(self.read_local(), SCRIPT)
+
+    def test_failed_download_leaves_the_old_script(self):
+        self.updater().update()
+        self.server.mode = 'truncate'
+        self.server.content = SCRIPT * 1000
+
+        success, message = self.updater().update(force=True)
+        self.assertTrue(success)
+        self.assertIn("update check failed", message)
+        self.assertEqual(self.read_local(), SCRIPT)
+        self.assertFalse(os.path.exists(self.local_path + ".tmp"))
+
+    def test_failed_first_download_reports_failure(self):
+        self.server.mode = 'truncate'
+        success, message = self.updater().update()
+        self.assertFalse(success)
+        self.assertFalse(os.path.exists(self.local_path))
+
+    def test_ensure_uses_a_valid_copy_without_a_request(self):
+        self.updater().update()
+        count = len(self.server.requests)
+
+        success, message = self.updater().ensure()
+        self.assertTrue(success)
+        self.assertEqual(len(self.server.requests), count)
+
+    def test_ensure_refetches_a_corrupted_copy(self):
+        self.updater().update()
+        with open(self.local_path, 'wb') as f:
+            f.write(b"corrupted")
+
+        success, message = self.updater().ensure()
+        self.assertTrue(success, message)
+        self.assertEqual(self.read_local(), SCRIPT)
+
+
+if __name__ == "__main__":
+    unittest.main()
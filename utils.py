@@ -1,9 +1,25 @@
 import os
 import json
-import requests
 import subprocess
 import shutil
+import re
+import time
+import queue
+import atexit
+import threading
+from contextlib import contextmanager
 from datetime import datetime
+from macro_format import BinaryMacroFormat, BINARY_EXTENSION
+from script_updater import ScriptUpdater
+from backup_store import BackupStore
+
+_JSON_WHITESPACE = re.compile(r'[ \t\n\r]*')
+
+# How much of a JSON macro read_macro_header looks at for the fields ahead of the actions
+JSON_HEADER_LIMIT = 64 * 1024
+
+# Backups made without an explicit store share this one, so its lock covers all of them
+_default_backup_store = None
 
 class MacroUtils:
     """Utility functions for macro operations"""
@@ -16,10 +32,9 @@ class MacroUtils:
     
     @staticmethod
     def validate_macro_file(filepath):
-        """Validate a macro JSON file"""
+        """Validate a macro file in either the JSON or binary format"""
         try:
-            with open(filepath, 'r') as f:
-                data = json.load(f)
+            data = MacroUtils.load_macro_data(filepath)
             
             # Check required fields
             if 'actions' not in data:
@@ -28,6 +43,9 @@ class MacroUtils:
             if not isinstance(data['actions'], list):
                 return False, "'actions' must be a list"
             
+            if 'actions_count' in data and data['actions_count'] != len(data['actions']):
+                return False, f"'actions_count' is {data['actions_count']} but there are {len(data['actions'])} actions"
+            
             # Validate each action
             for i, action in enumerate(data['actions']):
                 if not isinstance(action, dict):
@@ -52,6 +70,16 @@ class MacroUtils:
                 elif action_type == 'wait':
                     if 'duration' not in action:
                         return False, f"Wait action {i} missing duration field"
+                elif action_type == 'move':
+                    if 'x' not in action or 'y' not in action:
+                        return False, f"Move action {i} missing coordinates"
+                elif action_type == 'drag':
+                    if 'x' not in action or 'y' not in action:
+                        return False, f"Drag action {i} missing coordinates"
+                    if 'button' not in action:
+                        return False, f"Drag action {i} missing button field"
+                    if action.get('state') not in ('down', 'move', 'up'):
+                        return False, f"Drag action {i} has invalid state field"
             
             return True, "Valid macro file"
             
@@ -60,30 +88,142 @@ class MacroUtils:
         except Exception as e:
             return False, f"Error validating file: {str(e)}"
     
+    @staticmethod
+    def load_macro_data(filepath, lazy=False):
+        """Load a macro file including its full actions list.
+        
+        With lazy, binary macros keep their actions as a ColumnarActions sequence (see
+        BinaryMacroFormat.load); JSON macros always load as a list.
+        """
+        if BinaryMacroFormat.is_binary_macro(filepath):
+            return BinaryMacroFormat.load(filepath, lazy)
+        
+        with open(filepath, 'r') as f:
+            return json.load(f)
+    
+    @staticmethod
+    def save_macro_data(filepath, data):
+        """Rewrite a macro file in its own format through a temp file, so a crash mid-write
+        leaves the old file in place"""
+        temp_path = filepath + ".tmp"
+        try:
+            if BinaryMacroFormat.is_binary_macro(filepath):
+                BinaryMacroFormat.save(temp_path, data)
+            else:
+                with open(temp_path, 'w') as f:
+                    json.dump(MacroUtils.with_summary(data), f, indent=2)
+            os.replace(temp_path, filepath)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+    
+    @staticmethod
+    def read_macro_header(filepath):
+        """Read the metadata of a macro file without materializing its actions"""
+        if BinaryMacroFormat.is_binary_macro(filepath):
+            header, actions_count = BinaryMacroFormat.read_header(filepath)
+        else:
+            with open(filepath, 'r') as f:
+                scanned = MacroUtils._scan_json_header(f.read(JSON_HEADER_LIMIT))
+                if scanned is None:
+                    # Older files keep no counts ahead of their actions, so parse them in full
+                    f.seek(0)
+                    data = json.load(f)
+                    scanned = ({key: value for key, value in data.items() if key != 'actions'},
+                               len(data.get('actions', [])))
+            header, actions_count = scanned
+        
+        default_name = os.path.splitext(os.path.basename(filepath))[0]
+        return {
+            'name': header.get('name', default_name),
+            'created': header.get('created', 'Unknown'),
+            'actions_count': actions_count,
+            'total_duration': header.get('total_duration', 0)
+        }
+    
+    @staticmethod
+    def _scan_json_header(text):
+        """Decode the top-level fields ahead of 'actions' from the start of a macro file.
+        
+        Returns (header, actions_count) when the file stores actions_count and total_duration
+        before its actions, and None when the actions have to be parsed to get them.
+        """
+        decoder = json.JSONDecoder()
+        header = {}
+        
+        idx = _JSON_WHITESPACE.match(text, 0).end()
+        if text[idx:idx + 1] != '{':
+            raise ValueError("Macro file is not a JSON object")
+        idx = _JSON_WHITESPACE.match(text, idx + 1).end()
+        
+        try:
+            while text[idx:idx + 1] != '}':
+                key, idx = decoder.raw_decode(text, idx)
+                idx = _JSON_WHITESPACE.match(text, idx).end()
+                if text[idx:idx + 1] != ':':
+                    return None
+                idx = _JSON_WHITESPACE.match(text, idx + 1).end()
+                
+                if key == 'actions':
+                    break
+                header[key], idx = decoder.raw_decode(text, idx)
+                
+                idx = _JSON_WHITESPACE.match(text, idx).end()
+                if text[idx:idx + 1] != ',':
+                    # Either the end of the object or a value cut off by the read limit
+                    return None
+                idx = _JSON_WHITESPACE.match(text, idx + 1).end()
+        except ValueError:
+            return None
+        
+        actions_count = header.get('actions_count')
+        if type(actions_count) is not int or 'total_duration' not in header:
+            return None
+        return header, actions_count
+    
+    @staticmethod
+    def with_summary(data):
+        """Copy of a macro dict laid out for saving as JSON: actions_count and total_duration
+        go ahead of the actions, so read_macro_header can stop before reaching them"""
+        actions = data.get('actions', [])
+        total_duration = data.get('total_duration')
+        if total_duration is None:
+            total_duration = max((action.get('timestamp', 0) for action in actions if isinstance(action, dict)),
+                                 default=0)
+        
+        summary = {key: value for key, value in data.items()
+                   if key not in ('actions', 'actions_count', 'total_duration')}
+        summary['actions_count'] = len(actions)
+        summary['total_duration'] = total_duration
+        summary['actions'] = actions
+        return summary
+    
     @staticmethod
     def get_macro_info(filepath):
         """Get information about a macro file"""
         try:
-            with open(filepath, 'r') as f:
-                data = json.load(f)
-            
-            info = {
-                'name': data.get('name', 'Unknown'),
-                'created': data.get('created', 'Unknown'),
-                'actions_count': len(data.get('actions', [])),
-                'total_duration': data.get('total_duration', 0),
-                'file_size': os.path.getsize(filepath)
-            }
-            
+            info = MacroUtils.read_macro_header(filepath)
+            info['file_size'] = os.path.getsize(filepath)
             return info
             
         except Exception as e:
             return None
     
     @staticmethod
-    def find_autohotkey_executable():
-        """Find AutoHotkey executable on the system"""
-        ahk_paths = [
+    def find_autohotkey_executable(search_paths=None, cache_file=None):
+        """Find AutoHotkey executable on the system, reusing a cached result while the file is unchanged"""
+        if cache_file:
+            try:
+                with open(cache_file, 'r', encoding='utf-8') as f:
+                    cached = json.load(f)
+                stat = os.stat(cached['path'])
+                if os.path.isfile(cached['path']) and [stat.st_mtime_ns, stat.st_size] == [cached['mtime'], cached['size']]:
+                    return cached['path']
+            except (OSError, ValueError, KeyError, TypeError):
+                pass
+        
+        ahk_paths = search_paths or [
             r"C:\Program Files\AutoHotkey\AutoHotkey.exe",
             r"C:\Program Files (x86)\AutoHotkey\AutoHotkey.exe",
             r"C:\AutoHotkey\AutoHotkey.exe",
@@ -91,33 +231,36 @@ class MacroUtils:
             "ahk.exe"
         ]
         
+        found = None
         for path in ahk_paths:
             if os.path.exists(path):
-                return path
+                found = os.path.abspath(path)
+                break
             else:
                 # Try to find it using shutil.which
                 try:
                     found_path = shutil.which(path)
                     if found_path:
-                        return found_path
+                        found = found_path
+                        break
                 except:
                     continue
-        return None
+        
+        if found and cache_file:
+            try:
+                stat = os.stat(found)
+                with open(cache_file, 'w', encoding='utf-8') as f:
+                    json.dump({'path': found, 'mtime': stat.st_mtime_ns, 'size': stat.st_size}, f)
+            except OSError:
+                pass
+        return found
     
     @staticmethod
-    def download_file_from_url(url, local_path, timeout=30):
-        """Download a file from URL to local path"""
+    def download_file_from_url(url, local_path, timeout=30, expected_sha256=None):
+        """Download a file from URL to local path, skipping the write when it is unchanged"""
         try:
-            response = requests.get(url, timeout=timeout)
-            response.raise_for_status()
-            
-            with open(local_path, 'w', encoding='utf-8') as f:
-                f.write(response.text)
-            
-            return True, "File downloaded successfully"
-            
-        except requests.RequestException as e:
-            return False, f"Request error: {str(e)}"
+            updater = ScriptUpdater(url, local_path, expected_sha256=expected_sha256, timeout=timeout)
+            return updater.update()
         except Exception as e:
             return False, f"Error downloading file: {str(e)}"
     
@@ -163,21 +306,16 @@ class MacroUtils:
         return filename
     
     @staticmethod
-    def backup_macro(macro_path):
-        """Create a backup of a macro file"""
+    def backup_macro(macro_path, store=None):
+        """Back up a macro into the deduplicated backup store; returns (success, "<file>@<hash prefix>")"""
+        global _default_backup_store
         try:
-            backup_dir = "macros/backups"
-            if not os.path.exists(backup_dir):
-                os.makedirs(backup_dir)
-            
-            filename = os.path.basename(macro_path)
-            name, ext = os.path.splitext(filename)
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            backup_filename = f"{name}_backup_{timestamp}{ext}"
-            backup_path = os.path.join(backup_dir, backup_filename)
-            
-            shutil.copy2(macro_path, backup_path)
-            return True, backup_path
+            if store is None:
+                if _default_backup_store is None:
+                    _default_backup_store = BackupStore()
+                store = _default_backup_store
+            entry, _ = store.backup(macro_path)
+            return True, f"{os.path.basename(macro_path)}@{entry['hash'][:12]}"
             
         except Exception as e:
             return False, f"Error creating backup: {str(e)}"
@@ -194,31 +332,335 @@ class MacroUtils:
         
         return info
 
+class MacroHandle:
+    """Lazy handle to a macro that keeps only its metadata resident"""
+    
+    def __init__(self, filepath, header=None):
+        self.filepath = filepath
+        self.header = header if header is not None else MacroUtils.read_macro_header(filepath)
+        self._actions = None
+    
+    @property
+    def name(self):
+        return self.header.get('name')
+    
+    @property
+    def is_loaded(self):
+        return self._actions is not None
+    
+    @property
+    def actions(self):
+        """Actions of the macro, read from disk on first access"""
+        if self._actions is None:
+            self._actions = MacroUtils.load_macro_data(self.filepath).get('actions', [])
+        return self._actions
+    
+    def release(self):
+        """Drop the loaded actions so only the metadata stays in memory"""
+        self._actions = None
+    
+    @contextmanager
+    def materialized(self):
+        """Load the actions for the duration of a with-block"""
+        try:
+            yield self.actions
+        finally:
+            self.release()
+    
+    def validate(self):
+        """Validate the macro file without keeping its actions loaded"""
+        self.release()
+        return MacroUtils.validate_macro_file(self.filepath)
+
+class MacroIndex:
+    """Persistent index of macro metadata keyed by file path, mtime and size"""
+    
+    INDEX_VERSION = 1
+    MACRO_EXTENSIONS = ('.json', BINARY_EXTENSION)
+    
+    def __init__(self, macros_dir="macros", index_file=None):
+        self.macros_dir = macros_dir
+        self.index_file = index_file or os.path.join(macros_dir, ".macro_index.json")
+        self.entries = {}
+        self.load()
+    
+    def load(self):
+        """Load the index from disk, starting empty if it is missing or stale"""
+        self.entries = {}
+        try:
+            with open(self.index_file, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if data.get('version') == self.INDEX_VERSION:
+                self.entries = data.get('entries', {})
+        except (OSError, ValueError):
+            pass
+    
+    def save(self):
+        """Write the index to disk atomically"""
+        data = {'version': self.INDEX_VERSION, 'entries': self.entries}
+        temp_path = self.index_file + ".tmp"
+        try:
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump(data, f)
+            os.replace(temp_path, self.index_file)
+        except OSError as e:
+            print(f"Failed to write macro index: {e}")
+    
+    def refresh(self):
+        """Re-parse only the macro files that were added or changed since the last refresh"""
+        added, changed, removed = [], [], []
+        seen = set()
+        
+        for filename in os.listdir(self.macros_dir):
+            if filename.startswith('.') or not filename.endswith(self.MACRO_EXTENSIONS):
+                continue
+            
+            filepath = os.path.join(self.macros_dir, filename)
+            try:
+                stat = os.stat(filepath)
+            except OSError:
+                continue
+            
+            seen.add(filename)
+            entry = self.entries.get(filename)
+            if entry and entry['mtime'] == stat.st_mtime_ns and entry['size'] == stat.st_size:
+                continue
+            
+            self.entries[filename] = self._parse_entry(filepath, stat)
+            (changed if entry else added).append(filename)
+        
+        for filename in list(self.entries):
+            if filename not in seen:
+                del self.entries[filename]
+                removed.append(filename)
+        
+        if added or changed or removed:
+            self.save()
+        
+        return added, changed, removed
+    
+    def update(self, filenames):
+        """Re-check only the named files, e.g. from watcher events; returns (added, changed, removed)"""
+        added, changed, removed = [], [], []
+        
+        for filename in filenames:
+            filepath = os.path.join(self.macros_dir, filename)
+            entry = self.entries.get(filename)
+            try:
+                stat = os.stat(filepath)
+            except OSError:
+                if entry is not None:
+                    del self.entries[filename]
+                    removed.append(filename)
+                continue
+            
+            if entry and entry['mtime'] == stat.st_mtime_ns and entry['size'] == stat.st_size:
+                continue
+            
+            self.entries[filename] = self._parse_entry(filepath, stat)
+            (changed if entry else added).append(filename)
+        
+        if added or changed or removed:
+            self.save()
+        
+        return added, changed, removed
+    
+    def _parse_entry(self, filepath, stat):
+        """Build an index entry for a single macro file"""
+        entry = {'mtime': stat.st_mtime_ns, 'size': stat.st_size}
+        try:
+            entry.update(MacroUtils.read_macro_header(filepath))
+        except Exception as e:
+            # Remember the failure so an unchanged broken file is not re-parsed
+            entry['error'] = str(e)
+        return entry
+
 class LogManager:
-    """Simple logging manager for macro operations"""
+    """Simple logging manager for macro operations.
     
-    def __init__(self, log_file="macro_operations.log"):
+    By default every message is appended to the log file synchronously. With async_mode=True,
+    log() only queues the record: a background thread writes records in batches as JSONL
+    ({"mono": ..., "time": ..., "level": ..., "message": ..., plus any keyword fields}),
+    rotates the file by size and flushes everything on close() or interpreter exit.
+    """
+    
+    def __init__(self, log_file="macro_operations.log", async_mode=False, structured=None,
+                 max_queue=10000, max_bytes=5 * 1024 * 1024, backup_count=3, flush_interval=0.5, batch_size=500):
+        # structured defaults to on in async mode; a full queue drops records rather than block the caller
         self.log_file = log_file
+        self.async_mode = async_mode
+        self.structured = async_mode if structured is None else structured
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.dropped = 0
+        self._queue = None
+        self._writer = None
+        self._closed = False
+        if async_mode:
+            self._queue = queue.Queue(maxsize=max_queue)
+            self._writer = threading.Thread(target=self._write_loop, name="LogManager writer", daemon=True)
+            self._writer.start()
+            atexit.register(self.close)
     
-    def log(self, message, level="INFO"):
+    def log(self, message, level="INFO", **fields):
         """Log a message with timestamp"""
-        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        log_entry = f"[{timestamp}] {level}: {message}\n"
+        record = (time.monotonic(), time.time(), level, message, fields)
+        log_queue = self._queue
+        if log_queue is not None and not self._closed:
+            # Hot path: no formatting or I/O here, only a tuple onto the queue
+            try:
+                log_queue.put_nowait(record)
+            except queue.Full:
+                # Counted under the queue's own lock, which the writer takes to collect the count
+                with log_queue.mutex:
+                    self.dropped += 1
+                return
+            # close() raised the flag before queuing the sentinel, so a record that raced in behind it is
+            # seen here; once the writer has exited nobody else will pick it up
+            if self._closed and not self._writer.is_alive():
+                self._drain_late(log_queue)
+            return
         
+        self._write_records([record])
+    
+    def _write_records(self, records):
+        """Append records synchronously, outside the writer thread"""
         try:
             with open(self.log_file, 'a', encoding='utf-8') as f:
-                f.write(log_entry)
+                f.write("".join(self._format(record) for record in records))
         except Exception as e:
             print(f"Failed to write to log file: {e}")
     
-    def info(self, message):
-        self.log(message, "INFO")
+    def _drain_late(self, log_queue):
+        """Write records left behind the close sentinel, plus any drop count the writer never collected"""
+        records = []
+        while True:
+            try:
+                item = log_queue.get_nowait()
+            except queue.Empty:
+                break
+            if isinstance(item, threading.Event):
+                item.set()
+            elif item is not None:
+                records.append(item)
+        with log_queue.mutex:
+            dropped, self.dropped = self.dropped, 0
+        if dropped:
+            records.append((time.monotonic(), time.time(), "WARNING", "Log queue full, records dropped", {'dropped': dropped}))
+        if records:
+            self._write_records(records)
+    
+    def _format(self, record):
+        mono, wall, level, message, fields = record
+        if self.structured:
+            entry = {'mono': round(mono, 6), 'time': round(wall, 6), 'level': level, 'message': message}
+            entry.update(fields)
+            return json.dumps(entry, default=str) + "\n"
+        timestamp = datetime.fromtimestamp(wall).strftime("%Y-%m-%d %H:%M:%S")
+        extra = "".join(f" {key}={value}" for key, value in fields.items())
+        return f"[{timestamp}] {level}: {message}{extra}\n"
+    
+    def _write_loop(self):
+        """Writer thread: drain the queue in batches, flushing each batch and rotating by size"""
+        log_file = None
+        running = True
+        while running:
+            try:
+                items = [self._queue.get(timeout=self.flush_interval)]
+            except queue.Empty:
+                continue
+            while len(items) < self.batch_size:
+                try:
+                    items.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            
+            lines = []
+            waiters = []
+            for item in items:
+                if item is None:
+                    running = False
+                elif isinstance(item, threading.Event):
+                    waiters.append(item)
+                else:
+                    lines.append(self._format(item))
+            with self._queue.mutex:
+                dropped, self.dropped = self.dropped, 0
+            if dropped:
+                lines.append(self._format(
+                    (time.monotonic(), time.time(), "WARNING", "Log queue full, records dropped", {'dropped': dropped})
+                ))
+            
+            if lines:
+                try:
+                    if log_file is None:
+                        log_file = open(self.log_file, 'a', encoding='utf-8')
+                    log_file.write("".join(lines))
+                    log_file.flush()
+                    if self.max_bytes and log_file.tell() >= self.max_bytes:
+                        log_file.close()
+                        log_file = None
+                        self._rotate()
+                except Exception as e:
+                    print(f"Failed to write to log file: {e}")
+                    log_file = None
+            for waiter in waiters:
+                waiter.set()
+        
+        if log_file is not None:
+            log_file.close()
+    
+    def _rotate(self):
+        """Shift log -> log.1 -> log.2 ..., dropping the oldest beyond backup_count"""
+        if self.backup_count <= 0:
+            os.remove(self.log_file)
+            return
+        for index in range(self.backup_count - 1, 0, -1):
+            source = f"{self.log_file}.{index}"
+            if os.path.exists(source):
+                os.replace(source, f"{self.log_file}.{index + 1}")
+        os.replace(self.log_file, f"{self.log_file}.1")
+    
+    def flush(self, timeout=5):
+        """Wait until every record queued so far is written"""
+        log_queue = self._queue
+        if log_queue is None or self._closed:
+            return True
+        done = threading.Event()
+        log_queue.put(done)
+        return done.wait(timeout)
+    
+    def close(self, timeout=5):
+        """Flush the queue and stop the writer thread; later records are written synchronously"""
+        log_queue = self._queue
+        if log_queue is None:
+            return
+        # The flag goes up under the queue lock before the sentinel is queued, so log() either
+        # enqueues ahead of the sentinel or sees the flag once its record is in
+        with log_queue.mutex:
+            if self._closed:
+                return
+            self._closed = True
+        try:
+            log_queue.put(None, timeout=timeout)
+        except queue.Full:
+            pass
+        self._writer.join(timeout)
+        if not self._writer.is_alive():
+            self._drain_late(log_queue)
+        self._queue = None
+        atexit.unregister(self.close)
+    
+    def info(self, message, **fields):
+        self.log(message, "INFO", **fields)
     
-    def warning(self, message):
-        self.log(message, "WARNING")
+    def warning(self, message, **fields):
+        self.log(message, "WARNING", **fields)
     
-    def error(self, message):
-        self.log(message, "ERROR")
+    def error(self, message, **fields):
+        self.log(message, "ERROR", **fields)
     
-    def debug(self, message):
-        self.log(message, "DEBUG")
+    def debug(self, message, **fields):
+        self.log(message, "DEBUG", **fields)